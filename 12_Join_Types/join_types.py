@@ -1,9 +1,10 @@
+import sqlite3
 from typing import Optional
-from sqlalchemy import ForeignKey, create_engine
+from sqlalchemy import ForeignKey, create_engine, exists, inspect, null, select, type_coerce, union_all
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship, sessionmaker
 
 engine = create_engine("sqlite:///12_Join_Types/data12.db")
-session = sessionmaker(bind = engine)()
+Session = sessionmaker(bind = engine)
 
 class Base(DeclarativeBase):
     id: Mapped[int] = mapped_column(primary_key= True)
@@ -11,7 +12,8 @@ class Base(DeclarativeBase):
 class Address(Base):
     __tablename__ = "addresses"
 
-    user_id: Mapped[Optional[int]] = mapped_column(ForeignKey("users.id"))
+    # join 與 NOT EXISTS 都以 user_id 查找地址
+    user_id: Mapped[Optional[int]] = mapped_column(ForeignKey("users.id"), index = True)
     data: Mapped[str]
 
     def __repr__(self) -> str:
@@ -26,64 +28,157 @@ class User(Base):
 
     def __repr__(self) -> str:
         return f"<User: {self.first_name} {self.last_name}>"
-    
-Base.metadata.create_all(engine)
-
-# #This address IS used
-# address_1 = Address(data = "1234 Random Address")
-
-# #These addresses are NOT used
-# address_2 = Address(data = "5678 Non-existant Address")
-# address_3 = Address(data = "9895 Extra Address")
-
-# # User with an address
-# user_1 = User(
-#     first_name = "Zeq",
-#     last_name = "Tech",
-#     address = address_1,
-# )
-# user_2 = User(
-#     first_name = "Banana",
-#     last_name = "Kan",
-#     address = None
-# )
-
-# session.add_all([address_1, address_2, address_3, user_1, user_2])
-# session.commit()
-
-# INNER JOIN
-# result = session.query(User).join(Address).all()
-# print(result)
-# result = session.query(User, Address).join(Address, User.id == Address.user_id).all()
-# print(result)
-
-# ANTI JOIN
-# result = (
-#     session.query(User, Address)
-#     .join(Address, full = True)
-#     .filter(User.address == None, Address.user_id == None)
-#     .all()
-# )
-# print(result)
-
-# Left Join || Right Join
-# Return all users reguardless if they have addresses or not
-result = session.query(User).outerjoin(Address).all()
-print(result)
-result = session.query(User).join(Address, isouter= True).all()
-print(result)
-
-# Left Outer Join || Right Outer Join
-result = session.query(User).outerjoin(Address).filter(User.address == None).all()
-print(result)
-
-# Full Outer Join
-left_join = session.query(User, Address).outerjoin(Address)
-right_join = session.query(User, Address).outerjoin(User)
-full_outer_join = left_join.union(right_join)
-print(full_outer_join.all())
-
-# This will return all rows, reguardless if there is a user associated with the Addresss
-# or reguardless if there is an address associated with a user
-result = session.query(User, Address).join(Address, isouter = True, full = True).all()
-print(result)
+
+
+# SQLite 3.39 之後才支援 FULL OUTER JOIN / RIGHT JOIN
+# 不支援時以 LEFT JOIN UNION ALL (右表中沒有對應資料的列) 改寫:
+# 兩邊不會有重複的資料，所以不需要 UNION 的去重與排序
+# anti join 一律使用 NOT EXISTS，SQLite 可以直接以索引確認是否存在對應資料，不需要先 join 再篩選 IS NULL
+FULL_JOIN_SQLITE_VERSION = (3, 39, 0)
+
+
+def supports_full_join(bind):
+    if bind.dialect.name != "sqlite":
+        return True
+    return sqlite3.sqlite_version_info >= FULL_JOIN_SQLITE_VERSION
+
+
+def _tables(left, right, onclause):
+    left_table = inspect(left).local_table
+    right_table = inspect(right).local_table
+    if onclause is None:
+        onclause = left_table.join(right_table).onclause
+    return left_table, right_table, onclause
+
+
+def _nulls(table):
+    # 沒有對應資料的一側以 NULL 補上，並保留欄位型別讓 ORM 可以正確處理
+    return [type_coerce(null(), column.type).label(column.name) for column in table.columns]
+
+
+def _missing(onclause, outer):
+    # NOT EXISTS (SELECT * FROM 另一側 WHERE onclause)，只與 outer 相關聯
+    return ~exists().where(onclause).correlate(outer)
+
+
+def full_outer_join(bind, left, right, onclause = None, native = None):
+    # 回傳 select(left, right)，例如 session.execute(full_outer_join(session.get_bind(), User, Address)).all()
+    # 沒有對應資料的一側為 None；native 為 None 時依 SQLite 版本自動選擇
+    left_table, right_table, onclause = _tables(left, right, onclause)
+    if native is None:
+        native = supports_full_join(bind)
+    if native:
+        return select(left, right).join(right, onclause, full = True)
+    left_join = select(left_table, right_table).select_from(left_table.outerjoin(right_table, onclause))
+    right_only = select(*_nulls(left_table), right_table).where(_missing(onclause, right_table))
+    return select(left, right).from_statement(union_all(left_join, right_only))
+
+
+def left_anti_join(left, right, onclause = None):
+    # left 中沒有任何對應 right 的資料，例如沒有地址的使用者
+    left_table, _, onclause = _tables(left, right, onclause)
+    return select(left).where(_missing(onclause, left_table))
+
+
+def right_anti_join(left, right, onclause = None):
+    # right 中沒有任何對應 left 的資料，例如沒有被使用的地址
+    _, right_table, onclause = _tables(left, right, onclause)
+    return select(right).where(_missing(onclause, right_table))
+
+
+def full_anti_join(left, right, onclause = None):
+    # 兩邊都沒有對應資料的列，等同 FULL OUTER JOIN 之後篩選兩邊的主鍵皆為 NULL
+    left_table, right_table, onclause = _tables(left, right, onclause)
+    # 第一段需要是實際的欄位，ORM 才能對應 union 結果中的欄位；NOT EXISTS 已確保 outer join 的右側都是 NULL
+    left_only = (
+        select(left_table, right_table)
+        .select_from(left_table.outerjoin(right_table, onclause))
+        .where(_missing(onclause, left_table))
+    )
+    right_only = select(*_nulls(left_table), right_table).where(_missing(onclause, right_table))
+    return select(left, right).from_statement(union_all(left_only, right_only))
+
+
+def create_schema(bind):
+    # create_all 會略過已經存在的表格，既有的 data12.db 上新宣告的索引 (例如 addresses.user_id) 要另外補上
+    Base.metadata.create_all(bind)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind, checkfirst = True)
+
+
+def main():
+    create_schema(engine)
+    session = Session()
+
+    # #This address IS used
+    # address_1 = Address(data = "1234 Random Address")
+
+    # #These addresses are NOT used
+    # address_2 = Address(data = "5678 Non-existant Address")
+    # address_3 = Address(data = "9895 Extra Address")
+
+    # # User with an address
+    # user_1 = User(
+    #     first_name = "Zeq",
+    #     last_name = "Tech",
+    #     address = address_1,
+    # )
+    # user_2 = User(
+    #     first_name = "Banana",
+    #     last_name = "Kan",
+    #     address = None
+    # )
+
+    # session.add_all([address_1, address_2, address_3, user_1, user_2])
+    # session.commit()
+
+    # INNER JOIN
+    # result = session.query(User).join(Address).all()
+    # print(result)
+    # result = session.query(User, Address).join(Address, User.id == Address.user_id).all()
+    # print(result)
+
+    # ANTI JOIN
+    # result = (
+    #     session.query(User, Address)
+    #     .join(Address, full = True)
+    #     .filter(User.address == None, Address.user_id == None)
+    #     .all()
+    # )
+    # print(result)
+    # 與上面相同，但以 NOT EXISTS 實作，不需要 FULL JOIN
+    result = session.execute(full_anti_join(User, Address)).all()
+    print(result)
+
+    # Left Join || Right Join
+    # Return all users reguardless if they have addresses or not
+    result = session.query(User).outerjoin(Address).all()
+    print(result)
+    result = session.query(User).join(Address, isouter= True).all()
+    print(result)
+
+    # Left Outer Join || Right Outer Join
+    result = session.query(User).outerjoin(Address).filter(User.address == None).all()
+    print(result)
+    # 與上面相同，改用 NOT EXISTS
+    result = session.scalars(left_anti_join(User, Address)).all()
+    print(result)
+
+    # Full Outer Join
+    # left_join = session.query(User, Address).outerjoin(Address)
+    # right_join = session.query(User, Address).outerjoin(User)
+    # full_outer_join = left_join.union(right_join)
+    # print(full_outer_join.all())
+    # 上面的 UNION 需要對兩邊的結果去重與排序，資料量大時很慢
+    # full_outer_join() 在 SQLite 支援時使用原生的 FULL JOIN，否則改寫成 LEFT JOIN UNION ALL NOT EXISTS
+
+    # This will return all rows, reguardless if there is a user associated with the Addresss
+    # or reguardless if there is an address associated with a user
+    # result = session.query(User, Address).join(Address, isouter = True, full = True).all()
+    result = session.execute(full_outer_join(engine, User, Address)).all()
+    print(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+from time import perf_counter
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from async_queries import count_by_sex, user_by_id
+from bulk_insert import bulk_insert
+from models import ensure_schema, make_async_engine, make_engine, User
+
+# 在同一個 event loop 上同時執行大量 coroutine，每個 coroutine 不斷以新的 session 執行查詢，計算每秒完成的請求數
+
+
+async def client(Session, deadline, n_users, counts):
+    while perf_counter() < deadline:
+        async with Session() as session:
+            if random.random() < 0.9:
+                await user_by_id(session, random.randint(1, n_users))
+            else:
+                await count_by_sex(session)
+        counts[0] += 1
+
+
+async def run(url, concurrency, seconds, n_users, profile):
+    engine = make_async_engine(profile, url = url)
+    engine.echo = False
+    Session = async_sessionmaker(bind = engine, expire_on_commit = False)
+    counts = [0]
+    deadline = perf_counter() + seconds
+    await asyncio.gather(*[client(Session, deadline, n_users, counts) for _ in range(concurrency)])
+    await engine.dispose()
+    return counts[0] / seconds
+
+
+def seed(path, n_users):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    engine = make_engine("prod-write-heavy", url = f"sqlite:///{path}")
+    ensure_schema(engine)
+    bulk_insert(engine, User, ((f"User{x}", 18 + x % 60, ("male", "female")[x % 2]) for x in range(n_users)))
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Requests/sec of the async query path under concurrent coroutines")
+    parser.add_argument("--concurrency", type = int, nargs = "+", default = [1, 10, 100, 200])
+    parser.add_argument("--seconds", type = float, default = 5.0)
+    parser.add_argument("--users", type = int, default = 100_000)
+    parser.add_argument("--profile", default = "prod-read-heavy")
+    parser.add_argument("--data-dir", default = tempfile.gettempdir())
+    args = parser.parse_args()
+
+    path = os.path.join(args.data_dir, "async_benchmark.db")
+    seed(path, args.users)
+    for concurrency in args.concurrency:
+        rate = asyncio.run(run(f"sqlite+aiosqlite:///{path}", concurrency, args.seconds, args.users, args.profile))
+        print(f"{concurrency:>4} coroutines {rate:>9,.0f} requests/s")
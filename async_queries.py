@@ -0,0 +1,86 @@
+from sqlalchemy import func, not_, or_, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import selectinload
+
+from models import User, UserStat, make_async_engine
+
+# app.py 與 join_types.py 中查詢方式的 async 版本，模型與同步版本共用
+# async 模式下不能在存取屬性時才 lazy load (會拋出 MissingGreenlet)，
+# 需要關聯資料時一律在查詢中明確指定 selectinload
+
+async_engine = make_async_engine()
+AsyncSession = async_sessionmaker(bind = async_engine, expire_on_commit = False)
+
+
+async def create_all(engine = async_engine, metadata = User.metadata):
+    async with engine.begin() as conn:
+        await conn.run_sync(metadata.create_all)
+
+
+async def all_users(session):
+    return (await session.scalars(select(User))).all()
+
+
+async def users_by_name(session, name):
+    return (await session.scalars(select(User).filter_by(name = name))).all()
+
+
+async def user_by_id(session, id):
+    return await session.get(User, id)
+
+
+async def users_ordered_by_age(session, descending = False):
+    return (await session.scalars(select(User).order_by(User.age.desc() if descending else User.age))).all()
+
+
+async def users_at_least(session, age):
+    return (await session.scalars(select(User).where(User.age >= age))).all()
+
+
+async def users_by_age_or_name(session, age, name):
+    return (await session.scalars(select(User).where(or_(User.age >= age, User.name == name)))).all()
+
+
+async def users_not_named(session, name):
+    return (await session.scalars(select(User).where(not_(User.name == name)))).all()
+
+
+# 統計直接從 trigger 維護的 user_stats 彙總，不需要掃描 users，詳見 user_reports.py
+async def count_by_sex(session):
+    stmt = select(UserStat.sex, func.sum(UserStat.count)).group_by(UserStat.sex)
+    return (await session.execute(stmt)).all()
+
+
+async def count_by_sex_between(session, low, high):
+    stmt = (
+        select(UserStat.sex, func.sum(UserStat.count))
+        .where(UserStat.age > low, UserStat.age < high)
+        .group_by(UserStat.sex)
+    )
+    return (await session.execute(stmt)).all()
+
+
+async def with_related(session, model, *relationships):
+    # 例如 await with_related(session, Merchant, Merchant.following)
+    stmt = select(model).options(*[selectinload(relationship) for relationship in relationships])
+    return (await session.scalars(stmt)).all()
+
+
+# 以下對應 join_types.py，parent / child 例如 User 與 Address
+async def inner_join(session, parent, child, onclause = None):
+    return (await session.execute(select(parent, child).join(child, onclause))).all()
+
+
+async def left_join(session, parent, child, onclause = None):
+    return (await session.execute(select(parent, child).outerjoin(child, onclause))).all()
+
+
+async def left_anti_join(session, relationship):
+    # 沒有任何對應資料的 parent，例如 await left_anti_join(session, User.address)
+    parent = relationship.class_
+    missing = ~relationship.any() if relationship.property.uselist else ~relationship.has()
+    return (await session.scalars(select(parent).where(missing))).all()
+
+
+async def full_outer_join(session, parent, child, onclause = None):
+    return (await session.execute(select(parent, child).join(child, onclause, full = True))).all()
@@ -0,0 +1,85 @@
+from collections import defaultdict
+
+from sqlalchemy import bindparam, delete, insert, select
+from sqlalchemy.orm.attributes import set_committed_value
+
+from bulk_insert import BATCH_SIZE, _batches
+
+# fan_1.following.append(fan_2) 在 flush 時每一條邊都是一次 INSERT，匯入數千萬條追蹤關係時太慢
+# 這裡直接以 Core 對關聯表分批 executemany，邊以 graph_traversal 中的 Edges (FAN_FOLLOWING 等) 描述，例如:
+#   add_edges(engine, FAN_FOLLOWING, [(follower_id, following_id), ...])
+#   remove_edges(engine, MERCHANT_FOLLOWING, [(merchant_id, following_id), ...])
+#   add_edges(engine, STUDENT_COURSES, [(student_id, course_id), ...])
+# 關聯表上有 (source, target) 的唯一索引，INSERT OR IGNORE 會略過已經存在或同一批中重複的邊
+#
+# 讀取時 fan.following 每個 fan 各發出一次查詢，load_related() 以 IN 查詢一次取回多個 fan 的關聯資料
+
+IN_CHUNK = 10_000
+
+
+def add_edges(engine, edges, pairs, batch_size = BATCH_SIZE):
+    # 回傳實際新增的邊數 (已存在的邊不計)
+    edge = edges.clause()
+    stmt = insert(edge).prefix_with("OR IGNORE")
+    count = 0
+    with engine.begin() as conn:
+        for batch in _batches(pairs, batch_size):
+            result = conn.execute(stmt, [{edges.source: source, edges.target: target} for source, target in batch])
+            count += result.rowcount
+    return count
+
+
+def remove_edges(engine, edges, pairs, batch_size = BATCH_SIZE):
+    edge = edges.clause()
+    stmt = delete(edge).where(
+        edge.c[edges.source] == bindparam("source"),
+        edge.c[edges.target] == bindparam("target"),
+    )
+    count = 0
+    with engine.begin() as conn:
+        for batch in _batches(pairs, batch_size):
+            result = conn.execute(stmt, [{"source": source, "target": target} for source, target in batch])
+            count += result.rowcount
+    return count
+
+
+def targets(bind, edges, ids, chunk_size = IN_CHUNK):
+    # 只需要 id 時使用: {source_id: [target_id, ...]}，沒有任何邊的 id 對應到空串列
+    edge = edges.clause()
+    ids = list(dict.fromkeys(ids))
+    found = {id: [] for id in ids}
+    for chunk in _batches(ids, chunk_size):
+        stmt = select(edge.c[edges.source], edge.c[edges.target]).where(edge.c[edges.source].in_(chunk))
+        for source, target in bind.execute(stmt):
+            found[source].append(target)
+    return found
+
+
+def load_related(session, relationship_attr, objects, chunk_size = IN_CHUNK):
+    # 一次載入多個物件在多對多關係上的資料，例如 load_related(session, Fan.following, fans)
+    # 載入後 fan.following 直接使用已載入的資料，不會再發出查詢
+    prop = relationship_attr.property
+    if prop.secondary is None:
+        raise ValueError(f"{relationship_attr} is not a many-to-many relationship")
+    (local, source), = prop.synchronize_pairs
+    target = prop.mapper.class_
+    key = prop.key
+    objects = list(objects)
+    by_id = defaultdict(list)
+    for obj in objects:
+        by_id[getattr(obj, local.key)].append(obj)
+
+    related = defaultdict(list)
+    for chunk in _batches(list(by_id), chunk_size):
+        stmt = (
+            select(source, target)
+            .select_from(target)
+            .join(prop.secondary, prop.secondaryjoin)
+            .where(source.in_(chunk))
+        )
+        for id, item in session.execute(stmt):
+            related[id].append(item)
+    for id, owners in by_id.items():
+        for obj in owners:
+            set_committed_value(obj, key, list(related[id]))
+    return related
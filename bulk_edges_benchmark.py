@@ -0,0 +1,93 @@
+import argparse
+import os
+import random
+import tempfile
+from time import perf_counter
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import sessionmaker
+
+from bulk_edges import add_edges, load_related, remove_edges
+from bulk_insert import bulk_insert
+from graph_traversal import FAN_FOLLOWING
+from many_to_many_relationship import Fan, FansAssociation
+from models import ensure_schema, make_engine
+
+# 1. 以 fan.following.append() + commit 與 add_edges() 寫入相同的追蹤關係 (含重複的邊)
+# 2. 逐一存取 fan.following 與 load_related() 一次載入
+# 3. remove_edges() 分批刪除
+
+
+def build(path, n_fans):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    engine = make_engine("prod-write-heavy", url = f"sqlite:///{path}")
+    ensure_schema(engine)
+    bulk_insert(engine, Fan, ((f"Fan{x}",) for x in range(n_fans)))
+    return engine
+
+
+def random_edges(n_fans, n_edges, seed):
+    rng = random.Random(seed)
+    return [(rng.randint(1, n_fans), rng.randint(1, n_fans)) for _ in range(n_edges)]
+
+
+def orm_append(Session, pairs):
+    session = Session()
+    fans = {fan.id: fan for fan in session.scalars(select(Fan))}
+    seen = set()
+    for follower, following in pairs:
+        # ORM 無法略過重複的邊，需要自行去除，否則會違反唯一索引
+        if (follower, following) not in seen:
+            seen.add((follower, following))
+            fans[follower].following.append(fans[following])
+    session.commit()
+    session.close()
+    return len(seen)
+
+
+def count_edges(engine):
+    with engine.connect() as conn:
+        return conn.scalar(select(func.count()).select_from(FansAssociation))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Compare ORM appends with batched association writes and loads")
+    parser.add_argument("--fans", type = int, default = 10_000)
+    parser.add_argument("--edges", type = int, default = 200_000)
+    parser.add_argument("--data-dir", default = tempfile.gettempdir())
+    args = parser.parse_args()
+
+    pairs = random_edges(args.fans, args.edges, seed = 1)
+    for label in ("orm append", "add_edges"):
+        engine = build(os.path.join(args.data_dir, f"bulk_edges_benchmark_{label.replace(' ', '_')}.db"), args.fans)
+        Session = sessionmaker(bind = engine)
+        start = perf_counter()
+        if label == "orm append":
+            orm_append(Session, pairs)
+        else:
+            add_edges(engine, FAN_FOLLOWING, pairs)
+        elapsed = perf_counter() - start
+        print(f"{label:<12} {len(pairs):,} edges ({count_edges(engine):,} unique) in {elapsed:.2f}s")
+
+    session = Session()
+    fans = session.scalars(select(Fan)).all()
+    start = perf_counter()
+    lazy = {fan.id: len(fan.following) for fan in fans}
+    lazy_time = perf_counter() - start
+    session.close()
+
+    session = Session()
+    fans = session.scalars(select(Fan)).all()
+    start = perf_counter()
+    load_related(session, Fan.following, fans)
+    batched = {fan.id: len(fan.following) for fan in fans}
+    batched_time = perf_counter() - start
+    session.close()
+    assert lazy == batched
+    print(f"fan.following for {len(fans):,} fans: lazy {lazy_time:.2f}s   load_related {batched_time:.2f}s")
+
+    start = perf_counter()
+    removed = remove_edges(engine, FAN_FOLLOWING, pairs[: len(pairs) // 2])
+    print(f"remove_edges {removed:,} edges in {perf_counter() - start:.2f}s, {count_edges(engine):,} left")
@@ -0,0 +1,93 @@
+from itertools import islice
+
+from sqlalchemy import Table, func, inspect, insert, select
+from sqlalchemy.orm import ONETOMANY
+
+# session.add_all() 會為每一筆資料建立 ORM 物件並經過完整的 unit of work flush
+# 這裡改用 Core 的 insert() 搭配 executemany，一次送出固定數量的資料，完全不建立 ORM 物件
+
+BATCH_SIZE = 10_000
+
+
+def _table(target):
+    # target 可以是 ORM 類別 (例如 User) 或 Table (例如 student_course_link)
+    if isinstance(target, Table):
+        return target
+    return inspect(target).local_table
+
+
+def _default_columns(table):
+    # tuple 資料預設依照表格欄位的順序對應，自動遞增的主鍵不需要提供
+    return [column.key for column in table.columns if not column.primary_key]
+
+
+def _as_dicts(rows, columns):
+    for row in rows:
+        yield row if isinstance(row, dict) else dict(zip(columns, row))
+
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def bulk_insert(engine, target, rows, columns = None, batch_size = BATCH_SIZE):
+    # 例如 bulk_insert(engine, User, [("John Doe", 30, "male"), ...])
+    # 或 bulk_insert(engine, StudentCourse, [(student_id, course_id), ...])
+    table = _table(target)
+    columns = columns or _default_columns(table)
+    count = 0
+    with engine.begin() as conn:
+        for batch in _batches(_as_dicts(rows, columns), batch_size):
+            conn.execute(insert(table), batch)
+            count += len(batch)
+    return count
+
+
+def bulk_insert_tree(engine, relationship_attr, parents, parent_columns = None, child_columns = None,
+                     batch_size = BATCH_SIZE):
+    # 對應 Teacher(name = ..., posts = [Post(content = ...), ...]) 的寫法:
+    # bulk_insert_tree(engine, Teacher.posts, [{"name": "Zhen", "posts": [{"content": "..."}]}])
+    # 也可以使用 tuple，最後一個元素是子資料: [("Zhen", [("...",), ...])]
+    # 父表的主鍵由這裡預先分配，子表的外鍵直接填入，不需要等待 flush 取回 id
+    prop = relationship_attr.property
+    if prop.direction is not ONETOMANY or len(prop.local_remote_pairs) != 1:
+        raise ValueError(f"{relationship_attr} must be a one-to-many relationship with a single foreign key")
+    parent_pk, child_fk = prop.local_remote_pairs[0]
+    parent_table = parent_pk.table
+    child_table = child_fk.table
+    parent_columns = parent_columns or _default_columns(parent_table)
+    child_columns = child_columns or [
+        column.key for column in child_table.columns
+        if not column.primary_key and column is not child_fk
+    ]
+
+    n_parents = n_children = 0
+    with engine.begin() as conn:
+        next_id = (conn.scalar(select(func.max(parent_pk))) or 0) + 1
+        for batch in _batches(parents, batch_size):
+            parent_rows = []
+            child_rows = []
+            for parent in batch:
+                if isinstance(parent, dict):
+                    parent = dict(parent)
+                    children = parent.pop(prop.key, ())
+                else:
+                    *values, children = parent
+                    parent = dict(zip(parent_columns, values))
+                if parent.get(parent_pk.key) is None:
+                    parent[parent_pk.key] = next_id
+                    next_id += 1
+                else:
+                    next_id = max(next_id, parent[parent_pk.key] + 1)
+                parent_rows.append(parent)
+                for child in _as_dicts(children, child_columns):
+                    child_rows.append({**child, child_fk.key: parent[parent_pk.key]})
+
+            conn.execute(insert(parent_table), parent_rows)
+            for child_batch in _batches(child_rows, batch_size):
+                conn.execute(insert(child_table), child_batch)
+            n_parents += len(parent_rows)
+            n_children += len(child_rows)
+    return n_parents, n_children
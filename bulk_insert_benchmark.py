@@ -0,0 +1,71 @@
+import argparse
+import os
+import tempfile
+from time import perf_counter
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from bulk_insert import bulk_insert_tree
+from loader_benchmark import POSTS_PER_TEACHER, make_models
+
+# 比較 session.add_all() 與 bulk_insert_tree() 寫入 Teacher + Post 的速度
+Base, Teacher, Post = make_models("select")
+
+
+def fresh_engine(path):
+    if os.path.exists(path):
+        os.remove(path)
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    return engine
+
+
+def with_add_all(engine, n_teachers):
+    session = sessionmaker(bind = engine)()
+    session.add_all(
+        [
+            Teacher(
+                name = f"Teacher{y}",
+                posts = [
+                    Post(content = f"This is the latest content for {y * POSTS_PER_TEACHER + x}")
+                    for x in range(POSTS_PER_TEACHER)
+                ]
+            ) for y in range(n_teachers)
+        ]
+    )
+    session.commit()
+    session.close()
+
+
+def with_bulk_insert(engine, n_teachers):
+    bulk_insert_tree(
+        engine,
+        Teacher.posts,
+        (
+            (
+                f"Teacher{y}",
+                [(f"This is the latest content for {y * POSTS_PER_TEACHER + x}",) for x in range(POSTS_PER_TEACHER)],
+            ) for y in range(n_teachers)
+        ),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Compare add_all with bulk_insert_tree")
+    parser.add_argument("--rows", type = int, default = 1_000_000, help = "total Teacher + Post rows")
+    parser.add_argument("--data-dir", default = tempfile.gettempdir())
+    args = parser.parse_args()
+
+    n_teachers = max(1, args.rows // (POSTS_PER_TEACHER + 1))
+    rows = n_teachers * (POSTS_PER_TEACHER + 1)
+    path = os.path.join(args.data_dir, "bulk_insert_benchmark.db")
+    timings = {}
+    for name, func in [("add_all", with_add_all), ("bulk_insert_tree", with_bulk_insert)]:
+        engine = fresh_engine(path)
+        start = perf_counter()
+        func(engine, n_teachers)
+        timings[name] = perf_counter() - start
+        engine.dispose()
+        print(f"{name:<17} {rows} rows in {timings[name]:.3f}s ({rows / timings[name]:,.0f} rows/s)")
+    print(f"Speedup: {timings['add_all'] / timings['bulk_insert_tree']:.1f}x")
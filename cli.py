@@ -0,0 +1,152 @@
+import argparse
+import importlib
+import os
+import runpy
+import sys
+
+# 專案的進入點，所有範例模組在 import 時都不會執行任何查詢或寫入，只有在這裡被明確呼叫時才會執行
+# 例如:
+#   python cli.py seed --users 1000 --teachers 200
+#   python cli.py demo joins
+#   python cli.py bench loader -- --sizes 1000
+#   python cli.py --sql-stats prometheus demo joins   (不印出每一條 SQL，結束時輸出統計)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+MODEL_MODULES = [
+    "models",
+    "one_on_one_relationship",
+    "follow",
+    "relationships",
+    "self_relationship",
+    "many_to_many_relationship",
+    "lazy_loading",
+    "deferred_loading",
+]
+
+DEMOS = {
+    "app": "app",
+    "joins": "join_types",
+    "lazy-loading": "lazy_loading",
+    "deferred-loading": "deferred_loading",
+    "many-to-many": "many_to_many_relationship",
+    "one-to-one": "one_on_one_relationship",
+    "self-relationship": "self_relationship",
+}
+
+BENCHMARKS = {
+    "loader": "loader_benchmark",
+    "bulk-insert": "bulk_insert_benchmark",
+    "streaming": "streaming_benchmark",
+    "engine": "engine_benchmark",
+    "prepared-queries": "prepared_queries_benchmark",
+    "graph": "graph_benchmark",
+    "async": "async_benchmark",
+    "startup": "startup_benchmark",
+    "user-reports": "user_reports_benchmark",
+    "columnar": "columnar_benchmark",
+    "keyset": "keyset_benchmark",
+    "parallel": "parallel_benchmark",
+    "bulk-edges": "bulk_edges_benchmark",
+    "load-profiles": "load_profiles_benchmark",
+    "instrumentation": "instrumentation_benchmark",
+    "joins": "join_benchmark",
+    "write-queue": "write_queue_benchmark",
+    "sharding": "sharding_benchmark",
+    "read-models": "read_models_benchmark",
+    "graph-index": "graph_index_benchmark",
+    "search": "search_benchmark",
+}
+
+
+def import_models():
+    return [importlib.import_module(name) for name in MODEL_MODULES]
+
+
+def seed(args):
+    from sqlalchemy import select
+
+    from bulk_insert import bulk_insert, bulk_insert_tree
+    from lazy_loading import Teacher
+    from many_to_many_relationship import Course, Student, StudentCourse
+    from models import User, engine, ensure_schema
+
+    import_models()
+    ensure_schema()
+    sexes = ("male", "female")
+    users = bulk_insert(engine, User, (
+        (f"User{x}", 18 + x % 60, sexes[x % 2]) for x in range(args.users)
+    ))
+    teachers, posts = bulk_insert_tree(engine, Teacher.posts, (
+        (f"Teacher{y}", [(f"This is the content for {y * args.posts_per_teacher + x}",)
+                         for x in range(args.posts_per_teacher)])
+        for y in range(args.teachers)
+    ))
+    titles = ["Mathematics", "Physics", "English", "Chinese"]
+    bulk_insert(engine, Course, ((title,) for title in titles))
+    bulk_insert(engine, Student, ((f"Student{x}",) for x in range(args.students)))
+    with engine.connect() as conn:
+        course_ids = conn.scalars(select(Course.id).order_by(Course.id.desc()).limit(len(titles))).all()
+        student_ids = conn.scalars(select(Student.id).order_by(Student.id.desc()).limit(args.students)).all()
+    links = bulk_insert(engine, StudentCourse, (
+        (student_id, course_ids[(student_id + offset) % len(course_ids)])
+        for student_id in student_ids for offset in range(2)
+    ))
+    print(f"Seeded {users} users, {teachers} teachers, {posts} posts, {len(student_ids)} students, {links} enrolments")
+
+
+def demo(args):
+    if args.name == "joins":
+        sys.path.insert(0, os.path.join(ROOT, "12_Join_Types"))
+    importlib.import_module(DEMOS[args.name]).main()
+
+
+def bench(args):
+    # 其餘參數直接轉交給 benchmark 腳本，例如 python cli.py bench graph -- --nodes 1000
+    module = BENCHMARKS[args.name]
+    sys.argv = [module, *[arg for arg in args.args if arg != "--"]]
+    runpy.run_module(module, run_name = "__main__")
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = "cli.py", description = "SQLAlchemy practice entry points")
+    parser.add_argument("--sql-stats", choices = ["json", "prometheus"],
+                        help = "turn off echo and print per-statement SQL statistics when done")
+    parser.add_argument("--slow-query", type = float, default = 0.5, help = "slow query threshold in seconds")
+    commands = parser.add_subparsers(dest = "command", required = True)
+
+    seed_parser = commands.add_parser("seed", help = "create the schema and insert sample data")
+    seed_parser.add_argument("--users", type = int, default = 1_000)
+    seed_parser.add_argument("--teachers", type = int, default = 100)
+    seed_parser.add_argument("--posts-per-teacher", type = int, default = 5)
+    seed_parser.add_argument("--students", type = int, default = 100)
+    seed_parser.set_defaults(func = seed)
+
+    demo_parser = commands.add_parser("demo", help = "run one of the tutorial demos")
+    demo_parser.add_argument("name", choices = list(DEMOS))
+    demo_parser.set_defaults(func = demo)
+
+    bench_parser = commands.add_parser("bench", help = "run a benchmark script")
+    bench_parser.add_argument("name", choices = list(BENCHMARKS))
+    bench_parser.add_argument("args", nargs = argparse.REMAINDER)
+    bench_parser.set_defaults(func = bench)
+
+    args = parser.parse_args(argv)
+    if not args.sql_stats:
+        args.func(args)
+        return
+
+    from instrumentation import SqlInstrumentation
+    from models import engine
+
+    engine.echo = False
+    stats = SqlInstrumentation(slow_threshold = args.slow_query).install()
+    try:
+        args.func(args)
+    finally:
+        stats.uninstall()
+        print(stats.to_json(indent = 2) if args.sql_stats == "json" else stats.to_prometheus(), end = "")
+
+
+if __name__ == "__main__":
+    main()
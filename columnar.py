@@ -0,0 +1,158 @@
+import numpy as np
+from sqlalchemy import Boolean, Engine, Float, Integer, func, select
+from sqlalchemy.orm import Session
+
+from lazy_loading import Post
+from models import User
+
+# 分析用的查詢不需要 ORM 物件：直接執行 Core select()，把每一批資料依欄位填入預先配置好的 NumPy 陣列
+# 數值欄位是連續的 int64 / float64 陣列，可以直接交給 pyarrow.array() 或 pandas 使用而不需要複製
+# 字串欄位 (例如 sex) 以字典編碼儲存: codes 為 int32 陣列，categories 為所有出現過的值，與 Arrow 的 DictionaryArray 相同
+# 例如:
+#   columns = user_columns(session)
+#   count_by(columns["sex"])                                       -> {"female": 500, "male": 500}
+#   count_by(columns["sex"], between(columns["age"], 20, 50))       -> 年齡介於 20 與 50 之間 (不含) 各性別的人數
+
+CHUNK_SIZE = 10_000
+
+
+class Categorical:
+    # 字典編碼的字串欄位，codes[i] 為第 i 筆資料在 categories 中的位置
+    def __init__(self, codes, categories):
+        self.codes = codes
+        self.categories = categories
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __eq__(self, value):
+        # 回傳布林遮罩，例如 columns["sex"] == "male"
+        if value not in self.categories:
+            return np.zeros(len(self.codes), dtype = bool)
+        return self.codes == self.categories.index(value)
+
+    def to_numpy(self):
+        return np.array(self.categories, dtype = object)[self.codes]
+
+
+class _Encoder:
+    def __init__(self):
+        self.lookup = {}
+
+    def __call__(self, value):
+        code = self.lookup.get(value)
+        if code is None:
+            code = self.lookup[value] = len(self.lookup)
+        return code
+
+
+def _dtype(column):
+    # 依欄位型別決定陣列的 dtype，字串等其他型別以字典編碼 (int32) 儲存
+    type_ = column.type
+    if isinstance(type_, Boolean):
+        return np.bool_
+    if isinstance(type_, Integer):
+        return np.int64
+    if isinstance(type_, Float):
+        return np.float64
+    return None
+
+
+def _grow(arrays, size):
+    return [np.resize(array, size) for array in arrays]
+
+
+def to_columns(bind, stmt, chunk_size = CHUNK_SIZE, size = None):
+    # bind 可以是 Session、Engine 或 Connection；stmt 為只選取欄位的 select()，例如 select(User.age, User.sex)
+    # size 為預估的筆數，不知道時會在陣列不夠大時以兩倍成長，最後再截斷為實際筆數
+    # 整數欄位中的 NULL 會讓 NumPy 拋出 TypeError，必要時請在查詢中使用 func.coalesce()
+    if isinstance(bind, Engine):
+        with bind.connect() as conn:
+            return to_columns(conn, stmt, chunk_size = chunk_size, size = size)
+    columns = list(stmt.selected_columns)
+    dtypes = [_dtype(column) for column in columns]
+    encoders = [None if dtype else _Encoder() for dtype in dtypes]
+    capacity = size or chunk_size
+    arrays = [np.empty(capacity, dtype = dtype or np.int32) for dtype in dtypes]
+
+    if isinstance(bind, Session):
+        result = bind.execute(stmt, execution_options = {"yield_per": chunk_size})
+    else:
+        result = bind.execute(stmt.execution_options(yield_per = chunk_size))
+    count = 0
+    for chunk in result.partitions():
+        end = count + len(chunk)
+        if end > capacity:
+            capacity = max(capacity * 2, end)
+            arrays = _grow(arrays, capacity)
+        for array, encoder, values in zip(arrays, encoders, zip(*chunk)):
+            array[count:end] = values if encoder is None else [encoder(value) for value in values]
+        count = end
+
+    output = {}
+    for column, array, encoder in zip(columns, arrays, encoders):
+        array = array[:count]
+        if encoder is not None:
+            array = Categorical(array, list(encoder.lookup))
+        output[column.key] = array
+    return output
+
+
+def user_columns(bind, *columns, where = (), chunk_size = CHUNK_SIZE):
+    # 預設取出 app.py 統計用的 id、age、sex；與 post_columns 相同，NULL 的 age 以 0 表示 (不會落在任何年齡範圍內)
+    default = (User.id, func.coalesce(User.age, 0).label("age"), User.sex)
+    stmt = select(*(columns or default)).where(*where)
+    return to_columns(bind, stmt, chunk_size = chunk_size)
+
+
+def post_columns(bind, where = (), chunk_size = CHUNK_SIZE):
+    # 文章的中繼資料: id、teacher_id 與內容長度，不讀取內容本身
+    stmt = select(
+        Post.id,
+        func.coalesce(Post.teacher_id, 0).label("teacher_id"),
+        func.coalesce(func.length(Post.content), 0).label("length"),
+    ).where(*where)
+    return to_columns(bind, stmt, chunk_size = chunk_size)
+
+
+# 以下為向量化的篩選與統計，對應 app.py 中的查詢
+def between(values, low, high):
+    # 等同 filter(User.age > low, User.age < high)
+    return (values > low) & (values < high)
+
+
+def at_least(values, low):
+    return values >= low
+
+
+def count_by(key, mask = None):
+    # 等同 group_by(key) 後 count()；key 為 Categorical 或整數陣列 (例如 teacher_id)
+    codes = key.codes if isinstance(key, Categorical) else key
+    if mask is not None:
+        codes = codes[mask]
+    if isinstance(key, Categorical):
+        counts = np.bincount(codes, minlength = len(key.categories))
+        return {category: int(count) for category, count in zip(key.categories, counts) if count}
+    values, counts = np.unique(codes, return_counts = True)
+    return dict(zip(values.tolist(), counts.tolist()))
+
+
+def sum_by(key, values, mask = None):
+    # 等同 group_by(key) 後 sum(values)，例如每位老師的文章總長度 sum_by(posts["teacher_id"], posts["length"])
+    codes = key.codes if isinstance(key, Categorical) else key
+    if mask is not None:
+        codes, values = codes[mask], values[mask]
+    if isinstance(key, Categorical):
+        # 與 count_by 相同，只回傳 (篩選後) 有資料的類別
+        counts = np.bincount(codes, minlength = len(key.categories))
+        sums = np.bincount(codes, weights = values, minlength = len(key.categories))
+        return {category: sums[index].item() for index, category in enumerate(key.categories) if counts[index]}
+    groups, inverse = np.unique(codes, return_inverse = True)
+    sums = np.bincount(inverse, weights = values)
+    return dict(zip(groups.tolist(), sums.tolist()))
+
+
+def mean_by(key, values, mask = None):
+    counts = count_by(key, mask)
+    sums = sum_by(key, values, mask)
+    return {group: sums[group] / count for group, count in counts.items()}
@@ -0,0 +1,86 @@
+import argparse
+import os
+import tempfile
+import tracemalloc
+from collections import Counter, defaultdict
+from time import perf_counter
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from bulk_insert import bulk_insert, bulk_insert_tree
+from columnar import between, count_by, post_columns, sum_by, user_columns
+from lazy_loading import Post, Teacher
+from models import User
+
+# 比較以 ORM 物件計算 app.py 中的統計與 columnar.py 以 NumPy 陣列計算的時間與記憶體峰值 (tracemalloc)
+# 1. 各性別人數  2. 年齡介於 20 與 50 之間各性別人數  3. 每位老師的文章總長度
+
+POSTS_PER_TEACHER = 5
+
+
+def build_dataset(path, n_users):
+    if os.path.exists(path):
+        os.remove(path)
+    engine = create_engine(f"sqlite:///{path}")
+    for table in (User.__table__, Teacher.__table__, Post.__table__):
+        table.create(engine)
+    sexes = ("male", "female")
+    bulk_insert(engine, User, ((f"User{x}", 18 + x % 60, sexes[x % 2]) for x in range(n_users)))
+    n_teachers = max(1, n_users // POSTS_PER_TEACHER)
+    bulk_insert_tree(engine, Teacher.posts, (
+        (f"Teacher{y}", [(f"Post {x} " * (1 + x % 7),) for x in range(POSTS_PER_TEACHER)])
+        for y in range(n_teachers)
+    ))
+    return engine
+
+
+def orm_reports(session):
+    users = session.query(User).all()
+    by_sex = Counter(user.sex for user in users)
+    between_sex = Counter(user.sex for user in users if 20 < user.age < 50)
+    lengths = defaultdict(int)
+    for post in session.query(Post).all():
+        lengths[post.teacher_id] += len(post.content)
+    return dict(by_sex), dict(between_sex), dict(lengths)
+
+
+def columnar_reports(session):
+    users = user_columns(session)
+    posts = post_columns(session)
+    lengths = {teacher: int(total) for teacher, total in sum_by(posts["teacher_id"], posts["length"]).items()}
+    return count_by(users["sex"]), count_by(users["sex"], between(users["age"], 20, 50)), lengths
+
+
+def measure(Session, func):
+    # tracemalloc 會大幅拖慢執行，所以時間與記憶體峰值分兩次量測
+    with Session() as session:
+        start = perf_counter()
+        result = func(session)
+        elapsed = perf_counter() - start
+    with Session() as session:
+        tracemalloc.start()
+        func(session)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return elapsed, peak, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Compare ORM and NumPy column paths for the app.py reports")
+    parser.add_argument("--sizes", type = int, nargs = "+", default = [10_000, 100_000, 1_000_000])
+    parser.add_argument("--data-dir", default = tempfile.gettempdir())
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        engine = build_dataset(os.path.join(args.data_dir, "columnar_benchmark.db"), size)
+        Session = sessionmaker(bind = engine)
+        with engine.connect() as conn:
+            n_posts = conn.scalar(select(func.count()).select_from(Post))
+        results = []
+        for label, func_ in (("orm", orm_reports), ("columnar", columnar_reports)):
+            elapsed, peak, result = measure(Session, func_)
+            results.append(result)
+            print(f"{size:>10,} users {n_posts:>10,} posts  {label:<9} {elapsed:8.3f}s  peak {peak / 2**20:8.1f} MB")
+        assert results[0] == results[1], "ORM and columnar reports differ"
+        engine.dispose()
@@ -1,48 +1,60 @@
 from sqlalchemy import (Column, String, create_engine, select)
-from sqlalchemy.orm import DeclarativeBase, sessionmaker, Mapped, mapped_column, deferred, undefer
-from models import engine
+from sqlalchemy.orm import sessionmaker, Mapped, mapped_column, deferred, undefer
+from load_profiles import profiles
+from models import Base, engine, ensure_schema
 
 Session = sessionmaker(bind = engine)
-session = Session()
-
-class Base(DeclarativeBase):
-    id: Mapped[int] = mapped_column(primary_key= True)
 
 class UserLegacy(Base):
     __tablename__ = 'userlegacies'
 
     id: Mapped[int] = mapped_column(primary_key = True)
-    nickname: Mapped[str] = deferred(mapped_column(String))
+    # deferred 欄位依用途分組: __repr__ 會用到 nickname (display)，完整姓名 (name) 與其他資料 (extra) 只有詳細頁面需要
+    nickname: Mapped[str] = deferred(mapped_column(String), group = "display")
     first_name: Mapped[str] = mapped_column(String)
-    last_name = deferred(Column(String))
-    other_value: Mapped[str] = mapped_column(String, deferred = True)
+    last_name = deferred(Column(String), group = "name")
+    other_value: Mapped[str] = mapped_column(String, deferred = True, deferred_group = "extra")
 
     def __repr__(self) -> str:
         return f"<UserLegacy: {self.id} - {self.nickname}>"
-    
-Base.metadata.create_all(engine)
-
-# session.add(
-#     UserLegacy(
-#         first_name = "Zeq",
-#         last_name = "Tech",
-#         nickname = "ZeqTech",
-#         other_value = "other"
-#     )
-# )
-# session.commit()
-
-# 下面三種都是查詢方式
-# user = session.scalar(select(UserLegacy))
-# user = session.execute(select(UserLegacy)).scalar()
-# user = session.query(UserLegacy).first()
-# print(user)
-# print(user.first_name)
-# print(user.last_name)
-# print(user.other_value)
- 
-other_user = session.query(UserLegacy).options(undefer(UserLegacy.first_name), undefer(UserLegacy.last_name), undefer(UserLegacy.other_value)).first()
-print(other_user)
-print(other_user.first_name)
-print(other_user.last_name)
-print(other_user.other_value)
\ No newline at end of file
+
+
+# 每個呼叫端依需要選擇 profile，例如 session.scalars(profiles.select(UserLegacy, "summary"))
+profiles.register(UserLegacy, "summary", "display")
+profiles.register(UserLegacy, "full", "display", "name", "extra")
+
+
+def main():
+    ensure_schema()
+    session = Session()
+
+    # session.add(
+    #     UserLegacy(
+    #         first_name = "Zeq",
+    #         last_name = "Tech",
+    #         nickname = "ZeqTech",
+    #         other_value = "other"
+    #     )
+    # )
+    # session.commit()
+
+    # 下面三種都是查詢方式
+    # user = session.scalar(select(UserLegacy))
+    # user = session.execute(select(UserLegacy)).scalar()
+    # user = session.query(UserLegacy).first()
+    # print(user)
+    # print(user.first_name)
+    # print(user.last_name)
+    # print(user.other_value)
+
+    # other_user = session.query(UserLegacy).options(undefer(UserLegacy.first_name), undefer(UserLegacy.last_name), undefer(UserLegacy.other_value)).first()
+    # 與上面相同，但改用事先註冊的 profile，一次查詢取回所有 deferred 欄位
+    other_user = session.scalars(profiles.select(UserLegacy, "full")).first()
+    print(other_user)
+    print(other_user.first_name)
+    print(other_user.last_name)
+    print(other_user.other_value)
+
+
+if __name__ == "__main__":
+    main()
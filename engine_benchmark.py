@@ -0,0 +1,75 @@
+import argparse
+import os
+import random
+import tempfile
+import threading
+from time import perf_counter
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import OperationalError
+
+from models import PROFILES, User, make_engine
+
+# 在同一個 SQLite 檔案上同時執行讀取與寫入的執行緒，比較各個 profile 的吞吐量
+
+
+def worker(engine, kind, deadline, max_id, stats, lock):
+    ops = errors = 0
+    while perf_counter() < deadline:
+        try:
+            if kind == "read":
+                with engine.connect() as conn:
+                    conn.execute(select(User).where(User.id == random.randint(1, max_id))).first()
+            else:
+                with engine.begin() as conn:
+                    conn.execute(insert(User).values(name = "Writer", age = 30, sex = "male"))
+            ops += 1
+        except OperationalError:
+            errors += 1
+    with lock:
+        stats[kind] += ops
+        stats["errors"] += errors
+
+
+def run_profile(profile, path, readers, writers, seconds, seed_rows):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    engine = make_engine(profile, url = f"sqlite:///{path}")
+    engine.echo = False
+    User.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"name": f"User{x}", "age": 20 + x % 40, "sex": "female"} for x in range(seed_rows)])
+
+    stats = {"read": 0, "write": 0, "errors": 0}
+    lock = threading.Lock()
+    deadline = perf_counter() + seconds
+    threads = [
+        threading.Thread(target = worker, args = (engine, kind, deadline, seed_rows, stats, lock))
+        for kind in ["read"] * readers + ["write"] * writers
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+    return {kind: count / seconds for kind, count in stats.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Compare concurrent throughput of the engine profiles")
+    parser.add_argument("--profiles", nargs = "+", choices = list(PROFILES), default = list(PROFILES))
+    parser.add_argument("--readers", type = int, default = 8)
+    parser.add_argument("--writers", type = int, default = 2)
+    parser.add_argument("--seconds", type = float, default = 5.0)
+    parser.add_argument("--seed-rows", type = int, default = 10_000)
+    parser.add_argument("--data-dir", default = tempfile.gettempdir())
+    args = parser.parse_args()
+
+    path = os.path.join(args.data_dir, "engine_benchmark.db")
+    for profile in args.profiles:
+        result = run_profile(profile, path, args.readers, args.writers, args.seconds, args.seed_rows)
+        print(
+            f"{profile:<17} reads/s={result['read']:>9,.0f} writes/s={result['write']:>8,.0f} "
+            f"errors/s={result['errors']:>6,.0f}"
+        )
@@ -0,0 +1,174 @@
+import sys
+import threading
+from collections import OrderedDict
+from time import monotonic
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+# 放在 Session 前面的第二層快取，用主鍵或 unique 欄位 (例如 Email.email) 查詢單筆資料時先查快取
+# 快取只保存欄位的值，不保存 ORM 物件本身，命中時再把值放回目前的 session (不會發出查詢)
+# flush 時把被修改或刪除的資料從快取移除，commit 後再移除一次，避免其他 session 在 commit 前又放回舊值
+
+_PENDING = "entity_cache_pending"
+
+
+class EntityCache:
+    def __init__(self, ttl = 60.0, max_entries = 10_000, max_bytes = 64 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._models = {}
+        self._entries = OrderedDict()
+        self._unique = {}
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._target = None
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    def configure(self, model, ttl = None, unique = ()):
+        # 例如 cache.configure(Email, ttl = 300, unique = [Email.email])
+        self._models[model] = {
+            "ttl": self.ttl if ttl is None else ttl,
+            "unique": [column.key for column in unique],
+        }
+        return self
+
+    def install(self, target = Session):
+        event.listen(target, "after_flush", self._after_flush)
+        event.listen(target, "after_commit", self._after_commit)
+        event.listen(target, "after_rollback", self._after_commit)
+        self._target = target
+        return self
+
+    def uninstall(self):
+        event.remove(self._target, "after_flush", self._after_flush)
+        event.remove(self._target, "after_commit", self._after_commit)
+        event.remove(self._target, "after_rollback", self._after_commit)
+        self._target = None
+
+    def get(self, session, model, ident):
+        mapper = inspect(model)
+        ident = ident if isinstance(ident, tuple) else (ident,)
+        obj = session.identity_map.get(mapper.identity_key_from_primary_key(ident))
+        if obj is not None:
+            return obj
+        values = self._lookup((model, ident))
+        if values is not None:
+            return self._attach(session, mapper, values)
+        obj = session.get(model, ident)
+        if obj is not None:
+            self._store(model, obj)
+        return obj
+
+    def get_by(self, session, model, **criteria):
+        # 只支援 configure() 時宣告的 unique 欄位，例如 cache.get_by(session, Email, email = "...")
+        ((key, value),) = criteria.items()
+        if key not in self._models.get(model, {}).get("unique", ()):
+            raise ValueError(f"{model.__name__}.{key} is not configured as a unique cache key")
+        with self._lock:
+            ident = self._unique.get((model, key, value))
+        if ident is not None:
+            return self.get(session, model, ident)
+        with self._lock:
+            self.misses += 1
+        obj = session.execute(select(model).where(getattr(model, key) == value)).scalar_one_or_none()
+        if obj is not None:
+            self._store(model, obj)
+        return obj
+
+    def invalidate(self, model, ident):
+        ident = ident if isinstance(ident, tuple) else (ident,)
+        with self._lock:
+            if self._remove((model, ident)):
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._unique.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, values, size = entry
+            if expires < monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return values
+
+    def _attach(self, session, mapper, values):
+        obj = mapper.class_manager.new_instance()
+        for key, value in values.items():
+            set_committed_value(obj, key, value)
+        make_transient_to_detached(obj)
+        return session.merge(obj, load = False)
+
+    def _store(self, model, obj):
+        config = self._models.get(model)
+        if config is None:
+            return
+        state = inspect(obj)
+        values = {attr.key: state.dict[attr.key] for attr in state.mapper.column_attrs if attr.key in state.dict}
+        size = sys.getsizeof(values) + sum(sys.getsizeof(value) for value in values.values())
+        key = (model, state.identity)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (monotonic() + config["ttl"], values, size)
+            self._bytes += size
+            for column in config["unique"]:
+                if column in values:
+                    self._unique[(model, column, values[column])] = state.identity
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        model, ident = key
+        expires, values, size = entry
+        self._bytes -= size
+        for column in self._models.get(model, {}).get("unique", ()):
+            if self._unique.get((model, column, values.get(column))) == ident:
+                del self._unique[(model, column, values.get(column))]
+        return True
+
+    def _after_flush(self, session, flush_context):
+        keys = session.info.setdefault(_PENDING, set())
+        for obj in list(session.dirty) + list(session.deleted):
+            model = type(obj)
+            state = inspect(obj)
+            if model in self._models and state.identity is not None:
+                keys.add((model, state.identity))
+        for model, ident in keys:
+            self.invalidate(model, ident)
+
+    def _after_commit(self, session):
+        for model, ident in session.info.pop(_PENDING, ()):
+            self.invalidate(model, ident)
@@ -1,10 +1,7 @@
-from sqlalchemy import (Column, ForeignKey, Integer, String, create_engine)
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker, Mapped, mapped_column
-from models import engine
+from sqlalchemy import (Column, ForeignKey, Index, Integer, String, create_engine)
+from sqlalchemy.orm import relationship, sessionmaker, Mapped, mapped_column
+from models import Base, dedupe_ddl, engine
 Session = sessionmaker(bind = engine)
-session = Session()
-
-Base = declarative_base()
 
 class BaseModel(Base):
     __abstract__ = True
@@ -28,6 +25,11 @@ class BaseModel(Base):
 # 建立 Associate Table
 class FollowingAssociation(BaseModel):
     __tablename__ = "following_association"
+    __table_args__ = (
+        Index("uq_following_association_merchant_id_following_id", "merchant_id", "following_id", unique = True),
+        {"info": {"ddl": dedupe_ddl("following_association", ("merchant_id", "following_id"),
+                                    replaces = "ix_following_association_merchant_id_following_id")}},
+    )
 
     merchant_id = Column(Integer, ForeignKey('merchants.id'))
     following_id = Column(Integer, ForeignKey('merchants.id'))
@@ -41,5 +43,3 @@ class Merchant(BaseModel):
 
     def __repr__(self):
         return f"<Merchant(id={self.id}, merchantname={self.merchantname}, following={self.following})>"
-
-Base.metadata.create_all(engine)
\ No newline at end of file
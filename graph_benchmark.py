@@ -0,0 +1,74 @@
+import argparse
+import os
+import tempfile
+from time import perf_counter
+
+from sqlalchemy import Column, ForeignKey, Integer, create_engine, insert
+from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+
+from graph_traversal import chain, chain_objects
+
+# 在一條很長的 Node 鏈上比較逐步存取 next_node 與一次 WITH RECURSIVE 查詢
+# 表格結構與 self_relationship.Node / NodeAssociation 相同
+
+Base = declarative_base()
+
+
+class NodeAssociation(Base):
+    __tablename__ = 'node_associations'
+    id = Column(Integer, primary_key=True)
+    current_node_id = Column(Integer, ForeignKey('nodes.id'), index = True)
+    next_node_id = Column(Integer, ForeignKey('nodes.id'))
+
+
+class Node(Base):
+    __tablename__ = "nodes"
+    id = Column(Integer, primary_key = True)
+    value = Column(Integer, nullable = False)
+    next_node = relationship("Node", secondary="node_associations",
+                             primaryjoin="NodeAssociation.current_node_id == Node.id",
+                             secondaryjoin="NodeAssociation.next_node_id == Node.id",
+                             uselist = False)
+
+
+def build_chain(path, n_nodes):
+    if os.path.exists(path):
+        os.remove(path)
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Node), [{"id": x, "value": x} for x in range(1, n_nodes + 1)])
+        conn.execute(insert(NodeAssociation), [
+            {"current_node_id": x, "next_node_id": x + 1} for x in range(1, n_nodes)
+        ])
+    return engine
+
+
+def walk_attributes(session):
+    node = session.get(Node, 1)
+    count = 0
+    while node is not None:
+        count += 1
+        node = node.next_node
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Compare next_node walking with a recursive CTE")
+    parser.add_argument("--nodes", type = int, default = 100_000)
+    parser.add_argument("--data-dir", default = tempfile.gettempdir())
+    args = parser.parse_args()
+
+    engine = build_chain(os.path.join(args.data_dir, "graph_benchmark.db"), args.nodes)
+    Session = sessionmaker(bind = engine)
+    cases = [
+        ("attribute walk", walk_attributes),
+        ("chain()", lambda session: len(chain(session, 1).ids)),
+        ("chain_objects()", lambda session: len(chain_objects(session, Node, 1)[0])),
+    ]
+    for label, func in cases:
+        session = Session()
+        start = perf_counter()
+        count = func(session)
+        print(f"{label:<16} {count} nodes in {perf_counter() - start:.3f}s")
+        session.close()
@@ -0,0 +1,321 @@
+import threading
+from collections import defaultdict
+from itertools import groupby
+from operator import itemgetter
+
+import numpy as np
+from sqlalchemy import Integer, event, inspect, select, type_coerce
+from sqlalchemy.orm import Session, attributes
+from sqlalchemy.orm.base import PASSIVE_NO_INITIALIZE
+
+from columnar import to_columns
+from graph_traversal import FAN_FOLLOWING
+
+# 「誰追蹤誰」、互相追蹤、朋友的朋友在 SQL 中都是多次 join 的查詢
+# GraphIndex 把關聯表 (例如 fans_associations) 整個載入記憶體，以 CSR (compressed sparse row) 儲存:
+#   out_targets[out_offsets[id]:out_offsets[id + 1]] 為 id 追蹤的對象 (已排序)，in_ 開頭的陣列則為反方向 (追蹤 id 的人)
+# 每條邊在兩個方向各佔一個 int32，另外每個 id 在兩個方向各佔一個 int64 的 offset:
+#   10,000,000 條邊、1,000,000 個 id 約 80 MB + 16 MB = 96 MB (nbytes 回傳實際大小)
+# 走訪時以 numpy 布林陣列 (每個 id 一個位元組) 記錄已經走過的節點，每一步都是向量化的 gather，不需要逐一處理節點
+#
+# 例如:
+#   index = GraphIndex(FAN_FOLLOWING, Fan.following).load(engine).install()
+#   index.mutual(fan.id)              -> 與 fan 互相追蹤的 id
+#   index.reachable(fan.id, 2)        -> {id: 最少需要幾步}，與 graph_traversal.neighbourhood 相同
+#   index.suggestions(fan.id)         -> [(id, 共同追蹤數), ...] 追蹤的人也在追蹤、但自己尚未追蹤的對象
+#
+# install() 之後透過 session 的 flush 事件同步: relationship (fan.following.append) 的變更、關聯表物件的新增刪除、
+# 以及被刪除的節點；commit 後才套用，rollback 時捨棄
+# 變更先記在 delta 中，累積超過 compact_threshold 條時重建 CSR
+# 以 Core 直接寫入關聯表 (例如 bulk_edges.add_edges) 不會觸發事件，寫入後請呼叫 add_edges / remove_edges 或重新 load
+
+COMPACT_THRESHOLD = 100_000
+
+_PENDING = "graph_index_pending"
+
+
+def _csr(sources, targets, size):
+    order = np.lexsort((targets, sources))
+    offsets = np.zeros(size + 1, dtype = np.int64)
+    np.cumsum(np.bincount(sources, minlength = size), out = offsets[1:])
+    return offsets, targets[order].astype(np.int32)
+
+
+def _gather(offsets, targets, nodes):
+    # 一次取出多個節點的鄰居，回傳 (來源, 鄰居) 兩個等長的陣列
+    nodes = nodes[nodes < len(offsets) - 1]
+    starts = offsets[nodes]
+    counts = offsets[nodes + 1] - starts
+    total = int(counts.sum())
+    if not total:
+        return nodes[:0], targets[:0].astype(np.int64)
+    index = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+    return np.repeat(nodes, counts), targets[index].astype(np.int64)
+
+
+class _Direction:
+    # 單一方向的 CSR 與尚未合併的變更
+    def __init__(self, offsets, targets):
+        self.offsets = offsets
+        self.targets = targets
+        self.added = defaultdict(set)
+        self.removed = defaultdict(set)
+
+    def base(self, node):
+        if node >= len(self.offsets) - 1:
+            return self.targets[:0]
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+    def in_base(self, node, target):
+        row = self.base(node)
+        position = np.searchsorted(row, target)
+        return position < len(row) and row[position] == target
+
+    def has(self, node, target):
+        if target in self.added.get(node, ()):
+            return True
+        return target not in self.removed.get(node, ()) and self.in_base(node, target)
+
+    def add(self, node, target):
+        if target in self.removed.get(node, ()):
+            self.removed[node].discard(target)
+        elif not self.in_base(node, target):
+            self.added[node].add(target)
+
+    def remove(self, node, target):
+        if target in self.added.get(node, ()):
+            self.added[node].discard(target)
+        elif self.in_base(node, target):
+            self.removed[node].add(target)
+
+    def neighbours(self, node):
+        row = self.base(node)
+        added, removed = self.added.get(node), self.removed.get(node)
+        if not added and not removed:
+            return row.astype(np.int64)
+        values = set(row.tolist()) - (removed or set()) | (added or set())
+        return np.array(sorted(values), dtype = np.int64)
+
+    def degree(self, node):
+        row = self.base(node)
+        return len(row) - len(self.removed.get(node, ())) + len(self.added.get(node, ()))
+
+    def expand(self, nodes):
+        sources, targets = _gather(self.offsets, self.targets, nodes)
+        removed = [node for node in self.removed if self.removed[node]]
+        if removed and len(targets):
+            width = max(int(targets.max()), max(max(values) for values in self.removed.values() if values)) + 1
+            keys = np.array([node * width + target for node in removed for target in self.removed[node]])
+            targets = targets[~np.isin(sources * width + targets, keys)]
+        added = [node for node in nodes.tolist() if self.added.get(node)]
+        if added:
+            targets = np.concatenate([targets, np.fromiter(
+                (target for node in added for target in self.added[node]), dtype = np.int64)])
+        return targets
+
+    def pending(self):
+        return sum(map(len, self.added.values())) + sum(map(len, self.removed.values()))
+
+    def pairs(self):
+        size = len(self.offsets) - 1
+        sources = np.repeat(np.arange(size, dtype = np.int64), np.diff(self.offsets))
+        targets = self.targets.astype(np.int64)
+        keep = np.ones(len(targets), dtype = bool)
+        for node, values in self.removed.items():
+            if values:
+                row = slice(self.offsets[node], self.offsets[node + 1])
+                keep[row] &= ~np.isin(self.targets[row], list(values))
+        added = [(node, target) for node, values in self.added.items() for target in values]
+        extra = np.array(added, dtype = np.int64).reshape(-1, 2)
+        return np.concatenate([sources[keep], extra[:, 0]]), np.concatenate([targets[keep], extra[:, 1]])
+
+
+class GraphIndex:
+    def __init__(self, edges = FAN_FOLLOWING, relationship = None, compact_threshold = COMPACT_THRESHOLD):
+        # edges 為 graph_traversal 中的 Edges，relationship 為方向相同的多對多關係 (例如 FAN_FOLLOWING 與 Fan.following)
+        self.edges = edges
+        self.relationship = relationship
+        self.compact_threshold = compact_threshold
+        self._lock = threading.RLock()
+        self._target = None
+        self._build(np.empty(0, dtype = np.int64), np.empty(0, dtype = np.int64))
+
+    def _build(self, sources, targets):
+        size = int(max(sources.max(initial = -1), targets.max(initial = -1))) + 1
+        self.size = size
+        self.out = _Direction(*_csr(sources, targets, size))
+        self.in_ = _Direction(*_csr(targets, sources, size))
+        self.edge_count = len(sources)
+
+    def load(self, bind):
+        # bind 可以是 Session、Engine 或 Connection
+        # Edges.clause() 的欄位沒有型別，以 type_coerce 標示為整數，to_columns 才會建立 int64 陣列
+        edge = self.edges.clause()
+        source, target = edge.c[self.edges.source], edge.c[self.edges.target]
+        stmt = select(type_coerce(source, Integer).label("source"), type_coerce(target, Integer).label("target")).where(
+            source.is_not(None), target.is_not(None))
+        columns = to_columns(bind, stmt)
+        sources, targets = columns["source"], columns["target"]
+        # 關聯表上有唯一索引，仍然去除重複以防舊資料
+        pairs = np.unique(np.stack([sources, targets], axis = 1), axis = 0) if len(sources) else np.empty((0, 2), np.int64)
+        with self._lock:
+            self._build(pairs[:, 0], pairs[:, 1])
+        return self
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for direction in (self.out, self.in_) for array in (direction.offsets, direction.targets))
+
+    # 變更
+    def add_edges(self, pairs):
+        with self._lock:
+            for source, target in pairs:
+                if not self.out.has(source, target):
+                    self.edge_count += 1
+                self.out.add(source, target)
+                self.in_.add(target, source)
+            self._maybe_compact()
+
+    def remove_edges(self, pairs):
+        with self._lock:
+            for source, target in pairs:
+                if self.out.has(source, target):
+                    self.edge_count -= 1
+                self.out.remove(source, target)
+                self.in_.remove(target, source)
+            self._maybe_compact()
+
+    def remove_nodes(self, ids):
+        with self._lock:
+            pairs = [(id, target) for id in ids for target in self.out.neighbours(id).tolist()]
+            pairs += [(source, id) for id in ids for source in self.in_.neighbours(id).tolist()]
+            self.remove_edges(pairs)
+
+    def _maybe_compact(self):
+        if self.out.pending() > self.compact_threshold:
+            self.compact()
+
+    def compact(self):
+        # 把 delta 合併進 CSR
+        with self._lock:
+            self._build(*self.out.pairs())
+
+    # 查詢
+    def following(self, id):
+        with self._lock:
+            return self.out.neighbours(id).tolist()
+
+    def followers(self, id):
+        with self._lock:
+            return self.in_.neighbours(id).tolist()
+
+    def out_degree(self, id):
+        with self._lock:
+            return self.out.degree(id)
+
+    def in_degree(self, id):
+        with self._lock:
+            return self.in_.degree(id)
+
+    def follows(self, source, target):
+        with self._lock:
+            return bool(self.out.has(source, target))
+
+    def is_mutual(self, a, b):
+        with self._lock:
+            return bool(self.out.has(a, b) and self.out.has(b, a))
+
+    def mutual(self, id):
+        with self._lock:
+            return np.intersect1d(self.out.neighbours(id), self.in_.neighbours(id), assume_unique = True).tolist()
+
+    def reachable(self, start, k, direction = "out"):
+        # k 步以內可以到達的節點 {id: 最少需要幾步}，不包含起點
+        with self._lock:
+            side = self.out if direction == "out" else self.in_
+            size = max(self.size, max(side.added, default = -1) + 1, start + 1)
+            seen = np.zeros(size, dtype = bool)
+            seen[start] = True
+            frontier = np.array([start], dtype = np.int64)
+            hops = {}
+            for step in range(1, k + 1):
+                targets = side.expand(frontier)
+                if len(targets) and targets.max() >= len(seen):
+                    seen = np.resize(seen, int(targets.max()) + 1)
+                    seen[size:] = False
+                    size = len(seen)
+                targets = np.unique(targets)
+                frontier = targets[~seen[targets]]
+                if not len(frontier):
+                    break
+                seen[frontier] = True
+                hops.update(dict.fromkeys(frontier.tolist(), step))
+            return hops
+
+    def suggestions(self, id, limit = 10):
+        # 追蹤的人所追蹤的對象，依共同追蹤數由多到少 (相同時依 id) 排列，不包含自己與已經追蹤的人
+        with self._lock:
+            following = self.out.neighbours(id)
+            candidates = self.out.expand(following)
+            candidates = candidates[(candidates != id) & ~np.isin(candidates, following)]
+            if not len(candidates):
+                return []
+            ids, counts = np.unique(candidates, return_counts = True)
+            order = np.lexsort((ids, -counts))[:limit]
+            return list(zip(ids[order].tolist(), counts[order].tolist()))
+
+    # 與 session 同步
+    def install(self, target = Session):
+        if self.relationship is None:
+            raise ValueError("install() needs the relationship the edges belong to, e.g. Fan.following")
+        event.listen(target, "after_flush", self._after_flush)
+        event.listen(target, "after_commit", self._after_commit)
+        event.listen(target, "after_rollback", self._after_rollback)
+        self._target = target
+        return self
+
+    def uninstall(self):
+        event.remove(self._target, "after_flush", self._after_flush)
+        event.remove(self._target, "after_commit", self._after_commit)
+        event.remove(self._target, "after_rollback", self._after_rollback)
+        self._target = None
+
+    def _pending(self, session):
+        # 依 flush 的順序記錄 (操作, 值)，同一個交易中先新增後刪除 (或相反) 的邊在 commit 時才會得到正確的結果
+        return session.info.setdefault((_PENDING, id(self)), [])
+
+    def _after_flush(self, session, flush_context):
+        prop = self.relationship.property
+        model = prop.parent.class_
+        # (屬性名稱, 物件是否為來源)；backref 的另一側方向相反
+        sides = [(prop.key, True)] + [(reverse.key, False) for reverse in prop._reverse_property]
+        operations = self._pending(session)
+        added, removed, nodes = [], [], []
+        for obj in list(session.new) + list(session.dirty):
+            if isinstance(obj, model):
+                for key, outgoing in sides:
+                    history = attributes.get_history(obj, key, passive = PASSIVE_NO_INITIALIZE)
+                    for items, pairs in ((history.added, added), (history.deleted, removed)):
+                        pairs.extend((obj.id, item.id) if outgoing else (item.id, obj.id) for item in items or ())
+            elif inspect(obj).mapper.local_table is prop.secondary and obj in session.new:
+                added.append((getattr(obj, self.edges.source), getattr(obj, self.edges.target)))
+        for obj in session.deleted:
+            if isinstance(obj, model):
+                nodes.append(obj.id)
+            elif inspect(obj).mapper.local_table is prop.secondary:
+                removed.append((getattr(obj, self.edges.source), getattr(obj, self.edges.target)))
+        # 同一次 flush 中的 SQL 也是先刪除再新增
+        operations.extend(("remove", pair) for pair in removed)
+        operations.extend(("add", pair) for pair in added)
+        operations.extend(("node", id) for id in nodes)
+
+    def _after_commit(self, session):
+        operations = session.info.pop((_PENDING, id(self)), None)
+        if operations:
+            apply = {"add": self.add_edges, "remove": self.remove_edges, "node": self.remove_nodes}
+            # 連續的相同操作一次套用
+            for op, group in groupby(operations, key = itemgetter(0)):
+                apply[op]([value for _, value in group])
+
+    def _after_rollback(self, session):
+        session.info.pop((_PENDING, id(self)), None)
@@ -0,0 +1,109 @@
+import argparse
+import os
+import random
+import tempfile
+from time import perf_counter
+
+from sqlalchemy import func, inspect, select
+from sqlalchemy.orm import Session, aliased
+
+from bulk_edges import add_edges
+from bulk_insert import bulk_insert
+from graph_index import GraphIndex
+from graph_traversal import FAN_FOLLOWING, neighbourhood
+from many_to_many_relationship import Fan, FansAssociation
+from models import ensure_schema, make_engine
+
+# 在隨機產生的追蹤關係上比較 SQL 與 GraphIndex 回答相同問題的時間，並列出載入時間與記憶體用量
+# 預設 1,000,000 個 fan、10,000,000 條邊；資料庫建立一次後會重複使用
+
+a = aliased(FansAssociation)
+b = aliased(FansAssociation)
+c = aliased(FansAssociation)
+
+
+def build(path, n_fans, n_edges, seed = 1):
+    engine = make_engine("prod-write-heavy", url = f"sqlite:///{path}")
+    if inspect(engine).has_table("fans"):
+        with engine.connect() as conn:
+            if conn.scalar(select(func.count(Fan.id))) == n_fans:
+                return engine
+    engine.dispose()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    engine = make_engine("prod-write-heavy", url = f"sqlite:///{path}")
+    ensure_schema(engine)
+    rng = random.Random(seed)
+    add_edges(engine, FAN_FOLLOWING, ((rng.randint(1, n_fans), rng.randint(1, n_fans)) for _ in range(n_edges)))
+    # fans 最後才寫入，中斷時下次會重新建立
+    bulk_insert(engine, Fan, ((f"Fan{x}",) for x in range(n_fans)))
+    return engine
+
+
+def sql_mutual(session, id):
+    stmt = (
+        select(a.following_id)
+        .join(b, (b.follower_id == a.following_id) & (b.following_id == a.follower_id))
+        .where(a.follower_id == id)
+        .order_by(a.following_id)
+    )
+    return session.scalars(stmt).all()
+
+
+def sql_suggestions(session, id, limit = 10):
+    following = select(c.following_id).where(c.follower_id == id)
+    common = func.count()
+    stmt = (
+        select(b.following_id, common)
+        .select_from(a)
+        .join(b, b.follower_id == a.following_id)
+        .where(a.follower_id == id, b.following_id != id, b.following_id.not_in(following))
+        .group_by(b.following_id)
+        .order_by(common.desc(), b.following_id)
+        .limit(limit)
+    )
+    return [tuple(row) for row in session.execute(stmt)]
+
+
+def sql_degree(session, id):
+    return session.scalar(select(func.count()).select_from(a).where(a.follower_id == id))
+
+
+def timed(fn, ids):
+    start = perf_counter()
+    results = [fn(id) for id in ids]
+    return (perf_counter() - start) / len(ids), results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Follower graph queries in SQL versus the in-memory graph index")
+    parser.add_argument("--fans", type = int, default = 1_000_000)
+    parser.add_argument("--edges", type = int, default = 10_000_000)
+    parser.add_argument("--samples", type = int, default = 200)
+    parser.add_argument("--data-dir", default = tempfile.gettempdir())
+    args = parser.parse_args()
+
+    engine = build(os.path.join(args.data_dir, f"graph_index_benchmark_{args.fans}_{args.edges}.db"),
+                   args.fans, args.edges)
+    start = perf_counter()
+    index = GraphIndex(FAN_FOLLOWING, Fan.following).load(engine)
+    load_time = perf_counter() - start
+    print(f"{args.fans:,} fans, {index.edge_count:,} edges: loaded in {load_time:.2f}s, "
+          f"{index.nbytes / 2**20:.1f} MiB ({index.nbytes / max(index.edge_count, 1):.1f} bytes/edge)")
+
+    ids = random.Random(2).sample(range(1, args.fans + 1), args.samples)
+    session = Session(engine)
+    cases = [
+        ("out degree", lambda id: sql_degree(session, id), index.out_degree),
+        ("mutual", lambda id: sql_mutual(session, id), index.mutual),
+        ("2-hop reach", lambda id: neighbourhood(session, id, 2), lambda id: index.reachable(id, 2)),
+        ("suggestions", lambda id: sql_suggestions(session, id), index.suggestions),
+    ]
+    print(f"{'query':<14}{'sql':>12}{'index':>12}{'speedup':>10}")
+    for label, sql, indexed in cases:
+        sql_time, expected = timed(sql, ids)
+        index_time, results = timed(indexed, ids)
+        assert results == expected, label
+        print(f"{label:<14}{sql_time * 1e6:>10.0f}µs{index_time * 1e6:>10.1f}µs{sql_time / index_time:>9.0f}x")
+    session.close()
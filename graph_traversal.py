@@ -0,0 +1,102 @@
+from dataclasses import dataclass, field
+
+from sqlalchemy import column, func, literal, select, table
+
+# Node.__repr__ 每走一步 next_node 就會發出一次查詢，Merchant / Fan 的追蹤關係也一樣
+# 這裡用一個 WITH RECURSIVE 查詢一次取回整條鏈或 k 步以內的鄰居
+# 遞迴部分使用 UNION 而不是 UNION ALL，已經走過的節點不會再加入，所以遇到循環 (例如 merchant1 -> 2 -> 3 -> 1) 也會停止
+
+
+@dataclass(frozen = True)
+class Edges:
+    table: str
+    source: str
+    target: str
+
+    def clause(self):
+        return table(self.table, column(self.source), column(self.target))
+
+
+NODE_CHAIN = Edges("node_associations", "current_node_id", "next_node_id")
+MERCHANT_FOLLOWING = Edges("following_association", "merchant_id", "following_id")
+FAN_FOLLOWING = Edges("fans_associations", "follower_id", "following_id")
+FAN_FOLLOWERS = Edges("fans_associations", "following_id", "follower_id")
+STUDENT_COURSES = Edges("student_course_link", "student_id", "course_id")
+COURSE_STUDENTS = Edges("student_course_link", "course_id", "student_id")
+
+
+@dataclass
+class Chain:
+    ids: list = field(default_factory = list)
+    # 如果最後一個節點又指回鏈上的某個節點，cycle_to 就是那個節點的 id
+    cycle_to: int = None
+
+    @property
+    def has_cycle(self):
+        return self.cycle_to is not None
+
+
+def reachable_cte(edges, start):
+    edge = edges.clause()
+    walk = select(literal(start).label("id")).cte("walk", recursive = True)
+    step = select(edge.c[edges.target]).where(edge.c[edges.source] == walk.c.id)
+    return walk.union(step), edge
+
+
+def _ordered(start, successor):
+    result = Chain()
+    seen = set()
+    node = start
+    while node is not None and node in successor:
+        if node in seen:
+            result.cycle_to = node
+            break
+        seen.add(node)
+        result.ids.append(node)
+        node = successor[node]
+    return result
+
+
+def chain(session, start, edges = NODE_CHAIN):
+    # 一次查詢取回 (節點, 下一個節點) 的對應，再在 Python 中依序串起來
+    # 有多個下一個節點時 (例如追蹤了多位 Merchant)，沿著 id 最小的那一個走
+    walk, edge = reachable_cte(edges, start)
+    stmt = (
+        select(walk.c.id, func.min(edge.c[edges.target]))
+        .select_from(walk)
+        .outerjoin(edge, edge.c[edges.source] == walk.c.id)
+        .group_by(walk.c.id)
+    )
+    return _ordered(start, dict(session.execute(stmt).all()))
+
+
+def neighbourhood(session, start, k, edges = FAN_FOLLOWING):
+    # 回傳 {id: 最少需要幾步}，不包含起點本身
+    edge = edges.clause()
+    walk = select(literal(start).label("id"), literal(0).label("hops")).cte("walk", recursive = True)
+    step = (
+        select(edge.c[edges.target], walk.c.hops + 1)
+        .where(edge.c[edges.source] == walk.c.id, walk.c.hops < k)
+    )
+    walk = walk.union(step)
+    stmt = select(walk.c.id, func.min(walk.c.hops)).where(walk.c.id != start).group_by(walk.c.id)
+    return dict(session.execute(stmt).all())
+
+
+def chain_objects(session, model, start, edges = NODE_CHAIN):
+    # 例如 chain_objects(session, Node, node1.id)，同一個查詢中一併載入 ORM 物件，依照鏈的順序回傳
+    walk, edge = reachable_cte(edges, start)
+    stmt = (
+        select(model, func.min(edge.c[edges.target]))
+        .select_from(walk)
+        .join(model, model.id == walk.c.id)
+        .outerjoin(edge, edge.c[edges.source] == walk.c.id)
+        .group_by(walk.c.id)
+    )
+    objects = {}
+    successor = {}
+    for obj, next_id in session.execute(stmt):
+        objects[obj.id] = obj
+        successor[obj.id] = next_id
+    result = _ordered(start, successor)
+    return [objects[id] for id in result.ids], result.cycle_to
@@ -0,0 +1,159 @@
+import argparse
+from dataclasses import dataclass
+
+from sqlalchemy import Index, MetaData, Table, create_engine, inspect, text
+
+from models import DATABASE_URL
+
+# 對常用查詢執行 EXPLAIN QUERY PLAN，找出全表掃描 (SCAN table) 與暫存 B-tree (USE TEMP B-TREE)，
+# 並依照「等值條件 -> 範圍條件或排序/群組 -> 其餘需要的欄位」的順序建議複合索引
+
+
+@dataclass
+class HotQuery:
+    name: str
+    sql: str
+    params: dict
+    table: str
+    equality: tuple = ()
+    range: tuple = ()
+    order: tuple = ()
+    covering: tuple = ()
+
+    def index_columns(self):
+        columns = list(self.equality) + list(self.range[:1] or self.order)
+        return columns + [column for column in self.covering if column not in columns]
+
+
+HOT_QUERIES = [
+    HotQuery("users_by_name", "SELECT * FROM users WHERE name = :name", {"name": "John Doe"},
+             "users", equality = ("name",)),
+    HotQuery("users_age_at_least", "SELECT id, name, age FROM users WHERE age >= :age", {"age": 30},
+             "users", range = ("age",), covering = ("sex", "name")),
+    HotQuery("users_order_by_age", "SELECT * FROM users ORDER BY age", {},
+             "users", order = ("age",), covering = ("sex",)),
+    HotQuery("users_count_by_sex", "SELECT sex, count(sex) FROM users GROUP BY sex", {},
+             "users", order = ("sex",), covering = ("age",)),
+    HotQuery("users_age_range_by_sex",
+             "SELECT sex, count(id) FROM users WHERE age > :low AND age < :high GROUP BY sex",
+             {"low": 20, "high": 50}, "users", range = ("age",), covering = ("sex",)),
+    HotQuery("teacher_recent_posts",
+             "SELECT * FROM posts WHERE teacher_id = :teacher_id ORDER BY id DESC LIMIT 10",
+             {"teacher_id": 1}, "posts", equality = ("teacher_id",), order = ("id",)),
+    HotQuery("teacher_posts_keyset",
+             "SELECT * FROM posts WHERE teacher_id = :teacher_id AND id < :id ORDER BY id DESC LIMIT 11",
+             {"teacher_id": 1, "id": 1000}, "posts", equality = ("teacher_id",), range = ("id",)),
+    HotQuery("teacher_sensitive_informations",
+             "SELECT * FROM sensitive_informations WHERE teacher_id = :teacher_id",
+             {"teacher_id": 1}, "sensitive_informations", equality = ("teacher_id",)),
+    HotQuery("student_courses",
+             "SELECT courses.* FROM courses JOIN student_course_link "
+             "ON courses.id = student_course_link.course_id WHERE student_course_link.student_id = :student_id",
+             {"student_id": 1}, "student_course_link", equality = ("student_id",), covering = ("course_id",)),
+    HotQuery("course_students",
+             "SELECT students.* FROM students JOIN student_course_link "
+             "ON students.id = student_course_link.student_id WHERE student_course_link.course_id = :course_id",
+             {"course_id": 1}, "student_course_link", equality = ("course_id",), covering = ("student_id",)),
+    HotQuery("fan_following",
+             "SELECT fans.* FROM fans JOIN fans_associations "
+             "ON fans.id = fans_associations.following_id WHERE fans_associations.follower_id = :fan_id",
+             {"fan_id": 1}, "fans_associations", equality = ("follower_id",), covering = ("following_id",)),
+    HotQuery("fan_followers",
+             "SELECT fans.* FROM fans JOIN fans_associations "
+             "ON fans.id = fans_associations.follower_id WHERE fans_associations.following_id = :fan_id",
+             {"fan_id": 1}, "fans_associations", equality = ("following_id",), covering = ("follower_id",)),
+    HotQuery("merchant_following",
+             "SELECT merchants.* FROM merchants JOIN following_association "
+             "ON merchants.id = following_association.following_id "
+             "WHERE following_association.merchant_id = :merchant_id",
+             {"merchant_id": 1}, "following_association", equality = ("merchant_id",), covering = ("following_id",)),
+    HotQuery("node_next",
+             "SELECT nodes.* FROM nodes JOIN node_associations "
+             "ON nodes.id = node_associations.next_node_id WHERE node_associations.current_node_id = :node_id",
+             {"node_id": 1}, "node_associations", equality = ("current_node_id",), covering = ("next_node_id",)),
+]
+
+
+def index_name(table, columns):
+    return f"ix_{table}_{'_'.join(columns)}"
+
+
+def explain(conn, query):
+    rows = conn.execute(text(f"EXPLAIN QUERY PLAN {query.sql}"), query.params).all()
+    return [row[-1] for row in rows]
+
+
+def problems(plan, table):
+    # "SCAN users" 是全表掃描；"SCAN users USING COVERING INDEX ..." 只掃描索引，不列入問題
+    found = []
+    for detail in plan:
+        if detail.startswith(f"SCAN {table}") and "INDEX" not in detail:
+            found.append(detail)
+        elif "USE TEMP B-TREE" in detail:
+            found.append(detail)
+    return found
+
+
+def advise(engine, queries = HOT_QUERIES):
+    report = []
+    inspector = inspect(engine)
+    with engine.connect() as conn:
+        for query in queries:
+            if not inspector.has_table(query.table):
+                continue
+            existing = [index["column_names"] for index in inspector.get_indexes(query.table)]
+            plan = explain(conn, query)
+            issues = problems(plan, query.table)
+            columns = query.index_columns()
+            proposal = None
+            if issues and columns not in existing:
+                names = ", ".join(f'"{column}"' for column in columns)
+                proposal = f'Index("{index_name(query.table, columns)}", {names})'
+            report.append({
+                "query": query.name,
+                "table": query.table,
+                "plan": plan,
+                "issues": issues,
+                "proposal": proposal,
+                "columns": columns,
+            })
+    return report
+
+
+def apply(engine, report):
+    # 在已經存在的資料庫上建立建議的索引 (create_all 不會替既有的表格補上索引)
+    metadata = MetaData()
+    created = []
+    for entry in report:
+        if entry["proposal"] is None:
+            continue
+        table_name = entry["table"]
+        if table_name in metadata.tables:
+            table = metadata.tables[table_name]
+        else:
+            table = Table(table_name, metadata, autoload_with = engine)
+        name = index_name(table_name, entry["columns"])
+        if name in {index.name for index in table.indexes}:
+            continue
+        index = Index(name, *[table.c[column] for column in entry["columns"]])
+        index.create(engine, checkfirst = True)
+        created.append(name)
+    return created
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Run EXPLAIN QUERY PLAN over the hot queries and propose indexes")
+    parser.add_argument("--url", default = DATABASE_URL)
+    parser.add_argument("--apply", action = "store_true", help = "create the proposed indexes")
+    args = parser.parse_args()
+
+    engine = create_engine(args.url)
+    report = advise(engine)
+    for entry in report:
+        status = "OK" if not entry["issues"] else "; ".join(entry["issues"])
+        print(f"{entry['query']:<32} {status}")
+        if entry["proposal"]:
+            print(f"{'':<32} -> {entry['proposal']}")
+    if args.apply:
+        for name in apply(engine, report):
+            print(f"Created {name}")
@@ -0,0 +1,219 @@
+import bisect
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
+from time import perf_counter
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# 取代 echo = True: echo 會把每一條 SQL 印到 stdout，太慢也無法統計
+# SqlInstrumentation 掛在 before_cursor_execute / after_cursor_execute 上，依「正規化後的 SQL」(fingerprint) 分組記錄
+# 執行次數、延遲分佈 (histogram)、影響或取回的筆數，並標記超過 slow_threshold 的慢查詢，例如:
+#   stats = SqlInstrumentation(sample_rate = 0.1, slow_threshold = 0.2).install(engine)
+#   ...
+#   print(stats.to_prometheus())
+# 沒有 install (或 uninstall 之後) 時不會掛上任何 event，完全沒有額外成本；sample_rate 可以降低正式環境的負擔
+# INSERT / UPDATE / DELETE 的 rows 為 cursor.rowcount；SELECT 執行當下無法得知筆數 (SQLite 的 rowcount 為 -1)，
+# 因此把 cursor 換成計數的包裝 (_CountingCursor)，在結果實際被 fetch 時才累加 rows
+
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_START = "_instrumentation_start"
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+_PARAMS = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)")
+_VALUES = re.compile(r"(VALUES\s*\(\?[^)]*\))(?:\s*,\s*\([^)]*\))+", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize = 4096)
+def fingerprint(statement):
+    # 把常數換成 ?，IN (?, ?, ?) 與多列 VALUES 收斂成一種寫法，讓只差在參數的 SQL 歸為同一類
+    statement = _STRING.sub("?", statement)
+    statement = _NUMBER.sub("?", statement)
+    statement = _PARAMS.sub("(?)", statement)
+    statement = _VALUES.sub(r"\1", statement)
+    return _SPACE.sub(" ", statement).strip()
+
+
+def query_id(fingerprint):
+    return hashlib.sha1(fingerprint.encode()).hexdigest()[:12]
+
+
+@dataclass
+class StatementStats:
+    fingerprint: str
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+    rows: int = 0
+    slow: int = 0
+    buckets: list = field(default_factory = lambda: [0] * (len(BUCKETS) + 1))
+
+    def record(self, elapsed, rows, slow):
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.rows += rows
+        self.slow += slow
+        self.buckets[bisect.bisect_left(BUCKETS, elapsed)] += 1
+
+    def quantile(self, q):
+        # 以 histogram 估計，回傳該百分位所在 bucket 的上界
+        target = q * self.count
+        seen = 0
+        for bound, count in zip((*BUCKETS, self.max), self.buckets):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        data = asdict(self)
+        data.update(
+            id = query_id(self.fingerprint),
+            mean = self.total / self.count if self.count else 0.0,
+            p50 = self.quantile(0.5),
+            p95 = self.quantile(0.95),
+            p99 = self.quantile(0.99),
+        )
+        return data
+
+
+class _CountingCursor:
+    # 包裝 DBAPI cursor，fetch 取回的筆數累加到 StatementStats.rows，其餘屬性直接轉交
+    __slots__ = ("_cursor", "_stats", "_lock")
+
+    def __init__(self, cursor, stats, lock):
+        self._cursor = cursor
+        self._stats = stats
+        self._lock = lock
+
+    def _count(self, rows):
+        with self._lock:
+            self._stats.rows += len(rows)
+        return rows
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._count((row,))
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        return self._count(self._cursor.fetchmany(*args, **kwargs))
+
+    def fetchall(self):
+        return self._count(self._cursor.fetchall())
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class SqlInstrumentation:
+    def __init__(self, sample_rate = 1.0, slow_threshold = 0.5, on_slow = None):
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.on_slow = on_slow or (lambda statement, elapsed: logger.warning(
+            "slow query (%.3fs): %s", elapsed, statement))
+        self.statements = {}
+        self._lock = threading.Lock()
+        self._target = None
+
+    def install(self, target = Engine):
+        # target 可以是 Engine 類別 (所有 engine) 或單一 engine
+        event.listen(target, "before_cursor_execute", self._before)
+        event.listen(target, "after_cursor_execute", self._after)
+        self._target = target
+        return self
+
+    def uninstall(self):
+        event.remove(self._target, "before_cursor_execute", self._before)
+        event.remove(self._target, "after_cursor_execute", self._after)
+        self._target = None
+
+    @property
+    def enabled(self):
+        return self._target is not None
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None and (self.sample_rate >= 1.0 or random.random() < self.sample_rate):
+            setattr(context, _START, perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, _START, None)
+        if start is None:
+            return
+        elapsed = perf_counter() - start
+        delattr(context, _START)
+        returns_rows = cursor.description is not None
+        rows = 0 if returns_rows else max(cursor.rowcount, 0)
+        slow = elapsed >= self.slow_threshold
+        key = fingerprint(statement)
+        with self._lock:
+            stats = self.statements.get(key)
+            if stats is None:
+                stats = self.statements[key] = StatementStats(key)
+            stats.record(elapsed, rows, slow)
+        if returns_rows and context.cursor is cursor:
+            # 之後由 SQLAlchemy 建立的 Result 透過 context.cursor 取資料
+            context.cursor = _CountingCursor(cursor, stats, self._lock)
+        if slow:
+            self.on_slow(statement, elapsed)
+
+    def reset(self):
+        with self._lock:
+            self.statements.clear()
+
+    def snapshot(self):
+        # 依總耗時由大到小排列
+        with self._lock:
+            summaries = [stats.summary() for stats in self.statements.values()]
+        return sorted(summaries, key = lambda summary: summary["total"], reverse = True)
+
+    def to_json(self, **kwargs):
+        return json.dumps({
+            "sample_rate": self.sample_rate,
+            "slow_threshold": self.slow_threshold,
+            "buckets": BUCKETS,
+            "statements": self.snapshot(),
+        }, **kwargs)
+
+    def to_prometheus(self, prefix = "sql"):
+        lines = [
+            f"# HELP {prefix}_statement_duration_seconds Statement latency by normalized statement.",
+            f"# TYPE {prefix}_statement_duration_seconds histogram",
+        ]
+        snapshot = self.snapshot()
+        for summary in snapshot:
+            labels = f'query="{summary["id"]}",statement="{_escape(summary["fingerprint"][:200])}"'
+            cumulative = 0
+            for bound, count in zip((*BUCKETS, "+Inf"), summary["buckets"]):
+                cumulative += count
+                lines.append(f'{prefix}_statement_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{prefix}_statement_duration_seconds_sum{{{labels}}} {summary['total']}")
+            lines.append(f"{prefix}_statement_duration_seconds_count{{{labels}}} {summary['count']}")
+        for name, key, help in (
+            ("statement_rows_total", "rows",
+             "Rows affected by INSERT/UPDATE/DELETE or fetched from SELECT statements."),
+            ("slow_statements_total", "slow", "Statements slower than the slow query threshold."),
+        ):
+            lines.append(f"# HELP {prefix}_{name} {help}")
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            lines.extend(f'{prefix}_{name}{{query="{summary["id"]}"}} {summary[key]}' for summary in snapshot)
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,53 @@
+import argparse
+import logging
+import os
+from time import perf_counter
+
+from sqlalchemy import create_engine, insert, select
+
+from instrumentation import SqlInstrumentation
+from models import User
+
+# 量測 instrumentation 對每條 SQL 增加的成本: 未安裝、echo = True (輸出導向 /dev/null)、取樣率為 0、1%、100%
+# 只要 engine 上掛了任何 event，SQLAlchemy 每條 SQL 都會多做一次 event dispatch，取樣率 0 時量到的就是這部分的成本
+
+
+def run(engine, n):
+    stmt = select(User).where(User.id == 1)
+    with engine.connect() as conn:
+        start = perf_counter()
+        for _ in range(n):
+            conn.execute(stmt).all()
+        return (perf_counter() - start) / n
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Per-statement overhead of SqlInstrumentation")
+    parser.add_argument("--statements", type = int, default = 50_000)
+    parser.add_argument("--repeat", type = int, default = 3)
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://")
+    User.__table__.create(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"name": "John Doe", "age": 30, "sex": "male"}])
+
+    # echo = True 的輸出改寫到 /dev/null，只量測格式化與寫出 log 的成本
+    logger = logging.getLogger("sqlalchemy.engine.Engine")
+    handlers = logger.handlers[:]
+    with open(os.devnull, "w") as devnull:
+        logger.handlers = [logging.StreamHandler(devnull)]
+        engine.echo = True
+        echo = min(run(engine, args.statements) for _ in range(args.repeat))
+        engine.echo = False
+        logger.handlers = handlers
+
+    baseline = min(run(engine, args.statements) for _ in range(args.repeat))
+    print(f"{'not installed':<16} {baseline * 1e6:7.2f} µs/statement")
+    print(f"{'echo=True':<16} {echo * 1e6:7.2f} µs/statement  (+{(echo - baseline) * 1e6:.2f} µs)")
+    for sample_rate in (0.0, 0.01, 1.0):
+        stats = SqlInstrumentation(sample_rate = sample_rate).install(engine)
+        elapsed = min(run(engine, args.statements) for _ in range(args.repeat))
+        stats.uninstall()
+        print(f"{f'sample_rate={sample_rate}':<16} {elapsed * 1e6:7.2f} µs/statement  (+{(elapsed - baseline) * 1e6:.2f} µs)")
+    print(stats.to_prometheus(), end = "")
@@ -0,0 +1,81 @@
+import argparse
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "12_Join_Types"))
+
+from join_types import (Address, Base, User, full_anti_join, full_outer_join, left_anti_join,  # noqa: E402
+                        right_anti_join, supports_full_join)
+
+# 比較 join_types.py 中各種 join 寫法在大量資料下的時間
+# 一半的使用者有地址，另外有同樣數量沒有被使用的地址
+
+INSERT_BATCH = 10_000
+
+
+def build(path, n_users):
+    if os.path.exists(path):
+        os.remove(path)
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for start in range(0, n_users, INSERT_BATCH):
+            stop = min(start + INSERT_BATCH, n_users)
+            conn.execute(insert(User), [
+                {"id": x, "first_name": f"First{x}", "last_name": f"Last{x}"} for x in range(start + 1, stop + 1)
+            ])
+            conn.execute(insert(Address), [
+                {"user_id": x if x % 2 else None, "data": f"{x} Random Address"} for x in range(start + 1, stop + 1)
+            ])
+    return engine
+
+
+def union(session):
+    # join_types.py 原本的寫法
+    left_join = session.query(User, Address).outerjoin(Address)
+    right_join = session.query(User, Address).outerjoin(User)
+    return left_join.union(right_join).all()
+
+
+def cases(engine):
+    # (名稱, 以 session 執行查詢的函式)
+    result = [
+        ("inner join", lambda session: session.query(User, Address).join(Address).all()),
+        ("left join", lambda session: session.query(User, Address).outerjoin(Address).all()),
+        ("left anti (IS NULL)", lambda session: session.query(User).outerjoin(Address).filter(Address.id == None).all()),
+        ("left anti (NOT EXISTS)", lambda session: session.scalars(left_anti_join(User, Address)).all()),
+        ("right anti (NOT EXISTS)", lambda session: session.scalars(right_anti_join(User, Address)).all()),
+        ("full anti (NOT EXISTS)", lambda session: session.execute(full_anti_join(User, Address)).all()),
+        ("full (UNION)", union),
+        ("full (UNION ALL)",
+         lambda session: session.execute(full_outer_join(engine, User, Address, native = False)).all()),
+    ]
+    if supports_full_join(engine):
+        result.append(("full (native)",
+                       lambda session: session.execute(full_outer_join(engine, User, Address, native = True)).all()))
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Compare join strategies in join_types.py")
+    parser.add_argument("--sizes", type = int, nargs = "+", default = [10_000, 100_000, 1_000_000])
+    parser.add_argument("--data-dir", default = tempfile.gettempdir())
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        engine = build(os.path.join(args.data_dir, "join_benchmark.db"), size)
+        Session = sessionmaker(bind = engine)
+        print(f"{size:,} users / {size:,} addresses")
+        for label, query in cases(engine):
+            # 每個案例使用新的 session，避免 identity map 中已有的物件影響結果
+            session = Session()
+            start = perf_counter()
+            rows = query(session)
+            print(f"  {label:<24} {perf_counter() - start:8.3f}s  {len(rows):>10,} rows")
+            session.close()
+        engine.dispose()
@@ -0,0 +1,128 @@
+import base64
+import json
+from dataclasses import dataclass
+
+from sqlalchemy import and_, or_, tuple_
+from sqlalchemy.orm import Query
+from sqlalchemy.orm.writeonly import WriteOnlyCollection
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import UnaryExpression
+
+# 以 keyset (seek) 取代 limit / offset 分頁
+# OFFSET N 需要先讀過並丟棄前 N 筆資料，頁數越深越慢；
+# keyset 分頁記住上一頁最後一筆的排序鍵，下一頁直接以 WHERE (排序鍵, id) < (上一頁的值) 從索引中定位，任何一頁的成本都相同
+# 排序鍵後面會自動補上主鍵，確保排序鍵相同的資料也有固定順序
+# 例如 (posts 有 (teacher_id, id) 的索引):
+#   page = paginate(session, teacher.posts, Post.id.desc())
+#   page = paginate(session, teacher.posts, Post.id.desc(), after = page.next_cursor)
+#   page = paginate(session, select(User), User.age, User.id, per_page = 50, after = cursor)
+
+PER_PAGE = 10
+
+
+@dataclass
+class Page:
+    items: list
+    next_cursor: str = None
+    previous_cursor: str = None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def encode_cursor(values):
+    # 游標對呼叫端而言是不透明的字串，可以直接放在 URL 中
+    return base64.urlsafe_b64encode(json.dumps(values, separators = (",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError as e:
+        raise ValueError(f"invalid pagination cursor: {cursor!r}") from e
+
+
+def _keys(order_by):
+    # 拆成 [(欄位, 是否為 desc)]，並補上主鍵
+    keys = []
+    for clause in order_by:
+        if isinstance(clause, UnaryExpression) and clause.modifier in (operators.desc_op, operators.asc_op):
+            keys.append((clause.element, clause.modifier is operators.desc_op))
+        else:
+            keys.append((clause.__clause_element__() if hasattr(clause, "__clause_element__") else clause, False))
+    columns = {column.key for column, _ in keys}
+    last_desc = keys[-1][1]
+    table = keys[0][0].table
+    keys.extend((column, last_desc) for column in table.primary_key.columns if column.key not in columns)
+    return keys
+
+
+def _seek(keys, values, backwards):
+    # 方向一致時使用 row value 比較，SQLite 可以直接以索引定位；方向混合時展開成 OR
+    def op(desc):
+        return operators.gt if desc == backwards else operators.lt
+
+    if len({desc for _, desc in keys}) == 1:
+        return op(keys[0][1])(tuple_(*[column for column, _ in keys]), tuple_(*values))
+    return or_(*[
+        and_(*[column == value for (column, _), value in zip(keys[:index], values)],
+             op(keys[index][1])(keys[index][0], values[index]))
+        for index in range(len(keys))
+    ])
+
+
+def _ordering(keys, backwards):
+    return [column.desc() if desc != backwards else column.asc() for column, desc in keys]
+
+
+def _single_entity(stmt):
+    # select(User) 回傳 User 物件，select(User.id, User.age) 則回傳 Row
+    descriptions = stmt.column_descriptions
+    return len(descriptions) == 1 and descriptions[0]["type"] is descriptions[0]["entity"]
+
+
+def paginate(session, query, *order_by, per_page = PER_PAGE, after = None, before = None):
+    # query 可以是 dynamic relationship (teacher.posts)、write_only relationship、session.query(...) 或 select(...)
+    # after 為上一頁的 next_cursor，before 為下一頁的 previous_cursor，兩者都沒有時回傳第一頁
+    if after is not None and before is not None:
+        raise ValueError("pass either after or before, not both")
+    keys = _keys(order_by)
+    backwards = before is not None
+    cursor = before if backwards else after
+    if isinstance(query, WriteOnlyCollection):
+        query = query.select()
+
+    criteria = []
+    if cursor is not None:
+        values = decode_cursor(cursor)
+        if len(values) != len(keys):
+            raise ValueError(f"pagination cursor has {len(values)} keys, expected {len(keys)}")
+        criteria.append(_seek(keys, values, backwards))
+    ordering = _ordering(keys, backwards)
+    if isinstance(query, Query):
+        rows = query.filter(*criteria).order_by(None).order_by(*ordering).limit(per_page + 1).all()
+    else:
+        stmt = query.where(*criteria).order_by(None).order_by(*ordering).limit(per_page + 1)
+        result = session.execute(stmt)
+        rows = result.scalars().all() if _single_entity(stmt) else result.all()
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    def cursor_of(row):
+        return encode_cursor([getattr(row, column.key) for column, _ in keys])
+
+    has_next = more if not backwards else True
+    has_previous = (more if backwards else cursor is not None) and bool(rows)
+    return Page(
+        items = rows,
+        next_cursor = cursor_of(rows[-1]) if rows and has_next else None,
+        previous_cursor = cursor_of(rows[0]) if has_previous else None,
+    )
@@ -0,0 +1,79 @@
+import argparse
+import os
+import tempfile
+from time import perf_counter
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from keyset import paginate
+from lazy_loading import Post, Teacher
+
+# 比較 teacher.posts 以 offset 與 keyset 分頁時，第 N 頁的查詢時間
+# 兩位老師的文章交錯寫入，因此查詢必須依 teacher_id 篩選，(teacher_id, id) 的索引才會派上用場
+
+PER_PAGE = 10
+INSERT_BATCH = 10_000
+
+
+def build_dataset(path, n_pages):
+    if os.path.exists(path):
+        os.remove(path)
+    engine = create_engine(f"sqlite:///{path}")
+    for table in (Teacher.__table__, Post.__table__):
+        table.create(engine)
+    n_posts = 2 * n_pages * PER_PAGE
+    with engine.begin() as conn:
+        conn.execute(insert(Teacher), [{"id": 1, "name": "Zhen"}, {"id": 2, "name": "Monica"}])
+        for start in range(0, n_posts, INSERT_BATCH):
+            conn.execute(insert(Post), [
+                {"content": f"Content {x}", "teacher_id": 1 + x % 2}
+                for x in range(start, min(start + INSERT_BATCH, n_posts))
+            ])
+    return engine
+
+
+def offset_page(teacher, page):
+    return teacher.posts.order_by(Post.id.desc()).offset(page * PER_PAGE).limit(PER_PAGE).all()
+
+
+def timed(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        result = func()
+        best = min(best, perf_counter() - start)
+    return best, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Compare offset and keyset pagination of Teacher.posts")
+    parser.add_argument("--pages", type = int, default = 10_000)
+    parser.add_argument("--checkpoints", type = int, nargs = "+", default = [1, 10, 100, 1_000, 10_000])
+    parser.add_argument("--repeat", type = int, default = 5)
+    parser.add_argument("--data-dir", default = tempfile.gettempdir())
+    args = parser.parse_args()
+
+    engine = build_dataset(os.path.join(args.data_dir, "keyset_benchmark.db"), args.pages)
+    session = sessionmaker(bind = engine)()
+    teacher = session.get(Teacher, 1)
+
+    # 依序走過每一頁取得各頁的游標，keyset 本來就只能從上一頁往下走
+    checkpoints = sorted(page for page in args.checkpoints if page <= args.pages)
+    cursors = {}
+    cursor = None
+    start = perf_counter()
+    for number in range(1, args.pages + 1):
+        if number in checkpoints:
+            cursors[number] = cursor
+        page = paginate(session, teacher.posts, Post.id.desc(), after = cursor)
+        cursor = page.next_cursor
+    walk = perf_counter() - start
+    print(f"walked {args.pages:,} keyset pages in {walk:.2f}s ({walk / args.pages * 1000:.3f} ms/page)")
+
+    for number in checkpoints:
+        offset_time, expected = timed(lambda: offset_page(teacher, number - 1), args.repeat)
+        keyset_time, page = timed(
+            lambda: paginate(session, teacher.posts, Post.id.desc(), after = cursors[number]), args.repeat)
+        assert [post.id for post in page.items] == [post.id for post in expected]
+        print(f"page {number:>6,}  offset {offset_time * 1000:8.3f} ms   keyset {keyset_time * 1000:8.3f} ms")
@@ -1,12 +1,11 @@
-from sqlalchemy import (Column, ForeignKey, Integer, String, create_engine, Table, Text)
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker, joinedload
-from models import engine
+from sqlalchemy import (Column, ForeignKey, Index, Integer, String, create_engine, Table, Text)
+from sqlalchemy.orm import relationship, sessionmaker, joinedload
+from models import Base, engine, ensure_schema, fts_ddl
+from keyset import paginate
+from prepared_queries import registry
 from time import perf_counter
 
 Session = sessionmaker(bind = engine)
-session = Session()
-
-Base = declarative_base()
 
 class Teacher(Base):
     __tablename__ = 'teachers'
@@ -25,6 +24,13 @@ class Teacher(Base):
 
 class Post(Base):
     __tablename__ = 'posts'
+    # teacher.posts 依 id 排序並以 keyset 分頁 (keyset.paginate)，(teacher_id, id) 讓每一頁都能直接由索引定位
+    # (teacher_id, id) 取代了原本 teacher_id 上的單欄索引，既有資料庫中舊的 ix_posts_teacher_id 要另外刪除，否則每次寫入仍要維護它
+    # content 的全文索引 posts_fts 由 trigger 同步，以 search.POST_SEARCH 查詢
+    __table_args__ = (
+        Index("ix_posts_teacher_id_id", "teacher_id", "id"),
+        {"info": {"ddl": ["DROP INDEX IF EXISTS ix_posts_teacher_id", *fts_ddl("posts", ("content",))]}},
+    )
     id = Column(Integer, primary_key= True)
     content = Column(Text)
     teacher_id = Column(Integer, ForeignKey('teachers.id'))
@@ -34,131 +40,149 @@ class Post(Base):
     
 class SensitiveInformation(Base):
     __tablename__ = 'sensitive_informations'
+    __table_args__ = {"info": {"ddl": fts_ddl("sensitive_informations", ("content",))}}
     id = Column(Integer, primary_key= True)
     content = Column(Text)
-    teacher_id = Column(Integer, ForeignKey('teachers.id'))
+    teacher_id = Column(Integer, ForeignKey('teachers.id'), index = True)
 
     def __repr__(self):
         return f"<SensitiveInformation {self.id}>"
 
-Base.metadata.create_all(engine)
-
-# teacher1 = Teacher(
-#     name = "Monica",
-#     posts = [
-#         Post(content = f"This is the content for {x}")
-#         for x in range(1, 5)
-#     ]
-# )
-# session.add(teacher1)
-
-# teacher1 = session.query(Teacher).first()
-# print(teacher1)
-# print(f"Accessing Posts specifically: {teacher1.posts}")
-
-# 這邊舉例 lazy = select 可能會遇到的問題
-# 每建立一個 Teacher 就會建立 5 個留言
-# 由於 Teacher 中的 posts 屬性的 lazy = select，因此每抓出一個老師就會將留言加載一次
-# session.add_all(
-#     [
-#         Teacher(
-#             name = f"Teacher{y}",
-#             posts =[
-#                 Post(content = f"This is the latest content for {y * 5 + x}")
-#                 for x in range(5)
-#             ]
-#         ) for y in range(1000,1010)
-#     ]
-# )
-# session.commit()
-# print('\n Accessing All Teachers Posts')
-# start = perf_counter()
-# teachers = session.query(Teacher).all()
-# for teacher in teachers:
-#     print(teacher.posts)
-# print(f"Done in: {perf_counter() - start}")
-
-# 下面為 lazy = joined 時的資料建構範例
-# session.add_all(
-#     [
-#         Teacher(
-#             name = f"Teacher{y}",
-#             latest_post =Post(content = f"This is the latest content for {y}")
-#         ) for y in range(1000,1010)
-#     ]
-# )
-# session.commit()
-# teachers = session.query(Teacher).all()
-# for teacher in teachers:
-#     print(teacher.name, teacher.latest_post.content)
-
-# 下面為 lazy = raise 時建構資料的範例
-# session.add_all(
-#     [
-#         Teacher(
-#             name = f"Teacher{y}",
-#             sensitive_informations = [
-#                 SensitiveInformation(
-#                     content = f"This is a sensitive information for Teacher{y}"
-#                 )
-#             ]
-#         )for y in range(10)
-#     ]
-# )
-# session.commit()
-# teachers = session.query(Teacher).options(joinedload(Teacher.sensitive_informations)).all()
-# for teacher in teachers:
-#     print(teacher.name)
-#     try:
-#         for information in teacher.sensitive_informations:
-#             print(information.content)
-#     except Exception as e:
-#         print("SensitiveInformation cannot be accessed directly:", e)
-
-# 下面為使用 lazy = subquery 建立資料的寫法
-# session.add_all(
-#     [
-#         Teacher(
-#             name = f"Teacher{y}",
-#             posts = [
-#                 Post(
-#                     content = f"This is the content for {y * 5 + x}"
-#                 )
-#                 for x in range(5)
-#             ]
-#         )for y in range(10)
-#     ]
-# )
-# session.commit()
-# teachers = session.query(Teacher).all()
-# for teacher in teachers:
-#     print(teacher.name)
-#     for post in teacher.posts:
-#         print(post.content)
-
-# 下面為使用 lazy = write_only 建立資料的方式
-# teacher = session.query(Teacher).first()
-# print(teacher.posts) #  lazy = write_only，表示該關係僅用於寫入。因此，當您嘗試訪問 teacher.posts 時，會出現錯誤或無效的結果
-# teacher1 = session.query(Teacher).filter_by(name = "Teacher1000").first()
-# new_post = Post(content = "This is a new line !!!!!")
-# teacher1.posts.add(new_post) 
-# session.commit()
-
-# 下面使用 lazy = dynamic 建立資料的方式
-# session.add(
-#     Teacher(
-#         name = "Zhen",
-#         posts = [
-#             Post(
-#                 content = f"Content {x}"
-#             )for x in range(50)
-#         ]
-#     )
-# )
-# session.commit()
-teacher = session.query(Teacher).filter_by(name = "Zhen").first()
-print(teacher.posts)
-
-recent_posts = teacher.posts.order_by(Post.id.desc()).limit(10).all()
-for post in recent_posts:
-    print(post.content)
\ No newline at end of file
+
+# 常用的查詢可以事先註冊，例如 registry.first(session, "teacher_by_name", name = "Zhen")
+registry.register_lookup("teacher_by_name", Teacher, Teacher.name)
+
+
+def main():
+    ensure_schema()
+    session = Session()
+
+    # teacher1 = Teacher(
+    #     name = "Monica",
+    #     posts = [
+    #         Post(content = f"This is the content for {x}")
+    #         for x in range(1, 5)
+    #     ]
+    # )
+    # session.add(teacher1)
+
+    # teacher1 = session.query(Teacher).first()
+    # print(teacher1)
+    # print(f"Accessing Posts specifically: {teacher1.posts}")
+
+    # 這邊舉例 lazy = select 可能會遇到的問題
+    # 每建立一個 Teacher 就會建立 5 個留言
+    # 由於 Teacher 中的 posts 屬性的 lazy = select，因此每抓出一個老師就會將留言加載一次
+    # session.add_all(
+    #     [
+    #         Teacher(
+    #             name = f"Teacher{y}",
+    #             posts =[
+    #                 Post(content = f"This is the latest content for {y * 5 + x}")
+    #                 for x in range(5)
+    #             ]
+    #         ) for y in range(1000,1010)
+    #     ]
+    # )
+    # session.commit()
+    # print('\n Accessing All Teachers Posts')
+    # start = perf_counter()
+    # teachers = session.query(Teacher).all()
+    # for teacher in teachers:
+    #     print(teacher.posts)
+    # print(f"Done in: {perf_counter() - start}")
+
+    # 下面為 lazy = joined 時的資料建構範例
+    # session.add_all(
+    #     [
+    #         Teacher(
+    #             name = f"Teacher{y}",
+    #             latest_post =Post(content = f"This is the latest content for {y}")
+    #         ) for y in range(1000,1010)
+    #     ]
+    # )
+    # session.commit()
+    # teachers = session.query(Teacher).all()
+    # for teacher in teachers:
+    #     print(teacher.name, teacher.latest_post.content)
+
+    # 下面為 lazy = raise 時建構資料的範例
+    # session.add_all(
+    #     [
+    #         Teacher(
+    #             name = f"Teacher{y}",
+    #             sensitive_informations = [
+    #                 SensitiveInformation(
+    #                     content = f"This is a sensitive information for Teacher{y}"
+    #                 )
+    #             ]
+    #         )for y in range(10)
+    #     ]
+    # )
+    # session.commit()
+    # teachers = session.query(Teacher).options(joinedload(Teacher.sensitive_informations)).all()
+    # for teacher in teachers:
+    #     print(teacher.name)
+    #     try:
+    #         for information in teacher.sensitive_informations:
+    #             print(information.content)
+    #     except Exception as e:
+    #         print("SensitiveInformation cannot be accessed directly:", e)
+
+    # 下面為使用 lazy = subquery 建立資料的寫法
+    # session.add_all(
+    #     [
+    #         Teacher(
+    #             name = f"Teacher{y}",
+    #             posts = [
+    #                 Post(
+    #                     content = f"This is the content for {y * 5 + x}"
+    #                 )
+    #                 for x in range(5)
+    #             ]
+    #         )for y in range(10)
+    #     ]
+    # )
+    # session.commit()
+    # teachers = session.query(Teacher).all()
+    # for teacher in teachers:
+    #     print(teacher.name)
+    #     for post in teacher.posts:
+    #         print(post.content)
+
+    # 下面為使用 lazy = write_only 建立資料的方式
+    # teacher = session.query(Teacher).first()
+    # print(teacher.posts) #  lazy = write_only，表示該關係僅用於寫入。因此，當您嘗試訪問 teacher.posts 時，會出現錯誤或無效的結果
+    # teacher1 = session.query(Teacher).filter_by(name = "Teacher1000").first()
+    # new_post = Post(content = "This is a new line !!!!!")
+    # teacher1.posts.add(new_post) 
+    # session.commit()
+
+    # 下面使用 lazy = dynamic 建立資料的方式
+    # session.add(
+    #     Teacher(
+    #         name = "Zhen",
+    #         posts = [
+    #             Post(
+    #                 content = f"Content {x}"
+    #             )for x in range(50)
+    #         ]
+    #     )
+    # )
+    # session.commit()
+    teacher = session.query(Teacher).filter_by(name = "Zhen").first()
+    print(teacher.posts)
+
+    recent_posts = teacher.posts.order_by(Post.id.desc()).limit(10).all()
+    for post in recent_posts:
+        print(post.content)
+
+    # 往後翻頁時不要使用 offset，改用 keyset 分頁，每一頁都只需要從索引定位
+    page = paginate(session, teacher.posts, Post.id.desc())
+    while page.has_next:
+        page = paginate(session, teacher.posts, Post.id.desc(), after = page.next_cursor)
+        print([post.id for post in page.items])
+
+
+if __name__ == "__main__":
+    main()
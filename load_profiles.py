@@ -0,0 +1,201 @@
+import threading
+import weakref
+from collections import defaultdict
+from dataclasses import dataclass
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import undefer, undefer_group
+
+# deferred 欄位依 group 分組，每個呼叫端以「載入設定」(profile) 指定要一併載入哪些 group，例如:
+#   profiles.register(UserLegacy, "summary", "display")
+#   session.scalars(profiles.select(UserLegacy, "summary"))
+# 沒有 group 的 deferred 欄位以屬性名稱當作 group 名稱
+#
+# DeferredAccessTracker 記錄以每個 profile 載入的物件之後實際存取了哪些 deferred 欄位，
+# 並以「來回次數 x ROUND_TRIP_BYTES + 傳輸的位元組」估算成本，建議哪些 group 應該在查詢時一併載入
+# 以 LoadProfiles(adaptive = True) 搭配 tracker 時，累積足夠的樣本後會自動套用建議
+
+ROUND_TRIP_BYTES = 4096
+_PROFILE = "load_profile"
+DEFAULT = "default"
+
+
+def deferred_groups(model):
+    # {group 名稱: [屬性名稱, ...]}
+    groups = defaultdict(list)
+    for prop in inspect(model).column_attrs:
+        if prop.deferred:
+            groups[prop.group or prop.key].append(prop.key)
+    return dict(groups)
+
+
+def _size(value):
+    if value is None:
+        return 0
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    return 8
+
+
+def _profile(context):
+    # profile 可以設定在 statement 上 (LoadProfiles.select / query)，也可以在 execute 時傳入
+    return context.execution_options.get(_PROFILE) or context.query.get_execution_options().get(_PROFILE, DEFAULT)
+
+
+@dataclass
+class Recommendation:
+    model: str
+    profile: str
+    undefer: tuple
+    loads: int
+    accesses: dict
+
+    def __str__(self):
+        groups = ", ".join(self.undefer) or "nothing"
+        return f"{self.model} profile {self.profile!r} ({self.loads} loads): undefer {groups}"
+
+
+class LoadProfiles:
+    def __init__(self, tracker = None, adaptive = False):
+        self.profiles = {}
+        self.tracker = tracker
+        self.adaptive = adaptive
+
+    def register(self, model, name, *groups):
+        unknown = set(groups) - set(deferred_groups(model))
+        if unknown:
+            raise ValueError(f"{model.__name__} has no deferred group(s) {sorted(unknown)}")
+        self.profiles[(model, name)] = tuple(groups)
+
+    def groups(self, model, name = DEFAULT):
+        if (model, name) not in self.profiles and name != DEFAULT:
+            raise KeyError(f"no load profile {name!r} registered for {model.__name__}")
+        groups = list(self.profiles.get((model, name), ()))
+        if self.adaptive and self.tracker is not None:
+            groups += [group for group in self.tracker.recommend(model, name) if group not in groups]
+        return groups
+
+    def options(self, model, name = DEFAULT):
+        known = deferred_groups(model)
+        options = []
+        for group in self.groups(model, name):
+            keys = known[group]
+            # 沒有 group 的欄位只能以 undefer() 指定
+            if len(keys) == 1 and keys[0] == group:
+                options.append(undefer(getattr(model, group)))
+            else:
+                options.append(undefer_group(group))
+        return options
+
+    def select(self, model, name = DEFAULT):
+        # execution_options 中記錄 profile 名稱，讓 tracker 知道物件是以哪個 profile 載入
+        return select(model).options(*self.options(model, name)).execution_options(**{_PROFILE: name})
+
+    def query(self, session, model, name = DEFAULT):
+        return session.query(model).options(*self.options(model, name)).execution_options(**{_PROFILE: name})
+
+
+class DeferredAccessTracker:
+    def __init__(self, round_trip_bytes = ROUND_TRIP_BYTES, min_loads = 100):
+        self.round_trip_bytes = round_trip_bytes
+        self.min_loads = min_loads
+        # (model, profile) -> 載入次數、每個 group 以 deferred 載入的次數與之後被存取的次數、觀察到的總位元組與筆數
+        self.loads = defaultdict(int)
+        self.deferred_loads = defaultdict(lambda: defaultdict(int))
+        self.accesses = defaultdict(lambda: defaultdict(int))
+        self.bytes = defaultdict(lambda: defaultdict(int))
+        self.samples = defaultdict(lambda: defaultdict(int))
+        # 物件 -> (model, profile, 尚未載入的 group)
+        self._pending = weakref.WeakKeyDictionary()
+        self._groups = {}
+        self._lock = threading.Lock()
+        self._target = None
+
+    def install(self, target):
+        # target 為 declarative Base 或單一模型，Base 會套用到所有模型
+        event.listen(target, "load", self._load, propagate = True)
+        event.listen(target, "refresh", self._refresh, propagate = True)
+        self._target = target
+        return self
+
+    def uninstall(self):
+        event.remove(self._target, "load", self._load)
+        event.remove(self._target, "refresh", self._refresh)
+        self._target = None
+
+    def _model_groups(self, model):
+        if model not in self._groups:
+            self._groups[model] = deferred_groups(model)
+        return self._groups[model]
+
+    def _load(self, target, context):
+        model = type(target)
+        groups = self._model_groups(model)
+        if not groups:
+            return
+        key = (model, _profile(context))
+        state = inspect(target)
+        unloaded = state.unloaded
+        pending = set()
+        with self._lock:
+            self.loads[key] += 1
+            for group, keys in groups.items():
+                if unloaded.intersection(keys):
+                    pending.add(group)
+                    self.deferred_loads[key][group] += 1
+                else:
+                    # 查詢時已經一併載入，順便記錄資料大小
+                    self.bytes[key][group] += sum(_size(state.dict.get(name)) for name in keys)
+                    self.samples[key][group] += 1
+        if pending:
+            self._pending[target] = (key, pending)
+
+    def _refresh(self, target, context, attrs):
+        entry = self._pending.get(target)
+        if entry is None or not attrs:
+            return
+        key, pending = entry
+        groups = self._model_groups(type(target))
+        state = inspect(target)
+        with self._lock:
+            for group in [group for group in pending if set(groups[group]) & set(attrs)]:
+                pending.discard(group)
+                self.accesses[key][group] += 1
+                self.bytes[key][group] += sum(_size(state.dict.get(name)) for name in groups[group])
+                self.samples[key][group] += 1
+        if not pending:
+            del self._pending[target]
+
+    def cost(self, model, profile, group, undeferred):
+        # 估算每載入一個物件，group 保持 deferred 或一併載入的平均成本 (位元組)
+        # 存取比例只以 group 為 deferred 時的載入計算，自動套用建議之後比例也不會因此改變
+        key = (model, profile)
+        samples = self.samples[key][group]
+        average = self.bytes[key][group] / samples if samples else 0
+        if undeferred:
+            return average
+        loads = self.deferred_loads[key][group]
+        ratio = self.accesses[key][group] / loads if loads else 0
+        return ratio * (self.round_trip_bytes + average)
+
+    def recommend(self, model, profile = DEFAULT):
+        # 回傳應該一併載入的 group，樣本不足時不做任何建議
+        key = (model, profile)
+        return [
+            group for group in self._model_groups(model)
+            if self.deferred_loads[key][group] >= self.min_loads
+            and self.cost(model, profile, group, True) < self.cost(model, profile, group, False)
+        ]
+
+    def report(self):
+        with self._lock:
+            keys = list(self.loads)
+        return [
+            Recommendation(model.__name__, profile, tuple(self.recommend(model, profile)),
+                           self.loads[(model, profile)], dict(self.accesses[(model, profile)]))
+            for model, profile in keys
+        ]
+
+
+# 共用的 profile 設定，例如 deferred_loading.py 在 import 時註冊 UserLegacy 的 profile
+profiles = LoadProfiles()
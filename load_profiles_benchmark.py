@@ -0,0 +1,70 @@
+import argparse
+import os
+import tempfile
+from time import perf_counter
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from bulk_insert import bulk_insert
+from deferred_loading import UserLegacy
+from load_profiles import DeferredAccessTracker, LoadProfiles
+from models import Base
+
+# 模擬列表頁: 載入一批 UserLegacy 後呼叫 repr() (會存取 deferred 的 nickname)，偶爾查看 other_value
+# 比較固定的 profile 與 adaptive 模式 (先以 tracker 收集存取紀錄，再自動套用建議) 的查詢數與時間
+
+
+def build(path, n_rows):
+    if os.path.exists(path):
+        os.remove(path)
+    engine = create_engine(f"sqlite:///{path}")
+    UserLegacy.__table__.create(engine)
+    bulk_insert(engine, UserLegacy, (
+        {"nickname": f"nick{x}", "first_name": f"First{x}", "last_name": f"Last{x}", "other_value": "x" * 2000}
+        for x in range(n_rows)
+    ))
+    return engine
+
+
+def workload(Session, profiles, profile, n_rows):
+    session = Session()
+    users = session.scalars(profiles.select(UserLegacy, profile).limit(n_rows)).all()
+    for user in users:
+        repr(user)
+        if user.id % 50 == 0:
+            user.other_value
+    session.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Round trips of fixed and adaptive deferred-column load profiles")
+    parser.add_argument("--rows", type = int, default = 2_000)
+    parser.add_argument("--data-dir", default = tempfile.gettempdir())
+    args = parser.parse_args()
+
+    engine = build(os.path.join(args.data_dir, "load_profiles_benchmark.db"), args.rows)
+    Session = sessionmaker(bind = engine)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *event_args: statements.append(1))
+
+    def run(label, profiles, profile):
+        groups = profiles.groups(UserLegacy, profile)
+        statements.clear()
+        start = perf_counter()
+        workload(Session, profiles, profile, args.rows)
+        elapsed = perf_counter() - start
+        print(f"{label:<20} {len(statements):>6} statements {elapsed * 1000:8.1f} ms  undefer {groups}")
+
+    fixed = LoadProfiles()
+    fixed.register(UserLegacy, "full", "display", "name", "extra")
+    run("default", fixed, "default")
+    run("full", fixed, "full")
+
+    tracker = DeferredAccessTracker().install(Base)
+    adaptive = LoadProfiles(tracker = tracker, adaptive = True)
+    run("adaptive (learning)", adaptive, "default")
+    run("adaptive (applied)", adaptive, "default")
+    for recommendation in tracker.report():
+        print(recommendation)
+    tracker.uninstall()
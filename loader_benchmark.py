@@ -0,0 +1,192 @@
+import argparse
+import json
+import os
+import resource
+import sqlite3
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from time import perf_counter
+
+from sqlalchemy import (Column, ForeignKey, Integer, String, Text, create_engine, event, insert)
+from sqlalchemy.orm import declarative_base, relationship, sessionmaker, joinedload, selectinload
+
+# lazy_loading.py 是手動切換註解來比較不同的 lazy 設定，這裡把每一種設定都跑一次
+# 每個案例: (relationship 的 lazy 參數, 查詢時額外加上的 loader option)
+CASES = {
+    "select": ("select", None),
+    "selectin": ("selectin", None),
+    "joined": ("joined", None),
+    "subquery": ("subquery", None),
+    "dynamic": ("dynamic", None),
+    "write_only": ("write_only", None),
+    "select+joinedload": ("select", joinedload),
+    "select+selectinload": ("select", selectinload),
+}
+
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000]
+POSTS_PER_TEACHER = 5
+INSERT_BATCH = 10_000
+
+
+# 每個案例實際由 cursor 取回的資料列數；joined 的每位 teacher 會隨著每篇 post 重複一列，與載入的物件數不同
+# 以自訂的 sqlite3 Connection / Cursor 在 fetch 時計數
+# (SQLAlchemy 的 pysqlite dialect 只透過 fetchone / fetchmany / fetchall 取資料)
+rows_fetched = 0
+
+
+class CountingCursor(sqlite3.Cursor):
+    def _count(self, rows):
+        global rows_fetched
+        rows_fetched += len(rows)
+        return rows
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            self._count((row,))
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        return self._count(super().fetchmany(*args, **kwargs))
+
+    def fetchall(self):
+        return self._count(super().fetchall())
+
+
+class CountingConnection(sqlite3.Connection):
+    def cursor(self, factory = CountingCursor):
+        return super().cursor(factory)
+
+
+def make_models(lazy):
+    # 每個 lazy 設定都需要一組新的 Base，表格結構與 lazy_loading.Teacher / Post 相同
+    Base = declarative_base()
+
+    class Teacher(Base):
+        __tablename__ = 'teachers'
+        id = Column(Integer, primary_key=True)
+        name = Column(String)
+        posts = relationship('Post', backref = 'teacher', lazy = lazy)
+
+    class Post(Base):
+        __tablename__ = 'posts'
+        id = Column(Integer, primary_key= True)
+        content = Column(Text)
+        teacher_id = Column(Integer, ForeignKey('teachers.id'))
+
+    return Base, Teacher, Post
+
+
+def build_dataset(path, n_posts):
+    # 資料集只建立一次，之後的案例都重複使用同一個檔案
+    if os.path.exists(path):
+        return
+    Base, Teacher, Post = make_models("select")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    n_teachers = max(1, n_posts // POSTS_PER_TEACHER)
+    with engine.begin() as conn:
+        conn.execute(insert(Teacher), [{"id": y, "name": f"Teacher{y}"} for y in range(1, n_teachers + 1)])
+        for start in range(0, n_posts, INSERT_BATCH):
+            conn.execute(insert(Post), [
+                {
+                    "id": x + 1,
+                    "content": f"This is the latest content for {x}",
+                    "teacher_id": x // POSTS_PER_TEACHER + 1,
+                }
+                for x in range(start, min(start + INSERT_BATCH, n_posts))
+            ])
+    engine.dispose()
+
+
+def run_case(path, case):
+    # 在獨立的子行程中執行，這樣 ru_maxrss 才代表這個案例自己的記憶體峰值
+    lazy, option = CASES[case]
+    Base, Teacher, Post = make_models(lazy)
+    engine = create_engine(f"sqlite:///{path}", connect_args = {"factory": CountingConnection})
+    statements = 0
+    objects_loaded = 0
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        nonlocal statements
+        statements += 1
+
+    @event.listens_for(Base, "load", propagate = True)
+    def count_load(target, context):
+        nonlocal objects_loaded
+        objects_loaded += 1
+
+    # 第一次連線時 dialect 的初始化查詢不列入計數
+    global rows_fetched
+    with engine.connect():
+        rows_fetched = 0
+
+    session = sessionmaker(bind = engine)()
+    start = perf_counter()
+    query = session.query(Teacher)
+    if option is not None:
+        query = query.options(option(Teacher.posts))
+    teachers = query.all()
+    n_posts = 0
+    for teacher in teachers:
+        if lazy == "dynamic":
+            posts = teacher.posts.all()
+        elif lazy == "write_only":
+            # write_only 無法直接讀取，必須明確地執行 select()
+            posts = session.scalars(teacher.posts.select()).all()
+        else:
+            posts = teacher.posts
+        n_posts += len(posts)
+    elapsed = perf_counter() - start
+    session.close()
+    engine.dispose()
+
+    return {
+        "case": case,
+        "lazy": lazy,
+        "option": option.__name__ if option is not None else None,
+        "teachers": len(teachers),
+        "posts": n_posts,
+        "wall_time": elapsed,
+        "statements": statements,
+        "rows_fetched": rows_fetched,
+        "objects_loaded": objects_loaded,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def run(sizes, cases, data_dir):
+    results = []
+    ctx = get_context("spawn")
+    for size in sizes:
+        path = os.path.join(data_dir, f"loader_benchmark_{size}.db")
+        build_dataset(path, size)
+        for case in cases:
+            with ProcessPoolExecutor(max_workers = 1, mp_context = ctx) as pool:
+                result = pool.submit(run_case, path, case).result()
+            result["size"] = size
+            results.append(result)
+            print(
+                f"{size:>9} {case:<20} {result['wall_time']:>9.3f}s "
+                f"statements={result['statements']:<8} rows={result['rows_fetched']:<9} "
+                f"objects={result['objects_loaded']:<9} "
+                f"rss={result['peak_rss_kb']}KB"
+            )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Benchmark Teacher.posts loader strategies")
+    parser.add_argument("--sizes", type = int, nargs = "+", default = DEFAULT_SIZES,
+                        help = "number of Post rows in each dataset")
+    parser.add_argument("--cases", nargs = "+", choices = list(CASES), default = list(CASES))
+    parser.add_argument("--data-dir", default = tempfile.gettempdir())
+    parser.add_argument("--output", default = "loader_benchmark.json")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.cases, args.data_dir)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent = 2)
+    print(f"Results written to {args.output}")
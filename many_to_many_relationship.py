@@ -1,11 +1,9 @@
-from sqlalchemy import (Column, ForeignKey, Integer, String, create_engine, Table)
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker
-from models import engine
+from sqlalchemy import (Column, ForeignKey, Index, Integer, String, create_engine, Table)
+from sqlalchemy.orm import relationship, sessionmaker
+from models import Base, dedupe_ddl, engine, ensure_schema
+from prepared_queries import registry
 
 Session = sessionmaker(bind = engine)
-session = Session()
-
-Base = declarative_base()
 
 # Association Table
 # student_course_link = Table('student_course', Base.metadata,
@@ -14,6 +12,13 @@ Base = declarative_base()
 # 上面的寫法也可以使用 class 來建構
 class StudentCourse(Base):
     __tablename__ = 'student_course_link'
+    # 同一位學生與課程只能有一筆，bulk_edges.add_edges 以 INSERT OR IGNORE 略過重複的資料
+    __table_args__ = (
+        Index('uq_student_course_link_student_id_course_id', 'student_id', 'course_id', unique = True),
+        Index('ix_student_course_link_course_id_student_id', 'course_id', 'student_id'),
+        {"info": {"ddl": dedupe_ddl('student_course_link', ('student_id', 'course_id'),
+                                    replaces = 'ix_student_course_link_student_id_course_id')}},
+    )
     id = Column(Integer, primary_key=True)
     student_id = Column('student_id', Integer, ForeignKey('students.id'))
     course_id = Column('course_id', Integer, ForeignKey('courses.id'))
@@ -30,28 +35,15 @@ class Course(Base):
     title = Column(String)
     students = relationship("Student", secondary='student_course_link', back_populates='courses')
 
-Base.metadata.create_all(engine)
-
-# math = Course(title = "Mathematics")
-# physics = Course(title = "Physics")
-# english = Course(title = "English")
-# chinese = Course(title = "Chinese")
-
-# bill = Student(name = 'Bill', courses = [math, physics])
-# mary = Student(name = 'Mary', courses = [math])
-# bob = Student(name = 'Bob', courses = [english, math, physics])
-# vic = Student(name = 'Vic', courses = [chinese, physics])
-
-# session.add_all([english, chinese, bob, vic])
-# session.commit()
-
-mary = session.query(Student).filter_by(name = "Mary").first()
-courses = [course.title for course in mary.courses]
-print(f"Mary's Courses: {', '.join(courses)}")
-
 # 如果是單個表格中的紀錄之間的多對多關係，則可以使用 follow
 class FansAssociation(Base):
     __tablename__ = 'fans_associations'
+    __table_args__ = (
+        Index('uq_fans_associations_follower_id_following_id', 'follower_id', 'following_id', unique = True),
+        Index('ix_fans_associations_following_id_follower_id', 'following_id', 'follower_id'),
+        {"info": {"ddl": dedupe_ddl('fans_associations', ('follower_id', 'following_id'),
+                                    replaces = 'ix_fans_associations_follower_id_following_id')}},
+    )
     id = Column(Integer, primary_key= True)
 
     follower_id = Column(Integer, ForeignKey('fans.id'))
@@ -72,19 +64,46 @@ class Fan(Base):
 
     def __repr__(self):
         return f"<Fan: {self.name}>"
-    
-Base.metadata.create_all(engine)
 
-fan_1 = Fan(name = "Mary")
-fan_2 = Fan(name = "Bob")
-fan_3 = Fan(name = "Kitty")
+# 常用的查詢可以事先註冊，例如 registry.first(session, "student_by_name", name = "Mary")
+registry.register_lookup("student_by_name", Student, Student.name)
+
+
+def main():
+    ensure_schema()
+    session = Session()
+
+    # math = Course(title = "Mathematics")
+    # physics = Course(title = "Physics")
+    # english = Course(title = "English")
+    # chinese = Course(title = "Chinese")
+
+    # bill = Student(name = 'Bill', courses = [math, physics])
+    # mary = Student(name = 'Mary', courses = [math])
+    # bob = Student(name = 'Bob', courses = [english, math, physics])
+    # vic = Student(name = 'Vic', courses = [chinese, physics])
+
+    # session.add_all([english, chinese, bob, vic])
+    # session.commit()
+
+    mary = session.query(Student).filter_by(name = "Mary").first()
+    courses = [course.title for course in mary.courses]
+    print(f"Mary's Courses: {', '.join(courses)}")
+
+    fan_1 = Fan(name = "Mary")
+    fan_2 = Fan(name = "Bob")
+    fan_3 = Fan(name = "Kitty")
+
+    fan_1.following.append(fan_2)
+    fan_2.following.append(fan_1)
+    fan_3.following.append(fan_1)
+
+    session.add_all([fan_1, fan_2, fan_3])
+    session.commit()
 
-fan_1.following.append(fan_2)
-fan_2.following.append(fan_1)
-fan_3.following.append(fan_1)
+    print(f"{fan_1} is following: {fan_1.following}")
+    print(f"{fan_1} is being followed by: {fan_1.followers}")
 
-session.add_all([fan_1, fan_2, fan_3])
-session.commit()
 
-print(f"{fan_1} is following: {fan_1.following}")
-print(f"{fan_1} is being followed by: {fan_1.followers}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
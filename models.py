@@ -1,16 +1,249 @@
-from sqlalchemy import create_engine, Column, String, Integer, Table,MetaData
+import hashlib
+import logging
+import os
+
+from sqlalchemy import create_engine, Column, String, Integer, Table,MetaData, Index, event
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import NullPool, QueuePool
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+logger = logging.getLogger(__name__)
+
+DATABASE_URL = "sqlite:///data.db"
+ASYNC_DATABASE_URL = "sqlite+aiosqlite:///data.db"
+
+# 不同用途的引擎設定，PRAGMA 會在每條連線建立時設定
+# WAL 模式讓讀取不會被寫入阻擋，synchronous = NORMAL 在 WAL 下仍然安全但少了許多 fsync
+PROFILES = {
+    "dev": {
+        "echo": True,
+        "pool_size": 5,
+        "pragmas": {
+            "busy_timeout": 5000,
+        },
+    },
+    "prod-read-heavy": {
+        "echo": False,
+        "pool_size": 20,
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "mmap_size": 268435456,
+            "cache_size": -65536,
+            "busy_timeout": 5000,
+        },
+    },
+    "prod-write-heavy": {
+        "echo": False,
+        "pool_size": 10,
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "mmap_size": 67108864,
+            "cache_size": -16384,
+            "busy_timeout": 30000,
+            "wal_autocheckpoint": 10000,
+        },
+    },
+}
+
+
+def make_engine(profile = "dev", url = DATABASE_URL, multiprocess = False):
+    # 多執行緒共用連線池 (QueuePool)；多行程時連線不能跨行程，因此改用 NullPool 每次建立新連線
+    settings = PROFILES[profile]
+    if multiprocess:
+        engine = create_engine(url, echo = settings["echo"], poolclass = NullPool)
+    else:
+        engine = create_engine(url, echo = settings["echo"], poolclass = QueuePool,
+                               pool_size = settings["pool_size"], max_overflow = settings["pool_size"])
+    _set_pragmas(engine, settings["pragmas"])
+    return engine
+
+
+def make_async_engine(profile = "dev", url = ASYNC_DATABASE_URL):
+    # aiosqlite 的 AsyncEngine，PRAGMA 設定掛在底層的 sync_engine 上
+    settings = PROFILES[profile]
+    engine = create_async_engine(url, echo = settings["echo"],
+                                 pool_size = settings["pool_size"], max_overflow = settings["pool_size"])
+    _set_pragmas(engine.sync_engine, settings["pragmas"])
+    return engine
+
 
-engine = create_engine("sqlite:///data.db", echo = True)
+def _set_pragmas(engine, pragmas):
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
 
+
+engine = make_engine(os.environ.get("DB_PROFILE", "dev"))
+
+# 所有範例模組共用同一個 Base (同一個 registry 與 metadata)，relationship 中的字串名稱也都在這裡解析
 Base = declarative_base()
 
+# 每個表格的 DDL checksum 記錄在 schema_checksums 中，checksum 沒有變化的表格不會再執行任何 DDL
+schema_checksums = Table(
+    "schema_checksums", MetaData(),
+    Column("table_name", String, primary_key = True),
+    Column("checksum", String, nullable = False),
+)
+
+_bootstrapped = set()
+_stored_checksums = {}
+
+
+def table_checksum(table, dialect = None):
+    dialect = dialect if dialect is not None else engine.dialect
+    digest = hashlib.sha256(str(CreateTable(table).compile(dialect = dialect)).encode())
+    for index in sorted(table.indexes, key = lambda index: index.name):
+        digest.update(str(CreateIndex(index).compile(dialect = dialect)).encode())
+    for statement in table.info.get("ddl", ()):
+        digest.update(statement.encode())
+    return digest.hexdigest()
+
+
+class DataChange(str):
+    # table.info["ddl"] 中會刪除或修改使用者資料的語句，ensure_schema 執行後會以 warning 記錄影響的筆數
+    pass
+
+
+def dedupe_ddl(table_name, columns, replaces = None):
+    # 把既有的索引換成唯一索引前，先刪除重複的資料 (只保留 id 最小的一筆)，放在 table.info["ddl"] 中使用
+    statements = [f"DROP INDEX IF EXISTS {replaces}"] if replaces else []
+    statements.append(DataChange(
+        f"DELETE FROM {table_name} WHERE id NOT IN "
+        f"(SELECT min(id) FROM {table_name} GROUP BY {', '.join(columns)})"
+    ))
+    return statements
+
+
+def fts_ddl(table_name, columns, tokenize = "unicode61 remove_diacritics 2"):
+    # 以 FTS5 external content 表格 ({table_name}_fts) 建立 columns 的全文索引，由 trigger 與原表格同步，放在 table.info["ddl"] 中使用
+    # 索引只保存詞彙，內容仍然讀取原表格；最後的 rebuild 以原表格目前的內容重建索引
+    # 中文等沒有空白分隔的文字可以改用 tokenize = "trigram"，也能支援任意子字串的搜尋
+    fts = f"{table_name}_fts"
+    names = ", ".join(columns)
+    new = ", ".join(f"new.{column}" for column in columns)
+    old = ", ".join(f"old.{column}" for column in columns)
+    delete = f"INSERT INTO {fts} ({fts}, rowid, {names}) VALUES ('delete', old.id, {old});"
+    insert = f"INSERT INTO {fts} (rowid, {names}) VALUES (new.id, {new});"
+    # 只在表格的 DDL 變更時執行，因此每次都重新建立，tokenize 等設定變更時也會生效
+    return [
+        f"DROP TABLE IF EXISTS {fts}",
+        f"CREATE VIRTUAL TABLE {fts} USING fts5("
+        f"{names}, content = '{table_name}', content_rowid = 'id', tokenize = '{tokenize}')",
+        f"DROP TRIGGER IF EXISTS {fts}_insert",
+        f"DROP TRIGGER IF EXISTS {fts}_delete",
+        f"DROP TRIGGER IF EXISTS {fts}_update",
+        f"CREATE TRIGGER {fts}_insert AFTER INSERT ON {table_name} BEGIN {insert} END",
+        f"CREATE TRIGGER {fts}_delete AFTER DELETE ON {table_name} BEGIN {delete} END",
+        f"CREATE TRIGGER {fts}_update AFTER UPDATE OF {names} ON {table_name} BEGIN {delete} {insert} END",
+        f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')",
+    ]
+
+
+def ensure_schema(bind = None, metadata = None):
+    # 取代每個模組 import 時都執行一次的 Base.metadata.create_all(engine)
+    # 同一個行程中確認過的表格直接略過；資料庫中的 checksum 與目前模型相同時也只需要一次查詢，不會執行任何 DDL
+    bind = bind if bind is not None else engine
+    metadata = metadata if metadata is not None else Base.metadata
+    url = str(bind.url)
+    pending = {}
+    for table in metadata.sorted_tables:
+        checksum = table_checksum(table, bind.dialect)
+        if (url, table.name, checksum) not in _bootstrapped:
+            pending[table.name] = checksum
+    if not pending:
+        return []
+
+    with bind.begin() as conn:
+        if url not in _stored_checksums:
+            schema_checksums.create(conn, checkfirst = True)
+            _stored_checksums[url] = dict(conn.execute(schema_checksums.select()).all())
+        stored = _stored_checksums[url]
+        stale = [metadata.tables[name] for name, checksum in pending.items() if stored.get(name) != checksum]
+        if stale:
+            # create_all 只會建立不存在的表格，既有表格上新宣告的索引要另外補上
+            metadata.create_all(conn, tables = stale)
+            for table in stale:
+                # table.info["ddl"] 中額外的 DDL (例如 trigger、建立唯一索引前先移除重複資料)，表格建立或變更時一併執行
+                for statement in table.info.get("ddl", ()):
+                    result = conn.exec_driver_sql(statement)
+                    if isinstance(statement, DataChange) and result.rowcount > 0:
+                        logger.warning("schema bootstrap of %s changed %d row(s) in %s: %s",
+                                       table.name, result.rowcount, url, statement)
+                for index in table.indexes:
+                    index.create(conn, checkfirst = True)
+            names = [table.name for table in stale]
+            conn.execute(schema_checksums.delete().where(schema_checksums.c.table_name.in_(names)))
+            conn.execute(schema_checksums.insert(), [
+                {"table_name": name, "checksum": pending[name]} for name in names
+            ])
+            stored.update((name, pending[name]) for name in names)
+    _bootstrapped.update((url, name, checksum) for name, checksum in pending.items())
+    return [table.name for table in stale]
+
+
 class User(Base):
     __tablename__ = "users"
+    # (sex, age) 用於依性別分組，(age, sex) 用於年齡範圍的篩選，兩者都能直接由索引回答 count
+    __table_args__ = (
+        Index("ix_users_sex_age", "sex", "age"),
+        Index("ix_users_age_sex", "age", "sex"),
+    )
     id = Column(Integer, primary_key = True)
-    name = Column(String)
+    name = Column(String, index = True)
     age = Column(Integer)
     sex = Column(String)
 
 
-Base.metadata.create_all(engine)
\ No newline at end of file
+# users 的統計表，由 SQLite trigger 在 users 新增、修改、刪除時同步更新
+# 因為是 trigger，使用 bulk_insert 等 Core 寫入也會被統計到
+# 每個 (sex, age) 組合一筆，依性別或年齡範圍的統計只需要彙總這幾百筆資料，與 users 的大小無關
+USER_STATS_REBUILD = [
+    "DELETE FROM user_stats",
+    "INSERT INTO user_stats (sex, age, count) SELECT sex, age, count(*) FROM users GROUP BY sex, age",
+]
+
+_USER_STATS_DDL = [
+    "DROP TRIGGER IF EXISTS user_stats_insert",
+    "DROP TRIGGER IF EXISTS user_stats_delete",
+    "DROP TRIGGER IF EXISTS user_stats_update",
+    """CREATE TRIGGER user_stats_insert AFTER INSERT ON users BEGIN
+        UPDATE user_stats SET count = count + 1 WHERE sex IS NEW.sex AND age IS NEW.age;
+        INSERT INTO user_stats (sex, age, count) SELECT NEW.sex, NEW.age, 1
+            WHERE NOT EXISTS (SELECT 1 FROM user_stats WHERE sex IS NEW.sex AND age IS NEW.age);
+    END""",
+    """CREATE TRIGGER user_stats_delete AFTER DELETE ON users BEGIN
+        UPDATE user_stats SET count = count - 1 WHERE sex IS OLD.sex AND age IS OLD.age;
+        DELETE FROM user_stats WHERE sex IS OLD.sex AND age IS OLD.age AND count <= 0;
+    END""",
+    """CREATE TRIGGER user_stats_update AFTER UPDATE OF sex, age ON users
+    WHEN OLD.sex IS NOT NEW.sex OR OLD.age IS NOT NEW.age BEGIN
+        UPDATE user_stats SET count = count - 1 WHERE sex IS OLD.sex AND age IS OLD.age;
+        DELETE FROM user_stats WHERE sex IS OLD.sex AND age IS OLD.age AND count <= 0;
+        UPDATE user_stats SET count = count + 1 WHERE sex IS NEW.sex AND age IS NEW.age;
+        INSERT INTO user_stats (sex, age, count) SELECT NEW.sex, NEW.age, 1
+            WHERE NOT EXISTS (SELECT 1 FROM user_stats WHERE sex IS NEW.sex AND age IS NEW.age);
+    END""",
+    # 重新安裝 trigger 時，以目前 users 的內容重建統計
+    *USER_STATS_REBUILD,
+]
+
+
+class UserStat(Base):
+    __tablename__ = "user_stats"
+    __table_args__ = (
+        Index("ix_user_stats_sex_age", "sex", "age"),
+        {"info": {"ddl": _USER_STATS_DDL}},
+    )
+    id = Column(Integer, primary_key = True)
+    sex = Column(String)
+    age = Column(Integer)
+    count = Column(Integer, nullable = False, default = 0)
+
+
+UserStat.__table__.add_is_dependent_on(User.__table__)
@@ -0,0 +1,138 @@
+import logging
+import random
+import threading
+from collections import Counter
+from dataclasses import dataclass
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import visitors
+from sqlalchemy.sql.elements import BindParameter
+
+logger = logging.getLogger(__name__)
+
+# 這個模組用來偵測 lazy_loading.py 中示範的 N+1 問題:
+# 每讀取一個 Teacher 的 posts 就會多發出一次查詢
+# 同一個 unit of work (交易) 中，同一個 relationship 被 lazy load 超過 threshold 次就會被標記，
+# 並建議改用 selectinload (集合) 或 joinedload (單一物件) 一次載入
+# lazy = "dynamic" / "write_only" 的 relationship (例如 Teacher.posts) 透過 AppenderQuery 查詢，ORM 不會設定 lazy_loaded_from，
+# 因此另外以 WHERE 條件比對 relationship 的 with_parent 條件來辨識 (不比較參數值)
+
+_SAMPLED = "n_plus_one_sampled"
+_COUNTS = "n_plus_one_counts"
+_APPENDERS = ("dynamic", "write_only")
+
+
+@dataclass
+class Finding:
+    relationship: str
+    loads: int
+    suggestion: str
+
+    def __str__(self):
+        return f"{self.relationship} lazy loaded {self.loads} times, use {self.suggestion}"
+
+
+class NPlusOneDetector:
+    def __init__(self, threshold = 5, sample_rate = 1.0, on_detect = None):
+        # sample_rate 代表有多少比例的交易會被記錄，正式環境可以設定成很小的值來降低負擔
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.on_detect = on_detect or (lambda finding: logger.warning("N+1 detected: %s", finding))
+        self.findings = []
+        self.totals = Counter()
+        self._lock = threading.Lock()
+        self._target = None
+        # 目標 mapper -> 指向它的 dynamic / write_only relationship
+        self._appenders = {}
+
+    def install(self, target = Session):
+        # target 可以是 Session 類別 (影響所有 session)、某個 sessionmaker 或單一 session
+        event.listen(target, "after_transaction_create", self._start)
+        event.listen(target, "do_orm_execute", self._record)
+        event.listen(target, "after_transaction_end", self._finish)
+        self._target = target
+        return self
+
+    def uninstall(self):
+        event.remove(self._target, "after_transaction_create", self._start)
+        event.remove(self._target, "do_orm_execute", self._record)
+        event.remove(self._target, "after_transaction_end", self._finish)
+        self._target = None
+
+    def _start(self, session, transaction):
+        if transaction.parent is None:
+            session.info[_SAMPLED] = random.random() < self.sample_rate
+            session.info[_COUNTS] = Counter()
+
+    def _record(self, orm_execute_state):
+        session = orm_execute_state.session
+        if not session.info.get(_SAMPLED):
+            return
+        if orm_execute_state.lazy_loaded_from is not None:
+            prop = orm_execute_state.loader_strategy_path[-1]
+        else:
+            prop = self._appender_load(orm_execute_state)
+            if prop is None:
+                return
+        counts = session.info[_COUNTS]
+        counts[prop] += 1
+        if counts[prop] == self.threshold:
+            self._report(prop, counts[prop])
+
+    def _appender_load(self, orm_execute_state):
+        mapper = orm_execute_state.bind_mapper
+        criteria = getattr(orm_execute_state.statement, "_where_criteria", ())
+        if not criteria or mapper is None or not orm_execute_state.is_select:
+            return None
+        props = self._appenders.get(mapper)
+        if props is None:
+            props = self._appenders[mapper] = [
+                prop for other in mapper.registry.mappers for prop in other.relationships
+                if prop.lazy in _APPENDERS and prop.mapper is mapper
+            ]
+        for prop in props:
+            # with_parent 的參數值由 callable 在執行時取得，手寫的相同條件 (例如 Post.teacher_id == 5) 不會有 callable
+            if criteria[0].compare(prop._lazy_strategy._lazywhere, compare_values = False) and any(
+                isinstance(bind, BindParameter) and bind.callable is not None
+                for bind in visitors.iterate(criteria[0])
+            ):
+                return prop
+        return None
+
+    def _finish(self, session, transaction):
+        if transaction.parent is not None or _COUNTS not in session.info:
+            return
+        counts = session.info.pop(_COUNTS)
+        session.info.pop(_SAMPLED, None)
+        with self._lock:
+            for prop, loads in counts.items():
+                self.totals[str(prop)] += loads
+
+    def _report(self, prop, loads):
+        finding = Finding(str(prop), loads, suggest(prop))
+        with self._lock:
+            self.findings.append(finding)
+        self.on_detect(finding)
+
+    def report(self):
+        with self._lock:
+            return {
+                "findings": [str(finding) for finding in self.findings],
+                "lazy_loads": dict(self.totals),
+            }
+
+
+def suggest(prop):
+    # 集合 (一對多、多對多) 用 selectinload 避免 JOIN 後的重複列，單一物件則用 joinedload
+    owner = prop.parent.class_.__name__
+    if prop.lazy in _APPENDERS:
+        # dynamic / write_only 不能搭配 eager loading，改以一次查詢取出所有父物件的資料，或把 lazy 改回 "select"
+        target = prop.mapper.class_.__name__
+        if prop.secondary is None and len(prop.local_remote_pairs) == 1:
+            column = prop.local_remote_pairs[0][1].key
+            return (f"select({target}).where({target}.{column}.in_(ids)) once, "
+                    f"or lazy = 'select' with selectinload({owner}.{prop.key})")
+        return f"lazy = 'select' with selectinload({owner}.{prop.key})"
+    loader = "selectinload" if prop.uselist else "joinedload"
+    return f"session.query({owner}).options({loader}({owner}.{prop.key}))"
@@ -1,11 +1,8 @@
 from sqlalchemy import (Column, ForeignKey, Integer, String, create_engine)
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker
-from models import engine
+from sqlalchemy.orm import relationship, sessionmaker
+from models import Base, engine, ensure_schema
 
 Session = sessionmaker(bind = engine)
-session = Session()
-
-Base = declarative_base()
 
 class Email(Base):
     __tablename__ = "emails"
@@ -22,15 +19,23 @@ class Person(Base):
     name = Column(String)
     email = relationship("Email", back_populates="user", uselist=False)
 
-# Base.metadata.create_all(engine)
 
-person1 = Person(name="John Doe")
-email_1 = Email(email = "johndoe@example.com", user = person1)
-# session.add(person1)
-# session.add(email_1)
-# session.commit()
+def main():
+    session = Session()
+
+    # ensure_schema()
+
+    person1 = Person(name="John Doe")
+    email_1 = Email(email = "johndoe@example.com", user = person1)
+    # session.add(person1)
+    # session.add(email_1)
+    # session.commit()
+
+    print(person1.name)
+    print(email_1.email)
+    print(person1.email.email)
+    print(email_1.user.name)
+
 
-print(person1.name)
-print(email_1.email)
-print(person1.email.email)
-print(email_1.user.name)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+from multiprocessing import get_context
+
+from sqlalchemy import func, select
+
+from models import DATABASE_URL, User, make_engine
+
+# 把大範圍的掃描依主鍵範圍切成多段，交給多個行程平行執行，再把各段的結果合併
+# SQLite 的連線不能跨行程，每個 worker 在啟動時 (initializer) 建立自己的 engine
+# 查詢以「模組層級的函式」描述: builder(low, high, *args) 回傳只涵蓋 [low, high) 主鍵範圍的 select()，
+# 這樣才能被 pickle 傳給 worker，例如:
+#   with ParallelExecutor(workers = 4) as executor:
+#       executor.scan(count_by_sex_between, 20, 50, merge = "group")   -> {"female": ..., "male": ...}
+
+MERGES = ("concat", "sum", "group")
+
+_engine = None
+
+
+def _init_worker(profile, url):
+    global _engine
+    _engine = make_engine(profile, url = url)
+
+
+def _run(builder, low, high, args):
+    with _engine.connect() as conn:
+        return [tuple(row) for row in conn.execute(builder(low, high, *args))]
+
+
+def key_ranges(bind, model, n):
+    # 依主鍵的最小值與最大值切成 n 段等寬的 [low, high) 範圍，主鍵大致連續時每段的筆數接近
+    pk = model.__mapper__.primary_key[0]
+    with bind.connect() as conn:
+        low, high = conn.execute(select(func.min(pk), func.max(pk))).one()
+    if low is None:
+        return []
+    step = max(1, -(-(high - low + 1) // n))
+    return [(start, min(start + step, high + 1)) for start in range(low, high + 1, step)]
+
+
+def _add(a, b):
+    # 與 SQL 的 SUM 相同，NULL 不列入計算，全部都是 NULL 時結果才是 NULL (例如空的主鍵範圍)
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return a + b
+
+
+def _group_order(key):
+    # 群組鍵可能是 NULL (例如 sex 為 NULL 的 users)，NULL 排在最後
+    key = key if isinstance(key, tuple) else (key,)
+    return tuple((value is None, value if value is not None else 0) for value in key)
+
+
+def merge_results(parts, how = "concat", keys = 1):
+    # concat: 串接所有資料列
+    # sum:    每段只有一列 (例如 count、sum)，逐欄相加
+    # group:  每列的前 keys 欄為群組鍵，其餘欄位依群組相加，回傳 {鍵: 值}
+    if how == "concat":
+        return [row for part in parts for row in part]
+    if how == "sum":
+        rows = [part[0] for part in parts if part]
+        return tuple(reduce(_add, values, None) for values in zip(*rows))
+    if how == "group":
+        groups = defaultdict(lambda: None)
+        for part in parts:
+            for row in part:
+                key = row[0] if keys == 1 else row[:keys]
+                values = row[keys:]
+                current = groups[key]
+                groups[key] = values if current is None else tuple(map(_add, current, values))
+        return {key: groups[key][0] if len(groups[key]) == 1 else groups[key]
+                for key in sorted(groups, key = _group_order)}
+    raise ValueError(f"unknown merge {how!r}, expected one of {MERGES}")
+
+
+class ParallelExecutor:
+    def __init__(self, url = DATABASE_URL, workers = None, profile = "prod-read-heavy", partitions_per_worker = 4):
+        self.url = url
+        self.workers = workers or os.cpu_count()
+        self.profile = profile
+        # 每個 worker 分到數段，避免某一段特別慢時其他 worker 閒置
+        self.partitions = self.workers * partitions_per_worker
+        self.engine = make_engine(profile, url = url, multiprocess = True)
+        self.pool = None
+
+    def __enter__(self):
+        self.pool = ProcessPoolExecutor(
+            max_workers = self.workers, mp_context = get_context("spawn"),
+            initializer = _init_worker, initargs = (self.profile, self.url),
+        )
+        return self
+
+    def __exit__(self, *exc_info):
+        self.pool.shutdown()
+        self.pool = None
+        self.engine.dispose()
+
+    def scan(self, builder, *args, model = User, merge = "concat", keys = 1):
+        ranges = key_ranges(self.engine, model, self.partitions)
+        futures = [self.pool.submit(_run, builder, low, high, args) for low, high in ranges]
+        return merge_results([future.result() for future in futures], merge, keys)
+
+
+# 以下為常用的分段查詢，對應 app.py 中的統計
+def users_between(low, high, age_low, age_high):
+    return select(User.id, User.name, User.age, User.sex).where(
+        User.id >= low, User.id < high, User.age > age_low, User.age < age_high)
+
+
+def count_between(low, high, age_low, age_high):
+    return select(func.count(User.id)).where(
+        User.id >= low, User.id < high, User.age > age_low, User.age < age_high)
+
+
+def count_by_sex_between(low, high, age_low, age_high):
+    # 與 app.py 的 filter(User.age > 20, User.age < 50).group_by(User.sex) 相同，merge = "group"
+    return (
+        select(User.sex, func.count(User.id))
+        .where(User.id >= low, User.id < high, User.age > age_low, User.age < age_high)
+        .group_by(User.sex)
+    )
+
+
+def age_sum_by_sex(low, high):
+    # 回傳 (sex, sum(age), count)，合併後可以算出各性別的平均年齡
+    return (
+        select(User.sex, func.sum(User.age), func.count(User.id))
+        .where(User.id >= low, User.id < high)
+        .group_by(User.sex)
+    )
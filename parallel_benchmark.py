@@ -0,0 +1,68 @@
+import argparse
+import os
+import tempfile
+from time import perf_counter
+
+from sqlalchemy import func, select
+
+from bulk_insert import bulk_insert
+from models import User, make_engine
+from parallel import ParallelExecutor, age_sum_by_sex, count_by_sex_between
+
+# 在大型的 users 表格上比較單一行程與 1..N 個 worker 平行掃描的時間
+# 資料表刻意不建立 age / sex 的索引，模擬必須全表掃描的分析查詢；預設 100,000,000 筆約 2.5 GB，建立一次後會重複使用
+
+SEXES = ("male", "female")
+
+
+def build_dataset(path, n_users):
+    engine = make_engine("prod-write-heavy", url = f"sqlite:///{path}")
+    with engine.begin() as conn:
+        # 只建立表格本身，不建立 models.User 上宣告的索引
+        conn.exec_driver_sql(
+            "CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, name VARCHAR, age INTEGER, sex VARCHAR)")
+        existing = conn.scalar(select(func.count()).select_from(User))
+    if existing < n_users:
+        bulk_insert(engine, User, ((f"User{x}", 18 + x % 60, SEXES[x % 2]) for x in range(existing, n_users)))
+    engine.dispose()
+
+
+def serial(url, builder, *args):
+    engine = make_engine("prod-read-heavy", url = url)
+    with engine.connect() as conn:
+        low, high = conn.execute(select(func.min(User.id), func.max(User.id))).one()
+        result = conn.execute(builder(low, high + 1, *args)).all()
+    engine.dispose()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Scaling of partitioned scans across worker processes")
+    parser.add_argument("--users", type = int, default = 100_000_000)
+    parser.add_argument("--workers", type = int, nargs = "+", default = sorted({1, 2, 4, os.cpu_count()}))
+    parser.add_argument("--data-dir", default = tempfile.gettempdir())
+    args = parser.parse_args()
+
+    path = os.path.join(args.data_dir, "parallel_benchmark.db")
+    build_dataset(path, args.users)
+    url = f"sqlite:///{path}"
+    print(f"{args.users:,} users, {os.path.getsize(path) / 2**30:.2f} GB, {os.cpu_count()} cores")
+
+    cases = [
+        ("count_by_sex_between", count_by_sex_between, (20, 50)),
+        ("age_sum_by_sex", age_sum_by_sex, ()),
+    ]
+    for label, builder, builder_args in cases:
+        start = perf_counter()
+        expected = {row[0]: row[1] if len(row) == 2 else tuple(row[1:]) for row in serial(url, builder, *builder_args)}
+        baseline = perf_counter() - start
+        print(f"{label:<22} serial      {baseline:8.2f}s")
+        for workers in args.workers:
+            with ParallelExecutor(url, workers = workers) as executor:
+                # 先執行一次讓所有 worker 行程啟動完成，計時不包含行程啟動
+                executor.scan(builder, *builder_args, merge = "group")
+                start = perf_counter()
+                result = executor.scan(builder, *builder_args, merge = "group")
+                elapsed = perf_counter() - start
+            assert result == expected, (result, expected)
+            print(f"{label:<22} {workers:>2} workers  {elapsed:8.2f}s  speedup {baseline / elapsed:5.2f}x")
@@ -0,0 +1,70 @@
+import threading
+from collections import Counter
+
+from sqlalchemy import bindparam, select
+
+from models import User
+
+# session.query(User).filter_by(name = ...).first() 每次呼叫都會重新建立 Query 物件
+# 這裡把常用的查詢事先建立成帶有 bindparam 的 select()，之後只需要帶入參數執行
+# 同一個 statement 物件的 cache key 只會計算一次，SQLAlchemy 的編譯快取也能直接命中
+
+
+class QueryRegistry:
+    def __init__(self):
+        self._builders = {}
+        self._statements = {}
+        self._lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = Counter()
+
+    def register(self, name, builder):
+        # builder 是一個回傳 select() 的函式，第一次使用時才會建立
+        self._builders[name] = builder
+        self._statements.pop(name, None)
+
+    def register_lookup(self, name, model, *columns, limit = 1):
+        # 例如 register_lookup("teacher_by_name", Teacher, Teacher.name)
+        def builder():
+            stmt = select(model).where(*[column == bindparam(column.key) for column in columns])
+            return stmt.limit(limit) if limit is not None else stmt
+        self.register(name, builder)
+
+    def statement(self, name):
+        stmt = self._statements.get(name)
+        if stmt is not None:
+            self.hits[name] += 1
+            return stmt
+        with self._lock:
+            if name not in self._statements:
+                self._statements[name] = self._builders[name]()
+            self.misses[name] += 1
+            return self._statements[name]
+
+    def execute(self, session, name, /, **params):
+        return session.execute(self.statement(name), params)
+
+    def first(self, session, name, /, **params):
+        return self.execute(session, name, **params).scalars().first()
+
+    def all(self, session, name, /, **params):
+        return self.execute(session, name, **params).scalars().all()
+
+    def stats(self):
+        hits = sum(self.hits.values())
+        misses = sum(self.misses.values())
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "statements": {
+                name: {"hits": self.hits[name], "misses": self.misses[name]}
+                for name in self._builders
+            },
+        }
+
+
+registry = QueryRegistry()
+registry.register_lookup("user_by_id", User, User.id)
+registry.register_lookup("user_by_name", User, User.name)
+registry.register_lookup("users_by_name", User, User.name, limit = None)
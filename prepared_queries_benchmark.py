@@ -0,0 +1,44 @@
+import argparse
+from time import perf_counter
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from models import User
+from prepared_queries import registry
+
+# 比較每次重新建立 session.query(User).filter_by(...) 與使用事先註冊的 statement 的單次呼叫延遲
+
+
+def setup(n_users):
+    engine = create_engine("sqlite://")
+    User.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"name": f"User{x}", "age": 20 + x % 40, "sex": "male"} for x in range(n_users)])
+    return sessionmaker(bind = engine)()
+
+
+def with_query(session, names):
+    for name in names:
+        session.query(User).filter_by(name = name).first()
+
+
+def with_registry(session, names):
+    for name in names:
+        registry.first(session, "user_by_name", name = name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Per-call latency of legacy Query vs. prepared statements")
+    parser.add_argument("--calls", type = int, default = 20_000)
+    parser.add_argument("--users", type = int, default = 1_000)
+    args = parser.parse_args()
+
+    session = setup(args.users)
+    names = [f"User{x % args.users}" for x in range(args.calls)]
+    for label, func in [("session.query", with_query), ("registry", with_registry)]:
+        start = perf_counter()
+        func(session, names)
+        elapsed = perf_counter() - start
+        print(f"{label:<14} {elapsed / args.calls * 1e6:8.1f} us/call")
+    print(registry.stats()["statements"]["user_by_name"])
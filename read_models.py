@@ -0,0 +1,65 @@
+from collections import namedtuple
+
+from sqlalchemy import inspect, select
+from sqlalchemy.orm import Query
+
+# 只讀取、不修改資料時 (例如 app.py 中印出 users)，select(User) 仍然會為每一筆建立完整的 ORM 物件:
+# InstanceState、屬性的 instrumentation、identity map 中的項目，以及 commit 時的變更檢查
+# read model 是依模型欄位產生的 tuple 子類別 (__slots__ = ())，以欄位名稱存取，例如:
+#   for user in read_all(session, select(User).where(User.age > 20)):
+#       print(user.id, user.name, user.age)
+# 查詢時只選取欄位 (與 select(User.id, User.name, ...) 相同)，每一列直接轉成 read model，
+# 不經過 identity map，也沒有變更追蹤；需要修改資料時請改用 session.get(User, user.id)
+
+CHUNK_SIZE = 1000
+
+_models = {}
+
+
+def read_model(model):
+    # 每個模型只產生一次，例如 read_model(User) -> UserRow，欄位與 select(User) 預設載入的欄位相同 (不含 deferred)
+    cls = _models.get(model)
+    if cls is None:
+        columns = [prop for prop in inspect(model).column_attrs if not prop.deferred]
+        keys = [prop.key for prop in columns]
+        base = namedtuple(f"{model.__name__}Row", keys)
+        cls = type(base.__name__, (base,), {
+            "__slots__": (),
+            "__model__": model,
+            "__columns__": tuple(getattr(model, key) for key in keys),
+            "__repr__": lambda self: f"<{model.__name__}Row {', '.join(f'{k}={v!r}' for k, v in zip(keys, self))}>",
+        })
+        _models[model] = cls
+    return cls
+
+
+def _projection(query):
+    # select(User)... 或 session.query(User)... 改成只選取欄位，保留 WHERE / ORDER BY / LIMIT 等條件
+    stmt = query.statement if isinstance(query, Query) else query
+    descriptions = stmt.column_descriptions
+    if len(descriptions) != 1 or descriptions[0]["type"] is not descriptions[0]["entity"]:
+        raise ValueError("read models need a query for a single entity, e.g. select(User)")
+    cls = read_model(descriptions[0]["entity"])
+    return cls, stmt.with_only_columns(*cls.__columns__)
+
+
+def read_all(session, query):
+    cls, stmt = _projection(query)
+    make = cls._make
+    return [make(row) for row in session.execute(stmt)]
+
+
+def read_iter(session, query, chunk_size = CHUNK_SIZE):
+    # 分批讀取，與 streaming.stream() 相同但不建立 ORM 物件，也不需要 expunge
+    cls, stmt = _projection(query)
+    make = cls._make
+    result = session.execute(stmt.execution_options(yield_per = chunk_size))
+    for chunk in result.partitions():
+        yield from map(make, chunk)
+
+
+def read_get(session, model, id):
+    cls = read_model(model)
+    pk = inspect(model).primary_key[0]
+    row = session.execute(select(*cls.__columns__).where(pk == id)).first()
+    return cls._make(row) if row is not None else None
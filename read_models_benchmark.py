@@ -0,0 +1,82 @@
+import argparse
+import gc
+import os
+import tempfile
+import tracemalloc
+from time import perf_counter
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from bulk_insert import bulk_insert
+from models import User, ensure_schema, make_engine
+from read_models import read_all, read_iter
+
+# 比較讀取 users 的方式，每一筆的建立成本 (µs) 與每一筆佔用的記憶體 (bytes，含 identity map 與 InstanceState)
+# - orm:       session.scalars(select(User)).all()
+# - rows:      session.execute(select(User.id, User.name, User.age, User.sex)).all()
+# - read_all:  read_models.read_all(session, select(User))
+# - read_iter: read_models.read_iter()，分批讀取，只計算時間
+# 時間與記憶體分開量測，tracemalloc 會拖慢執行速度
+
+SEXES = ("male", "female")
+
+
+def build(path, n_users):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    engine = make_engine("prod-read-heavy", url = f"sqlite:///{path}")
+    ensure_schema(engine)
+    bulk_insert(engine, User, ((f"User{x}", 18 + x % 60, SEXES[x % 2]) for x in range(n_users)))
+    return engine
+
+
+CASES = {
+    "orm": lambda session: session.scalars(select(User)).all(),
+    "rows": lambda session: session.execute(select(User.id, User.name, User.age, User.sex)).all(),
+    "read_all": lambda session: read_all(session, select(User)),
+    "read_iter": lambda session: sum(1 for _ in read_iter(session, select(User))),
+}
+
+
+def timed(engine, fn, repeat):
+    best = None
+    for _ in range(repeat):
+        with Session(engine) as session:
+            gc.collect()
+            start = perf_counter()
+            fn(session)
+            elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def allocated(engine, fn):
+    # 保留結果與 session (identity map) 時仍然佔用的記憶體
+    with Session(engine) as session:
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        result = fn(session)
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        del result
+    return size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Hydration cost of ORM entities versus __slots__ read models")
+    parser.add_argument("--users", type = int, default = 200_000)
+    parser.add_argument("--repeat", type = int, default = 3)
+    parser.add_argument("--data-dir", default = tempfile.gettempdir())
+    args = parser.parse_args()
+
+    engine = build(os.path.join(args.data_dir, f"read_models_benchmark_{args.users}.db"), args.users)
+    print(f"{'':<10}{'total':>10}{'per row':>12}{'bytes/row':>12}")
+    for label, fn in CASES.items():
+        elapsed = timed(engine, fn, args.repeat)
+        size = allocated(engine, fn) if label != "read_iter" else None
+        per_row = f"{size / args.users:>12.0f}" if size is not None else f"{'-':>12}"
+        print(f"{label:<10}{elapsed:>9.3f}s{elapsed / args.users * 1e6:>10.2f}µs{per_row}")
@@ -1,10 +1,7 @@
 from sqlalchemy import (Column, ForeignKey, Integer, String, create_engine)
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker, Mapped, mapped_column
-from models import engine
+from sqlalchemy.orm import relationship, sessionmaker, Mapped, mapped_column
+from models import Base, engine
 Session = sessionmaker(bind = engine)
-session = Session()
-
-Base = declarative_base()
 
 class BaseModel(Base):
     __abstract__ = True
@@ -80,5 +77,3 @@ class BaseModel(Base):
 
 #     def __repr__(self):
 #         return f"<Member(id = {self.id}, username = {self.name})>"
-
-Base.metadata.create_all(engine)
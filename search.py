@@ -0,0 +1,97 @@
+import os
+import sys
+
+from sqlalchemy import column, func, inspect, literal_column, select, table
+
+from lazy_loading import Post, SensitiveInformation
+from models import fts_ddl
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "12_Join_Types"))
+
+from join_types import Address  # noqa: E402
+
+# 取代 Post.content.like(f"%{term}%") 的全表掃描
+# 每個欄位有一個 FTS5 的 external content 表格 ({表格}_fts)，由 trigger 在新增、修改、刪除時同步 (models.fts_ddl)
+# 使用 bulk_insert 等 Core 寫入也會被索引；posts 與 sensitive_informations 由 ensure_schema 建立，
+# join_types 的 addresses 不在同一個 metadata 中，以 ADDRESS_SEARCH.create(engine) 建立
+# 查詢回傳 (物件, rank, snippet)，依 bm25 排序 (越小越相關)，可以再加上一般的條件，例如:
+#   POST_SEARCH.all(session, "sqlalchemy session", Post.teacher_id == 7, limit = 10)
+#   POST_SEARCH.all(session, "sess*")                                 -> 以 * 結尾為字首搜尋
+#   POST_SEARCH.all(session, "sqlalchemy OR django", raw = True)      -> 直接使用 FTS5 的查詢語法
+# 一般情況下輸入的每個詞都會加上引號，所有詞都必須出現 (AND)，使用者輸入的 - " ( 等字元不會造成語法錯誤
+
+LIMIT = 20
+SNIPPET_TOKENS = 12
+
+
+def quote(terms):
+    # 每個詞以 FTS5 字串表示，結尾的 * 保留為字首搜尋
+    tokens = []
+    for token in terms.split():
+        prefix = token.endswith("*") and len(token) > 1
+        token = token.rstrip("*") if prefix else token
+        tokens.append('"' + token.replace('"', '""') + '"' + ("*" if prefix else ""))
+    if not tokens:
+        raise ValueError("empty search query")
+    return " ".join(tokens)
+
+
+class FullTextIndex:
+    def __init__(self, model, *columns, tokenize = "unicode61 remove_diacritics 2"):
+        # columns 的順序需要與 fts_ddl 相同
+        self.model = model
+        self.table = inspect(model).local_table
+        self.keys = [attr.key for attr in columns]
+        self.name = f"{self.table.name}_fts"
+        self.fts = table(self.name, column("rowid"))
+        self.ddl = fts_ddl(self.table.name, self.keys, tokenize = tokenize)
+
+    def create(self, bind):
+        # 不是由 ensure_schema 管理的表格使用，全文索引已經存在時不會重建
+        with bind.begin() as conn:
+            found = conn.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = ?", (self.name,)).first()
+            if found is None:
+                for statement in self.ddl:
+                    conn.exec_driver_sql(statement)
+
+    def rebuild(self, bind):
+        with bind.begin() as conn:
+            conn.exec_driver_sql(f"INSERT INTO {self.name} ({self.name}) VALUES ('rebuild')")
+
+    def match(self, terms, raw = False):
+        return literal_column(self.name).op("MATCH")(terms if raw else quote(terms))
+
+    def _join(self, stmt, terms, raw, criteria, match_first):
+        # 查詢詞以參數傳入，SQLite 無法估計符合的筆數，加上 teacher_id 等條件時常會先走該條件的索引，
+        # 再對每一筆資料各執行一次 MATCH；match_first = True 時以 rowid + 0 讓全文索引無法以 rowid 查詢，
+        # 強制先由 MATCH 找出符合的資料再以主鍵讀取原表格，適合少見的詞，常見的詞配合選擇性高的條件則應設為 False
+        pk = inspect(self.model).primary_key[0]
+        rowid = self.fts.c.rowid + 0 if match_first else self.fts.c.rowid
+        return stmt.join(self.fts, rowid == pk).where(self.match(terms, raw), *criteria)
+
+    def search(self, terms, *criteria, limit = LIMIT, offset = 0, snippet = None, highlight = False, raw = False,
+               weights = (), match_first = True):
+        # 回傳 select(model, rank, snippet)；snippet 為要擷取片段的欄位 (預設為第一個欄位)
+        # highlight = True 時改為回傳整個欄位並標示符合的詞，weights 為各欄位在 bm25 中的權重
+        fts = literal_column(self.name)
+        index = self.keys.index(snippet.key if snippet is not None else self.keys[0])
+        rank = func.bm25(fts, *weights).label("rank")
+        if highlight:
+            text = func.highlight(fts, index, "[", "]")
+        else:
+            text = func.snippet(fts, index, "[", "]", "…", SNIPPET_TOKENS)
+        stmt = self._join(select(self.model, rank, text.label("snippet")), terms, raw, criteria, match_first)
+        return stmt.order_by(rank).limit(limit).offset(offset)
+
+    def all(self, session, terms, *criteria, **kwargs):
+        # [(物件, rank, snippet), ...]，可以 row.Post、row.rank、row.snippet 存取
+        return session.execute(self.search(terms, *criteria, **kwargs)).all()
+
+    def count(self, session, terms, *criteria, raw = False, match_first = True):
+        stmt = select(func.count()).select_from(self.model)
+        return session.scalar(self._join(stmt, terms, raw, criteria, match_first))
+
+
+POST_SEARCH = FullTextIndex(Post, Post.content)
+SENSITIVE_SEARCH = FullTextIndex(SensitiveInformation, SensitiveInformation.content)
+ADDRESS_SEARCH = FullTextIndex(Address, Address.data)
@@ -0,0 +1,102 @@
+import argparse
+import os
+import random
+import tempfile
+from time import perf_counter
+
+from sqlalchemy import func, inspect, select
+from sqlalchemy.orm import Session
+
+from bulk_insert import bulk_insert_tree
+from lazy_loading import Post, Teacher
+from models import ensure_schema, make_engine
+from search import POST_SEARCH
+
+# 比較 Post.content.like("%詞%") 的全表掃描與 FTS5 全文索引 (search.POST_SEARCH)
+# 預設 1,000,000 篇 post，每篇由固定長度的合成詞 (w00000 ~ w09999) 組成，詞的出現頻率由高到低分布，
+# 固定長度讓 LIKE 的子字串比對與全文索引的詞比對結果相同；資料庫建立一次後會重複使用
+
+VOCABULARY = 10_000
+WORDS_PER_POST = 12
+
+
+def word(rng):
+    # 對數均勻分布: 編號越小的詞越常出現
+    return f"w{int(VOCABULARY ** rng.random()) - 1:05d}"
+
+
+def build(path, n_posts, per_teacher, seed = 1):
+    engine = make_engine("prod-write-heavy", url = f"sqlite:///{path}")
+    if inspect(engine).has_table("posts"):
+        with engine.connect() as conn:
+            if conn.scalar(select(func.count(Post.id))) == n_posts:
+                return engine
+    engine.dispose()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    engine = make_engine("prod-write-heavy", url = f"sqlite:///{path}")
+    ensure_schema(engine)
+    rng = random.Random(seed)
+    # posts 由 trigger 寫入全文索引
+    bulk_insert_tree(engine, Teacher.posts, (
+        (f"Teacher{y}", [(" ".join(word(rng) for _ in range(WORDS_PER_POST)),)
+                         for _ in range(min(per_teacher, n_posts - y * per_teacher))])
+        for y in range(-(-n_posts // per_teacher))
+    ))
+    return engine
+
+
+def like_count(session, term, *criteria):
+    return session.scalar(select(func.count(Post.id)).where(Post.content.like(f"%{term}%"), *criteria))
+
+
+def like_top(session, term, *criteria, limit = 20):
+    # LIKE 沒有相關性可以排序，只能取最新的幾筆
+    stmt = select(Post).where(Post.content.like(f"%{term}%"), *criteria).order_by(Post.id.desc()).limit(limit)
+    return session.scalars(stmt).all()
+
+
+def timed(fn, repeat):
+    start = perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (perf_counter() - start) / repeat, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "LIKE scans versus the FTS5 full-text index on posts")
+    parser.add_argument("--posts", type = int, default = 1_000_000)
+    parser.add_argument("--posts-per-teacher", type = int, default = 1_000)
+    parser.add_argument("--repeat", type = int, default = 3)
+    parser.add_argument("--data-dir", default = tempfile.gettempdir())
+    args = parser.parse_args()
+
+    path = os.path.join(args.data_dir, f"search_benchmark_{args.posts}_{args.posts_per_teacher}.db")
+    start = perf_counter()
+    engine = build(path, args.posts, args.posts_per_teacher)
+    print(f"{args.posts:,} posts ready in {perf_counter() - start:.1f}s")
+
+    session = Session(engine)
+    teacher_id = session.scalar(select(Teacher.id).order_by(Teacher.id).limit(1))
+    # 有 teacher_id 條件時分別測試先執行 MATCH 與由 SQLite 自行決定 (通常先走 teacher_id 的索引)
+    teacher = (Post.teacher_id == teacher_id,)
+    filters = [("", (), True), (f" teacher={teacher_id}", teacher, True),
+               (f" teacher={teacher_id} planner", teacher, False)]
+    print(f"{'query':<42}{'matches':>10}{'like':>12}{'fts':>12}{'speedup':>10}")
+    for term in ("w00000", "w00042", "w03141"):
+        for suffix, criteria, match_first in filters:
+            like_time, expected = timed(lambda: like_count(session, term, *criteria), args.repeat)
+            fts_time, count = timed(lambda: POST_SEARCH.count(session, term, *criteria, match_first = match_first),
+                                    args.repeat)
+            assert count == expected, (term, suffix)
+            print(f"{'count ' + term + suffix:<42}{count:>10,}{like_time * 1e3:>10.1f}ms"
+                  f"{fts_time * 1e3:>10.1f}ms{like_time / fts_time:>9.1f}x")
+
+            like_time, posts = timed(lambda: like_top(session, term, *criteria), args.repeat)
+            fts_time, rows = timed(lambda: POST_SEARCH.all(session, term, *criteria, match_first = match_first),
+                                   args.repeat)
+            assert len(rows) == len(posts) and all(term in row.Post.content for row in rows), (term, suffix)
+            print(f"{'top 20 ' + term + suffix:<42}{len(rows):>10,}{like_time * 1e3:>10.1f}ms"
+                  f"{fts_time * 1e3:>10.1f}ms{like_time / fts_time:>9.1f}x")
+    session.close()
@@ -1,11 +1,8 @@
-from sqlalchemy import (Column, ForeignKey, Integer, String, create_engine)
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker
-from models import engine
+from sqlalchemy import (Column, ForeignKey, Index, Integer, String, create_engine)
+from sqlalchemy.orm import relationship, sessionmaker
+from models import Base, engine, ensure_schema
 
 Session = sessionmaker(bind = engine)
-session = Session()
-
-Base = declarative_base()
 
 # class Node(Base):
 #     __tablename__ = "nodes"
@@ -19,7 +16,7 @@ Base = declarative_base()
 #     def __repr__(self):
 #         return f"<Node value={self.value}, next_node={self.next_node}>"
     
-# Base.metadata.create_all(engine)
+# ensure_schema()
 
 # node1 = Node(value = 1)
 # node2 = Node(value = 2)
@@ -38,6 +35,9 @@ Base = declarative_base()
 # 如果有循環引用，就必須建立一個 Associate Table
 class NodeAssociation(Base):
     __tablename__ = 'node_associations'
+    __table_args__ = (
+        Index('ix_node_associations_current_node_id_next_node_id', 'current_node_id', 'next_node_id'),
+    )
     id = Column(Integer, primary_key=True)
 
     current_node_id = Column(Integer, ForeignKey('nodes.id'))
@@ -56,19 +56,26 @@ class Node(Base):
 
     def __repr__(self):
         return f"<Node value={self.value}, next_node={self.next_node}>"
-    
-Base.metadata.create_all(engine)
 
-node1 = Node(value = 1)
-node2 = Node(value = 2)
-node3 = Node(value = 3)
 
-node1.next_node = node2
-node2.next_node = node3
+def main():
+    ensure_schema()
+    session = Session()
+
+    node1 = Node(value = 1)
+    node2 = Node(value = 2)
+    node3 = Node(value = 3)
+
+    node1.next_node = node2
+    node2.next_node = node3
+
+    session.add_all([node1, node2, node3])
+    session.commit()
+
+    print(node1)
+    print(node2)
+    print(node3)
 
-session.add_all([node1, node2, node3])
-session.commit()
 
-print(node1)
-print(node2)
-print(node3)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+import heapq
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import total_ordering
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, delete, event, func, insert, inspect, select
+from sqlalchemy.ext.horizontal_shard import ShardedSession, set_shard_id
+from sqlalchemy.orm import MANYTOONE, sessionmaker
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import BindParameter, BooleanClauseList, UnaryExpression
+from sqlalchemy.sql.selectable import AliasedReturnsRows
+
+from bulk_insert import BATCH_SIZE
+from models import Base, ensure_schema, make_engine
+from parallel import merge_results
+
+# 把 data.db 依實體的鍵分散到 N 個 SQLite 檔案 (shard)
+# - users、teachers、students 依主鍵的 hash 分配
+# - posts、sensitive_informations 依 teacher_id 分配，與所屬的 teacher 放在同一個 shard，teacher.posts 只需要查詢一個 shard
+# - 其他表格 (courses、fans 等) 不分片，只放在第一個 shard；student.courses 這類跨越分片與不分片表格的關係不支援
+# 例如:
+#   router = ShardRouter(shard_urls(4, "shards"))
+#   session = router.session()
+#   session.add(Teacher(name = "Zhen", posts = [Post(content = "...")]))   -> 寫入 teacher 所在的 shard
+#   session.get(User, 42)                                                  -> 只查詢一個 shard
+#   session.scalars(select(Post).where(Post.teacher_id == 7))              -> 只查詢 teacher 7 所在的 shard
+#   session.fan_out(select(User).where(User.age > 20), User.age.desc(), limit = 10)   -> 所有 shard 平行查詢後合併排序
+#   router.aggregate(select(UserStat.sex, func.sum(UserStat.count)).group_by(UserStat.sex), merge = "group")
+#
+# hash 使用 jump consistent hash: shard 數由 N 增加到 N + 1 時只有約 1 / (N + 1) 的資料需要搬移 (rebalance)
+# 主鍵由第一個 shard 上的 shard_sequences 分段配發 (hi/lo)，確保所有 shard 的主鍵不會重複
+
+# 表格名稱 -> 決定 shard 的欄位
+ROUTES = {
+    "users": "id",
+    "teachers": "id",
+    "students": "id",
+    "posts": "teacher_id",
+    "sensitive_informations": "teacher_id",
+}
+# 由 trigger 在每個 shard 上各自維護的表格，rebalance 時不需要搬移
+DERIVED = ("user_stats",)
+ID_BLOCK = 1000
+
+sequences = Table(
+    "shard_sequences", MetaData(),
+    Column("table_name", String, primary_key = True),
+    Column("next_id", Integer, nullable = False),
+)
+
+
+def jump_hash(key, buckets):
+    # Lamping & Veach, "A Fast, Minimal Memory, Consistent Hash Algorithm"
+    key &= 0xFFFFFFFFFFFFFFFF
+    bucket, jump = -1, 0
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_urls(n, directory = ".", name = "data"):
+    return {f"shard_{i}": f"sqlite:///{os.path.join(directory, f'{name}_shard_{i}.db')}" for i in range(n)}
+
+
+@total_ordering
+class _Desc:
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+def _order_keys(order_by):
+    # [(欄位, 是否為 desc)]，與 SQLite 相同，NULL 視為最小值
+    keys = []
+    for clause in order_by:
+        if isinstance(clause, UnaryExpression) and clause.modifier in (operators.desc_op, operators.asc_op):
+            keys.append((clause.element, clause.modifier is operators.desc_op))
+        else:
+            keys.append((clause, False))
+    return keys
+
+
+def _sort_key(descending):
+    def key(values):
+        return tuple(
+            _Desc((value is not None, value)) if desc else (value is not None, value)
+            for value, desc in zip(values, descending)
+        )
+    return key
+
+
+def _conjuncts(whereclause):
+    if whereclause is None:
+        return []
+    if isinstance(whereclause, BooleanClauseList) and whereclause.operator is operators.and_:
+        return list(whereclause.clauses)
+    return [whereclause]
+
+
+class ShardRouter:
+    def __init__(self, urls, profile = "prod-write-heavy", routes = ROUTES, id_block = ID_BLOCK):
+        self.urls = dict(urls)
+        self.shard_ids = list(self.urls)
+        self.default = self.shard_ids[0]
+        self.routes = routes
+        self.id_block = id_block
+        self.engines = {shard_id: make_engine(profile, url = url) for shard_id, url in self.urls.items()}
+        for engine in self.engines.values():
+            engine.echo = False
+        self._ids = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers = len(self.engines), thread_name_prefix = "shard")
+
+    def create_all(self):
+        for engine in self.engines.values():
+            ensure_schema(engine)
+        sequences.create(self.engines[self.default], checkfirst = True)
+
+    def dispose(self):
+        self._pool.shutdown()
+        for engine in self.engines.values():
+            engine.dispose()
+
+    def shard_for(self, key):
+        return self.shard_ids[jump_hash(int(key), len(self.shard_ids))]
+
+    def session(self, **kwargs):
+        return sessionmaker(class_ = RoutingSession, router = self, **kwargs)()
+
+    # 主鍵配發: 每次從 shard_sequences 取得一段 id_block 個 id，用完再取下一段
+    def next_id(self, table):
+        with self._lock:
+            block = self._ids.get(table.name)
+            if block is None or block[0] >= block[1]:
+                block = self._ids[table.name] = self._reserve(table)
+            block[0] += 1
+            return block[0] - 1
+
+    def _reserve(self, table):
+        with self.engines[self.default].begin() as conn:
+            stmt = (
+                sequences.update()
+                .where(sequences.c.table_name == table.name)
+                .values(next_id = sequences.c.next_id + self.id_block)
+                .returning(sequences.c.next_id)
+            )
+            end = conn.scalar(stmt)
+            if end is None:
+                # 第一次配發時從所有 shard 中最大的主鍵之後開始
+                start = max(self._max_id(table), 0) + 1
+                end = start + self.id_block
+                conn.execute(insert(sequences), {"table_name": table.name, "next_id": end})
+        return [end - self.id_block, end]
+
+    def _max_id(self, table):
+        pk = table.primary_key.columns[0]
+        stmt = select(func.max(pk))
+        return max((self._scalar(shard_id, stmt) or 0) for shard_id in self.shard_ids)
+
+    def _scalar(self, shard_id, stmt):
+        with self.engines[shard_id].connect() as conn:
+            return conn.scalar(stmt)
+
+    # 路由
+    def route_column(self, table):
+        key = self.routes.get(table.name)
+        return table.c[key] if key is not None else None
+
+    def shard_for_row(self, table, row):
+        # row 為 dict 或具有對應屬性的物件，分片欄位為空時改用主鍵
+        column = self.route_column(table)
+        if column is None:
+            return self.default
+        get = row.get if isinstance(row, dict) else lambda key: getattr(row, key, None)
+        key = get(column.key)
+        if key is None:
+            key = get(table.primary_key.columns[0].key)
+        return self.shard_for(key)
+
+    def shards_for(self, statement, params = None):
+        # 由 WHERE 最外層 AND 條件中「分片欄位 == 值」或「分片欄位 IN (...)」判斷需要查詢的 shard，否則查詢全部
+        # 值可以寫在 statement 中，或在執行時以 params 傳入 (例如 session.get)
+        params = params if isinstance(params, dict) else {}
+        shards = None
+        for clause in _conjuncts(getattr(statement, "whereclause", None)):
+            left, right = getattr(clause, "left", None), getattr(clause, "right", None)
+            if isinstance(left, BindParameter):
+                # relationship 的條件寫成 :param = posts.teacher_id
+                left, right = right, left
+            table = getattr(left, "table", None)
+            if not isinstance(right, BindParameter) or not isinstance(table, Table):
+                continue
+            column = self.route_column(table)
+            if column is None or left.key != column.key:
+                continue
+            value = params.get(right.key, right.effective_value)
+            if value is None or clause.operator not in (operators.eq, operators.in_op):
+                continue
+            values = value if clause.operator is operators.in_op else [value]
+            found = {self.shard_for(value) for value in values if value is not None}
+            shards = found if shards is None else shards & found
+        if shards is None:
+            # query.count() 等會把原本的查詢包成子查詢，條件在子查詢中
+            froms = statement.get_final_froms() if hasattr(statement, "get_final_froms") else []
+            if len(froms) == 1 and isinstance(froms[0], AliasedReturnsRows):
+                inner = froms[0]
+                while isinstance(inner, AliasedReturnsRows):
+                    inner = inner.element
+                return self.shards_for(inner, params)
+            return self.shard_ids
+        # 條件互斥時沒有任何資料，仍然查詢一個 shard 以取得空的結果
+        return [shard_id for shard_id in self.shard_ids if shard_id in shards] or [self.default]
+
+    # 平行查詢
+    def _scatter(self, statement, order_by = (), limit = None, offset = 0):
+        # 回傳 [(shard_id, 資料列, 排序鍵)]，已依 order_by 合併排序並套用 limit / offset
+        keys = _order_keys(order_by)
+        width = len(statement.selected_columns)
+        stmt = statement.add_columns(*[column for column, _ in keys]).order_by(*order_by)
+        if limit is not None:
+            # 每個 shard 最多只需要回傳前 offset + limit 筆
+            stmt = stmt.limit(offset + limit)
+
+        def run(shard_id):
+            with self.engines[shard_id].connect() as conn:
+                return [(shard_id, tuple(row[:width]), tuple(row[width:])) for row in conn.execute(stmt)]
+
+        parts = list(self._pool.map(run, self.shards_for(statement)))
+        if keys:
+            key = _sort_key([desc for _, desc in keys])
+            rows = heapq.merge(*parts, key = lambda part: key(part[2]))
+        else:
+            rows = (row for part in parts for row in part)
+        rows = list(rows)
+        return rows[offset:] if limit is None else rows[offset:offset + limit]
+
+    def select(self, statement, *order_by, limit = None, offset = 0):
+        # 欄位查詢 (例如 select(User.id, User.name))，回傳 tuple 串列
+        return [row for _, row, _ in self._scatter(statement, order_by, limit, offset)]
+
+    def aggregate(self, statement, merge = "sum", keys = 1):
+        # 每個 shard 各自彙總，再以 parallel.merge_results 合併 (sum 或 group)
+        # 空的 shard 的 SUM 為 NULL、group by 的鍵也可能是 NULL，merge_results 與 SQL 相同略過 NULL 相加，NULL 鍵排在最後
+        def run(shard_id):
+            with self.engines[shard_id].connect() as conn:
+                return [tuple(row) for row in conn.execute(statement)]
+
+        return merge_results(list(self._pool.map(run, self.shards_for(statement))), merge, keys)
+
+
+class RoutingSession(ShardedSession):
+    def __init__(self, router, **kwargs):
+        super().__init__(
+            shards = router.engines,
+            shard_chooser = self._shard_chooser,
+            identity_chooser = self._identity_chooser,
+            execute_chooser = self._execute_chooser,
+            **kwargs,
+        )
+        self.router = router
+        event.listen(self, "before_flush", self._assign_ids)
+
+    def _assign_ids(self, session, flush_context, instances):
+        # 新增的分片資料先配發主鍵，shard_chooser 才能依主鍵 (或 parent 的主鍵) 決定 shard
+        for obj in session.new:
+            table = inspect(obj).mapper.local_table
+            pk = table.primary_key.columns[0]
+            if table.name in self.router.routes and getattr(obj, pk.key) is None:
+                setattr(obj, pk.key, self.router.next_id(table))
+
+    def _shard_chooser(self, mapper, instance, **kwargs):
+        if instance is None:
+            return self.router.default
+        state = inspect(instance)
+        if state.identity_token is not None:
+            return state.identity_token
+        table = mapper.local_table
+        column = self.router.route_column(table)
+        if column is not None and not column.primary_key and getattr(instance, column.key) is None:
+            # 外鍵要到 flush 時才會同步，先從關係上的 parent 取得
+            for prop in mapper.relationships:
+                if prop.direction is MANYTOONE and column in prop.local_columns:
+                    parent = getattr(instance, prop.key)
+                    if parent is not None:
+                        return self._shard_chooser(inspect(parent).mapper, parent)
+        return self.router.shard_for_row(table, instance)
+
+    def _identity_chooser(self, mapper, primary_key, *, lazy_loaded_from, **kwargs):
+        if lazy_loaded_from is not None and lazy_loaded_from.identity_token is not None:
+            return [lazy_loaded_from.identity_token]
+        column = self.router.route_column(mapper.local_table)
+        if column is not None and column.primary_key:
+            return [self.router.shard_for(primary_key[0])]
+        if column is None:
+            return [self.router.default]
+        # 依 parent 分配的表格無法只由主鍵判斷 shard
+        return self.router.shard_ids
+
+    def _execute_chooser(self, context):
+        if context.is_insert:
+            raise ValueError("use session.add() or ShardRouter.engines[shard_id] for inserts on a sharded session")
+        mapper = context.bind_mapper
+        if mapper is not None and self.router.route_column(mapper.local_table) is None:
+            return [self.router.default]
+        return self.router.shards_for(context.statement, context.parameters)
+
+    def fan_out(self, statement, *order_by, limit = None, offset = 0):
+        # select(Model) 以 ORDER BY / LIMIT 跨 shard 查詢:
+        # 先平行查詢每個 shard 的主鍵與排序鍵並合併，再到各自的 shard 以主鍵載入最後留下的物件
+        mapper = statement.column_descriptions[0]["entity"].__mapper__
+        pk = mapper.primary_key[0]
+        keys = self.router._scatter(statement.with_only_columns(pk), order_by, limit, offset)
+        by_shard = defaultdict(list)
+        for shard_id, (id,), _ in keys:
+            by_shard[shard_id].append(id)
+        loaded = {}
+        for shard_id, ids in by_shard.items():
+            stmt = select(mapper).where(pk.in_(ids)).options(set_shard_id(shard_id))
+            loaded.update(((shard_id, getattr(obj, pk.key)), obj) for obj in self.scalars(stmt))
+        return [loaded[(shard_id, id)] for shard_id, (id,), _ in keys]
+
+
+def rebalance(source, target, batch_size = BATCH_SIZE, metadata = None):
+    # 把 source (ShardRouter) 中的資料依 target 的 shard 數重新分配，例如:
+    #   rebalance(ShardRouter({"main": DATABASE_URL}), ShardRouter(shard_urls(4)))     -> 把 data.db 拆成 4 個 shard
+    #   rebalance(ShardRouter(shard_urls(4)), ShardRouter(shard_urls(8)))              -> 4 個 shard 擴充為 8 個
+    # 同時屬於 source 與 target 的 shard 中，需要搬移的資料寫入新的 shard 後從原本的 shard 刪除；
+    # 不屬於 target 的 source (例如 data.db) 只複製不刪除
+    # 寫入使用 INSERT OR IGNORE，中斷後可以直接重新執行
+    # metadata 預設為 Base.metadata，只會處理已經 import 的模型 (例如先呼叫 cli.import_models())
+    metadata = metadata if metadata is not None else Base.metadata
+    target.create_all()
+    target_urls = {url: shard_id for shard_id, url in target.urls.items()}
+    moved = defaultdict(int)
+    for source_id, source_url in source.urls.items():
+        current = target_urls.get(source_url)
+        engine = source.engines[source_id]
+        existing = set(inspect(engine).get_table_names())
+        for table in metadata.sorted_tables:
+            if table.name in DERIVED or table.name not in existing:
+                continue
+            routed = table.name in target.routes
+            if not routed and (current is not None or source_url == target.urls[target.default]):
+                continue
+            pk = table.primary_key.columns[0]
+            last = None
+            while True:
+                stmt = select(table).order_by(pk).limit(batch_size)
+                if last is not None:
+                    stmt = stmt.where(pk > last)
+                with engine.connect() as conn:
+                    rows = [row._asdict() for row in conn.execute(stmt)]
+                if not rows:
+                    break
+                last = rows[-1][pk.key]
+                groups = defaultdict(list)
+                for row in rows:
+                    shard_id = target.shard_for_row(table, row) if routed else target.default
+                    if shard_id != current:
+                        groups[shard_id].append(row)
+                for shard_id, group in groups.items():
+                    with target.engines[shard_id].begin() as conn:
+                        conn.execute(insert(table).prefix_with("OR IGNORE"), group)
+                    moved[table.name] += len(group)
+                if current is not None and groups:
+                    ids = [row[pk.key] for group in groups.values() for row in group]
+                    with engine.begin() as conn:
+                        conn.execute(delete(table).where(pk.in_(ids)))
+    return dict(moved)
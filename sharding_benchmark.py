@@ -0,0 +1,123 @@
+import argparse
+import glob
+import os
+import random
+import tempfile
+import threading
+from time import perf_counter
+
+from sqlalchemy import func, select
+
+from bulk_insert import bulk_insert, bulk_insert_tree
+from lazy_loading import Post, Teacher
+from models import User, ensure_schema, make_engine
+from sharding import ShardRouter, rebalance, shard_urls
+
+# 以 1 / 4 / 16 個 shard 比較:
+# - rebalance: 把單一資料庫拆成 N 個 shard 的時間
+# - writes:    多個執行緒同時以 RoutingSession 新增 user (每筆一個交易)，不同 shard 的寫入不會互相等待 SQLite 的寫入鎖
+# - get:       session.get(User, id) 只查詢一個 shard
+# - posts:     teacher.posts 與 teacher 在同一個 shard
+# - fan_out:   依年齡排序取前 20 筆，所有 shard 平行查詢後合併
+# - scan:      依名稱前綴計數 (全表掃描)，各 shard 平行掃描後相加
+
+SEXES = ("male", "female")
+
+
+def remove(pattern):
+    for path in glob.glob(pattern):
+        os.remove(path)
+
+
+def build_source(path, n_users, n_teachers, posts_per_teacher):
+    remove(path + "*")
+    engine = make_engine("prod-write-heavy", url = f"sqlite:///{path}")
+    ensure_schema(engine)
+    bulk_insert(engine, User, ((f"User{x}", 18 + x % 60, SEXES[x % 2]) for x in range(n_users)))
+    bulk_insert_tree(engine, Teacher.posts, (
+        (f"Teacher{x}", [(f"Post {x}-{y}",) for y in range(posts_per_teacher)]) for x in range(n_teachers)
+    ))
+    engine.dispose()
+
+
+def concurrent_writes(router, threads, per_thread):
+    def write(offset):
+        session = router.session()
+        for x in range(per_thread):
+            session.add(User(name = f"New{offset}-{x}", age = 18 + x % 60, sex = SEXES[x % 2]))
+            session.commit()
+        session.close()
+
+    workers = [threading.Thread(target = write, args = (n,)) for n in range(threads)]
+    start = perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return threads * per_thread / (perf_counter() - start)
+
+
+def timed(fn, repeat):
+    start = perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (perf_counter() - start) / repeat
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Scale-out of the sharded session across 1/4/16 SQLite files")
+    parser.add_argument("--users", type = int, default = 200_000)
+    parser.add_argument("--teachers", type = int, default = 2_000)
+    parser.add_argument("--posts", type = int, default = 10, help = "posts per teacher")
+    parser.add_argument("--shards", type = int, nargs = "+", default = [1, 4, 16])
+    parser.add_argument("--threads", type = int, default = 8)
+    parser.add_argument("--writes", type = int, default = 200, help = "writes per thread")
+    parser.add_argument("--data-dir", default = tempfile.gettempdir())
+    args = parser.parse_args()
+
+    source_path = os.path.join(args.data_dir, "sharding_benchmark_source.db")
+    build_source(source_path, args.users, args.teachers, args.posts)
+    source = ShardRouter({"source": f"sqlite:///{source_path}"})
+    rng = random.Random(1)
+    ids = [rng.randint(1, args.users) for _ in range(1000)]
+    teacher_ids = [rng.randint(1, args.teachers) for _ in range(200)]
+
+    print(f"{'shards':>6}{'rebalance':>11}{'writes/s':>10}{'get':>10}{'posts':>10}{'fan_out':>10}{'scan':>10}")
+    for n in args.shards:
+        name = f"sharding_benchmark_{n}"
+        remove(os.path.join(args.data_dir, f"{name}_shard_*"))
+        router = ShardRouter(shard_urls(n, args.data_dir, name))
+        start = perf_counter()
+        rebalance(source, router)
+        rebalance_time = perf_counter() - start
+
+        writes = concurrent_writes(router, args.threads, args.writes)
+
+        session = router.session()
+        start = perf_counter()
+        for id in ids:
+            session.get(User, id)
+        get_time = (perf_counter() - start) / len(ids)
+        session.close()
+
+        session = router.session()
+        teachers = [session.get(Teacher, id) for id in teacher_ids]
+        start = perf_counter()
+        for teacher in teachers:
+            teacher.posts.all()
+        posts_time = (perf_counter() - start) / len(teachers)
+        session.close()
+
+        session = router.session()
+        fan_out_time = timed(lambda: session.fan_out(select(User).where(User.sex == "male"), User.age.desc(), User.id,
+                                                      limit = 20), 5)
+        session.close()
+        scan = select(func.count(User.id)).where(User.name.like("User1%"))
+        scan_time = timed(lambda: router.aggregate(scan), 5)
+        total = router.aggregate(select(func.count(Post.id)))[0]
+        assert total == args.teachers * args.posts, total
+
+        print(f"{n:>6}{rebalance_time:>10.2f}s{writes:>10,.0f}{get_time * 1000:>8.2f}ms{posts_time * 1000:>8.2f}ms"
+              f"{fan_out_time * 1000:>8.1f}ms{scan_time * 1000:>8.1f}ms")
+        router.dispose()
+    source.dispose()
@@ -0,0 +1,72 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+# 在全新的 Python 行程中 import 範例模組，量測 import 時間以及 import 期間執行的 SQL 數量
+# import 模組時不應該執行任何 SQL，只要有任何一個模組執行了 SQL 就視為失敗 (exit code 1)
+# 為了在失敗時也不會修改專案中的 data.db，會先把它複製到暫存目錄，並在那裡執行
+
+MODULES = [
+    "models",
+    "one_on_one_relationship",
+    "follow",
+    "relationships",
+    "self_relationship",
+    "many_to_many_relationship",
+    "lazy_loading",
+    "deferred_loading",
+]
+
+PROBE = """
+import json, sys
+from time import perf_counter
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+statements = []
+event.listen(Engine, "before_cursor_execute",
+             lambda conn, cursor, statement, parameters, context, executemany: statements.append(statement))
+start = perf_counter()
+for name in sys.argv[1:]:
+    __import__(name)
+elapsed = perf_counter() - start
+schema = [s for s in statements if s.lstrip().upper().startswith(("CREATE", "PRAGMA", "ALTER", "DROP"))]
+print(json.dumps({"seconds": elapsed, "statements": len(statements), "schema": len(schema)}))
+"""
+
+
+def measure(modules, workdir, repeat):
+    env = dict(os.environ, PYTHONPATH = os.path.dirname(os.path.abspath(__file__)))
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE, *modules],
+            cwd = workdir, env = env, capture_output = True, text = True, check = True,
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return min(runs, key = lambda run: run["seconds"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Measure import time and SQL executed while importing the models")
+    parser.add_argument("--repeat", type = int, default = 5)
+    parser.add_argument("--modules", nargs = "+", default = MODULES)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)), "data.db"), workdir)
+    failed = []
+    for name in [*args.modules, None]:
+        result = measure([name] if name else args.modules, workdir, args.repeat)
+        label = name or "(all)"
+        print(f"{label:<28} {result['seconds'] * 1000:8.1f} ms  statements={result['statements']:<4} schema={result['schema']}")
+        if result["statements"]:
+            failed.append(label)
+    shutil.rmtree(workdir)
+    if failed:
+        print(f"FAILED: importing {', '.join(failed)} executed SQL")
+        raise SystemExit(1)
@@ -0,0 +1,40 @@
+from itertools import islice
+
+from sqlalchemy import select
+from sqlalchemy.orm import Query
+
+# .all() 會把整個結果和 identity map 一次放進記憶體
+# stream() 改用 yield_per 分批讀取，每處理完一批就把物件從 session 中移除 (expunge)，
+# 因此不論表格有多大，記憶體用量都只跟 chunk_size 有關
+# identity map 本身只保留弱參照，若呼叫端不會保留物件，可以設定 expunge = False 省下 expunge 的成本
+
+CHUNK_SIZE = 1000
+
+
+def stream(session, query, chunk_size = CHUNK_SIZE, expunge = True):
+    # query 可以是 session.query(User)... 或 select(User)...
+    # 例如: for user in stream(session, session.query(User).filter(User.age >= 30)):
+    if isinstance(query, Query):
+        rows = iter(query.yield_per(chunk_size))
+        chunks = iter(lambda: list(islice(rows, chunk_size)), [])
+    else:
+        result = session.execute(query.execution_options(yield_per = chunk_size))
+        chunks = result.scalars().partitions()
+
+    for chunk in chunks:
+        yield from chunk
+        if not expunge:
+            continue
+        for obj in chunk:
+            if obj in session:
+                session.expunge(obj)
+
+
+def stream_columns(session, *columns, where = (), order_by = None, chunk_size = CHUNK_SIZE):
+    # 只查詢欄位時不會建立 ORM 物件，例如 stream_columns(session, User.name, User.age)
+    stmt = select(*columns).where(*where)
+    if order_by is not None:
+        stmt = stmt.order_by(order_by)
+    result = session.execute(stmt.execution_options(yield_per = chunk_size))
+    for chunk in result.partitions():
+        yield from chunk
@@ -0,0 +1,79 @@
+import argparse
+import os
+import resource
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from time import perf_counter
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from bulk_insert import bulk_insert
+from models import User
+from streaming import stream, stream_columns
+
+# 比較 .all() 與 stream() / stream_columns() 讀取大量 users 時的記憶體峰值
+# stream 系列的峰值增加量必須小於 --ceiling-mb，否則視為失敗
+
+MODES = ["all", "stream", "stream_columns"]
+
+
+def build_dataset(path, n_rows):
+    engine = create_engine(f"sqlite:///{path}")
+    User.metadata.create_all(engine)
+    with engine.connect() as conn:
+        existing = conn.scalar(select(func.count()).select_from(User))
+    if existing < n_rows:
+        sexes = ("male", "female")
+        bulk_insert(engine, User, ((f"User{x}", 18 + x % 60, sexes[x % 2]) for x in range(existing, n_rows)))
+    engine.dispose()
+
+
+def run_mode(path, n_rows, mode):
+    engine = create_engine(f"sqlite:///{path}")
+    session = sessionmaker(bind = engine)()
+    query = session.query(User).filter(User.id <= n_rows)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = perf_counter()
+    total_age = 0
+    if mode == "all":
+        for user in query.all():
+            total_age += user.age
+    elif mode == "stream":
+        for user in stream(session, query):
+            total_age += user.age
+    else:
+        for name, age in stream_columns(session, User.name, User.age, where = [User.id <= n_rows]):
+            total_age += age
+    elapsed = perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    session.close()
+    engine.dispose()
+    return elapsed, (peak - baseline) / 1024, total_age
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Measure peak memory of streaming queries over users")
+    parser.add_argument("--rows", type = int, default = 5_000_000)
+    parser.add_argument("--modes", nargs = "+", choices = MODES, default = MODES)
+    parser.add_argument("--ceiling-mb", type = float, default = 64.0,
+                        help = "maximum allowed peak RSS growth for the streaming modes")
+    parser.add_argument("--data-dir", default = tempfile.gettempdir())
+    args = parser.parse_args()
+
+    path = os.path.join(args.data_dir, "streaming_benchmark.db")
+    build_dataset(path, args.rows)
+
+    failed = False
+    ctx = get_context("spawn")
+    for mode in args.modes:
+        with ProcessPoolExecutor(max_workers = 1, mp_context = ctx) as pool:
+            elapsed, growth_mb, _ = pool.submit(run_mode, path, args.rows, mode).result()
+        status = ""
+        if mode != "all":
+            ok = growth_mb <= args.ceiling_mb
+            failed = failed or not ok
+            status = "OK" if ok else f"FAILED (ceiling {args.ceiling_mb} MB)"
+        print(f"{mode:<15} {args.rows} rows in {elapsed:.3f}s, peak RSS +{growth_mb:.1f} MB {status}")
+    raise SystemExit(1 if failed else 0)
@@ -0,0 +1,60 @@
+from sqlalchemy import func, select
+
+from models import USER_STATS_REBUILD, User, UserStat, engine
+
+# 依性別、年齡範圍統計 users 的報表
+# 直接對 users 做 GROUP BY 需要掃過整張表，資料量越大越慢；
+# 這裡改從 user_stats 彙總，user_stats 由 trigger 維護，每個 (sex, age) 只有一筆，查詢時間與 users 的筆數無關
+# 例如:
+#   count_by_sex(session)                -> [("female", 500), ("male", 500)]
+#   count_by_sex_between(session, 20, 30) -> 年齡介於 20 與 30 之間 (不含) 的人數
+#   count_by_age_range(session, 10)       -> [(10, "female", 12), (10, "male", 8), (20, ...), ...]
+
+
+def count_by_sex(session):
+    stmt = select(UserStat.sex, func.sum(UserStat.count)).group_by(UserStat.sex).order_by(UserStat.sex)
+    return session.execute(stmt).all()
+
+
+def count_by_sex_between(session, low, high):
+    stmt = (
+        select(UserStat.sex, func.sum(UserStat.count))
+        .where(UserStat.age > low, UserStat.age < high)
+        .group_by(UserStat.sex)
+        .order_by(UserStat.sex)
+    )
+    return session.execute(stmt).all()
+
+
+def count_by_age_range(session, size = 10):
+    # 以 size 歲為一組，回傳 (該組的起始年齡, sex, 人數)
+    start = (UserStat.age // size) * size
+    stmt = (
+        select(start, UserStat.sex, func.sum(UserStat.count))
+        .group_by(start, UserStat.sex)
+        .order_by(start, UserStat.sex)
+    )
+    return session.execute(stmt).all()
+
+
+# 以下直接掃描 users，用來驗證或在 user_stats 尚未建立時使用
+def scan_count_by_sex(session):
+    stmt = select(User.sex, func.count(User.id)).group_by(User.sex).order_by(User.sex)
+    return session.execute(stmt).all()
+
+
+def scan_count_by_sex_between(session, low, high):
+    stmt = (
+        select(User.sex, func.count(User.id))
+        .where(User.age > low, User.age < high)
+        .group_by(User.sex)
+        .order_by(User.sex)
+    )
+    return session.execute(stmt).all()
+
+
+def rebuild(bind = None):
+    # 在 trigger 之外直接修改過 users (例如關閉 trigger 匯入資料) 後，以 users 的內容重建 user_stats
+    with (bind if bind is not None else engine).begin() as conn:
+        for statement in USER_STATS_REBUILD:
+            conn.exec_driver_sql(statement)
@@ -0,0 +1,83 @@
+import argparse
+import os
+import random
+import tempfile
+from time import perf_counter
+
+from sqlalchemy.orm import sessionmaker
+
+from bulk_insert import bulk_insert
+from models import User, ensure_schema, make_engine
+from user_reports import count_by_sex, count_by_sex_between, scan_count_by_sex, scan_count_by_sex_between
+
+# 比較直接掃描 users 的 GROUP BY 與從 user_stats 彙總的查詢時間
+# 先以 bulk_insert 匯入 users，再由 ensure_schema 建立 user_stats 與 trigger (一次 GROUP BY 回填)，
+# 最後量測經過 trigger 後單筆寫入的額外成本
+
+SEXES = ("male", "female")
+
+
+def build(path, n_users):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    engine = make_engine("prod-read-heavy", url = f"sqlite:///{path}")
+    engine.echo = False
+    User.__table__.create(engine)
+    bulk_insert(engine, User, ((f"User{x}", 18 + x % 60, SEXES[x % 2]) for x in range(n_users)))
+    start = perf_counter()
+    ensure_schema(engine)
+    return engine, perf_counter() - start
+
+
+def timed(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        result = func()
+        best = min(best, perf_counter() - start)
+    return best, result
+
+
+def insert_rate(Session, n):
+    session = Session()
+    start = perf_counter()
+    for x in range(n):
+        session.add(User(name = f"New{x}", age = random.randint(18, 77), sex = random.choice(SEXES)))
+        session.commit()
+    elapsed = perf_counter() - start
+    session.close()
+    return elapsed / n
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Compare full-scan aggregates with the trigger-maintained user_stats table")
+    parser.add_argument("--sizes", type = int, nargs = "+", default = [100_000, 1_000_000, 10_000_000])
+    parser.add_argument("--repeat", type = int, default = 5)
+    parser.add_argument("--writes", type = int, default = 200)
+    parser.add_argument("--data-dir", default = tempfile.gettempdir())
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        # ensure_schema 在同一個行程中會記住已確認過的資料庫，所以每個大小使用不同的檔案
+        engine, backfill = build(os.path.join(args.data_dir, f"user_reports_benchmark_{size}.db"), size)
+        Session = sessionmaker(bind = engine)
+        session = Session()
+        print(f"{size:>11,} users  backfill {backfill:.2f}s")
+        cases = [
+            ("count_by_sex", lambda: scan_count_by_sex(session), lambda: count_by_sex(session)),
+            ("count_by_sex_between", lambda: scan_count_by_sex_between(session, 20, 30),
+             lambda: count_by_sex_between(session, 20, 30)),
+        ]
+        for label, scan, summary in cases:
+            scan_time, expected = timed(scan, args.repeat)
+            summary_time, result = timed(summary, args.repeat)
+            assert [tuple(row) for row in result] == [tuple(row) for row in expected], (result, expected)
+            print(f"  {label:<22} scan {scan_time * 1000:9.2f} ms   user_stats {summary_time * 1000:7.3f} ms")
+        session.close()
+
+        per_write = insert_rate(Session, args.writes)
+        print(f"  insert + commit with trigger {per_write * 1e6:8.1f} µs/row")
+        with Session() as session:
+            assert count_by_sex(session) == scan_count_by_sex(session)
+        engine.dispose()
@@ -0,0 +1,197 @@
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from itertools import groupby
+from time import monotonic
+
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# SQLite 同時只能有一個寫入者，每個請求各自 session.add_all() + commit() 時，
+# 併發下容易出現 database is locked，而且每個小交易都要一次 fsync
+# WriteQueue 讓所有寫入都交給同一個 writer 執行緒: 從佇列取出等待中的寫入，合併成一個交易後一次 commit (group commit)
+# - 一批最多 max_batch 筆；max_delay 預設為 0，不額外等待，上一次 commit 期間累積的寫入自然成為下一批
+#   寫入量低時可以設定 max_delay (秒) 換取更大的批次，延遲仍有上限
+# - 佇列滿了 (max_pending) 時 submit 會阻塞，形成 backpressure
+# - 每筆寫入都會回傳一個 Future，可以取得結果或例外
+# 例如:
+#   insert_user = insert(User)
+#   with WriteQueue(engine) as writes:
+#       future = writes.execute(insert_user, {"name": "John Doe", "age": 30, "sex": "male"})
+#       user, = writes.add_all([User(name = "Iron Man", age = 57, sex = "male")]).result()
+#
+# 同一批中連續且為同一個 statement 物件的寫入會合併成一次 executemany (因此請重複使用同一個 statement)；
+# 整批失敗時會回滾，再逐筆以 SAVEPOINT 重試，只有真正出錯的那一筆會收到例外
+
+MAX_BATCH = 1000
+MAX_DELAY = 0.0
+MAX_PENDING = 10_000
+
+_STOP = object()
+
+
+class _Write:
+    __slots__ = ("statement", "params", "objects", "future")
+
+    def __init__(self, statement = None, params = None, objects = None):
+        self.statement = statement
+        self.params = params
+        self.objects = objects
+        self.future = Future()
+
+    def apply(self, session):
+        if self.objects is not None:
+            session.add_all(self.objects)
+            session.flush()
+            return self.objects
+        return session.execute(self.statement, self.params)
+
+
+class WriteQueue:
+    def __init__(self, engine, max_batch = MAX_BATCH, max_delay = MAX_DELAY, max_pending = MAX_PENDING):
+        self.engine = engine
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue = queue.Queue(maxsize = max_pending)
+        self.batches = 0
+        self.writes = 0
+        self._thread = None
+        self._stopping = False
+        # stop() 放入 _STOP 之後不能再有寫入排在它後面，否則它們的 Future 永遠不會完成
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._stopping = False
+        self._thread = threading.Thread(target = self._run, name = "write-queue", daemon = True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        # 處理完佇列中所有的寫入後才結束
+        with self._lock:
+            self._stopping = True
+            self.queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+        # writer 執行緒意外結束時，佇列中剩下的寫入以例外結束
+        self._fail_pending(RuntimeError("WriteQueue stopped before the write was applied"))
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _submit(self, write, timeout):
+        with self._lock:
+            if self._thread is None or self._stopping:
+                raise RuntimeError("WriteQueue is not running, call start() first")
+            # 佇列已滿時阻塞，超過 timeout 會拋出 queue.Full
+            self.queue.put(write, timeout = timeout)
+        return write.future
+
+    def _fail_pending(self, error):
+        while True:
+            try:
+                write = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            if write is not _STOP and write.future.set_running_or_notify_cancel():
+                write.future.set_exception(error)
+
+    def execute(self, statement, params = None, timeout = None):
+        # Core 的 insert / update / delete，Future 的結果為 CursorResult
+        return self._submit(_Write(statement = statement, params = params), timeout)
+
+    def add_all(self, objects, timeout = None):
+        # ORM 物件，Future 的結果為寫入後 (已有主鍵、已從 session 移除) 的物件串列
+        # 在 Future 完成之前不要存取或修改這些物件
+        return self._submit(_Write(objects = list(objects)), timeout)
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - monotonic()
+            try:
+                write = self.queue.get(timeout = remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(write)
+            if write is _STOP:
+                break
+        return batch
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = self._collect(self.queue.get())
+            if batch[-1] is _STOP:
+                batch.pop()
+                stopping = True
+            # 已經被取消的 Future 不再寫入；其餘的標記為執行中，之後就不能被取消
+            batch = [write for write in batch if write.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                self._commit(batch)
+            except Exception as e:
+                # writer 執行緒不能因為一批寫入而結束，否則之後所有的 Future 都不會完成
+                logger.exception("write queue batch failed")
+                for write in batch:
+                    if not write.future.done():
+                        write.future.set_exception(e)
+
+    def _commit(self, batch):
+        session = Session(bind = self.engine, expire_on_commit = False)
+        try:
+            results = self._apply_grouped(session, batch)
+            session.commit()
+        except Exception:
+            session.rollback()
+            results = self._apply_each(session, batch)
+            try:
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                results = [e] * len(batch)
+        session.expunge_all()
+        session.close()
+        self.batches += 1
+        self.writes += len(batch)
+        for write, result in zip(batch, results):
+            if isinstance(result, Exception):
+                write.future.set_exception(result)
+            else:
+                write.future.set_result(result)
+
+    def _apply_grouped(self, session, batch):
+        # 連續的 ORM 寫入只 flush 一次；連續且相同、參數為單一 dict 的 statement 合併成 executemany
+        results = []
+        for statement, group in groupby(batch, key = lambda write: write.statement):
+            group = list(group)
+            if statement is None:
+                for write in group:
+                    session.add_all(write.objects)
+                session.flush()
+                results.extend(write.objects for write in group)
+                continue
+            if len(group) == 1 or not all(isinstance(write.params, dict) for write in group):
+                results.extend(write.apply(session) for write in group)
+                continue
+            result = session.execute(statement, [write.params for write in group])
+            results.extend([result] * len(group))
+        return results
+
+    def _apply_each(self, session, batch):
+        results = []
+        for write in batch:
+            try:
+                with session.begin_nested():
+                    results.append(write.apply(session))
+            except Exception as e:
+                logger.debug("write failed: %s", e)
+                results.append(e)
+        return results
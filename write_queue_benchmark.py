@@ -0,0 +1,89 @@
+import argparse
+import os
+import tempfile
+import threading
+from time import perf_counter
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from models import PROFILES, User, ensure_schema, make_engine
+from write_queue import WriteQueue
+
+# 以 1 / 8 / 64 個執行緒同時寫入 users，比較:
+# - commit:   每個執行緒各自 session.add() + commit()，每筆一個交易
+# - queue:    WriteQueue.add_all()，等待 Future 完成後才送出下一筆
+# - queue-core: WriteQueue.execute(INSERT_USER, {...})，同一批合併成 executemany
+
+INSERT_USER = insert(User)
+
+
+def build(path, profile):
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    engine = make_engine(profile, url = f"sqlite:///{path}")
+    engine.echo = False
+    ensure_schema(engine)
+    return engine
+
+
+def produce(mode, engine, writes, start, count, latencies, errors):
+    Session = sessionmaker(bind = engine)
+    elapsed = 0.0
+    for x in range(start, start + count):
+        begin = perf_counter()
+        try:
+            if mode == "commit":
+                with Session() as session:
+                    session.add(User(name = f"User{x}", age = x % 100, sex = "male" if x % 2 else "female"))
+                    session.commit()
+            elif mode == "queue":
+                writes.add_all([User(name = f"User{x}", age = x % 100, sex = "male" if x % 2 else "female")]).result()
+            else:
+                writes.execute(INSERT_USER, {"name": f"User{x}", "age": x % 100,
+                                             "sex": "male" if x % 2 else "female"}).result()
+        except Exception:
+            errors.append(x)
+        elapsed += perf_counter() - begin
+    latencies.append(elapsed / count)
+
+
+def run(mode, engine, producers, total):
+    writes = WriteQueue(engine).start() if mode != "commit" else None
+    per_producer = total // producers
+    latencies, errors = [], []
+    threads = [
+        threading.Thread(target = produce, args = (mode, engine, writes, n * per_producer, per_producer, latencies, errors))
+        for n in range(producers)
+    ]
+    start = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = perf_counter() - start
+    if writes is not None:
+        writes.stop()
+    with engine.connect() as conn:
+        written = conn.scalar(select(func.count(User.id)))
+    batches = writes.batches if writes is not None else written
+    return written, len(errors), elapsed, sum(latencies) / len(latencies), batches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Compare per-request commits with the group-commit write queue")
+    parser.add_argument("--writes", type = int, default = 6400)
+    parser.add_argument("--producers", type = int, nargs = "+", default = [1, 8, 64])
+    parser.add_argument("--profile", choices = sorted(PROFILES), default = "prod-write-heavy")
+    parser.add_argument("--data-dir", default = tempfile.gettempdir())
+    args = parser.parse_args()
+
+    print(f"{'mode':<11}{'producers':>10}{'writes/s':>12}{'latency':>12}{'commits':>10}{'errors':>8}")
+    for producers in args.producers:
+        for mode in ("commit", "queue", "queue-core"):
+            path = os.path.join(args.data_dir, f"write_queue_benchmark_{mode}_{producers}.db")
+            engine = build(path, args.profile)
+            written, errors, elapsed, latency, commits = run(mode, engine, producers, args.writes)
+            engine.dispose()
+            print(f"{mode:<11}{producers:>10}{written / elapsed:>12,.0f}{latency * 1000:>10.2f}ms{commits:>10,}{errors:>8}")